@@ -0,0 +1,225 @@
+"""Document loading benchmark: legacy string-building loaders vs streaming chunking.
+
+Generates a large synthetic PDF and DOCX, then loads each in a fresh interpreter
+per mode and reports wall time and peak RSS:
+
+- legacy:    the previous loaders (`full_text += ...`, then slice the whole string)
+- streaming: `iter_file_chunks`, consumed one chunk at a time
+
+Both modes must produce the same chunks; the run fails if they don't.
+
+    python -m benchmarks.chunking
+    python -m benchmarks.chunking --pages 2000 --paragraphs 200000 --json chunking.json
+"""
+
+import argparse
+import hashlib
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from collections.abc import Iterator
+from pathlib import Path
+
+from src.rag.loader import iter_file_chunks
+
+ROOT = Path(__file__).resolve().parent.parent
+MODES = ("legacy", "streaming")
+
+_WORDS = (
+    "project budget approval deadline invoice schedule meeting vendor contract review "
+    "policy expense report travel equipment safety training handbook procedure"
+).split()
+
+
+def _lines(count: int, seed: int) -> Iterator[str]:
+    for i in range(count):
+        words = [_WORDS[(seed * 7 + i * 3 + j * 5) % len(_WORDS)] for j in range(12)]
+        yield f"{seed}.{i} " + " ".join(words)
+
+
+def write_pdf(path: Path, pages: int, lines_per_page: int = 60) -> None:
+    """A minimal text-only PDF: Helvetica, one content stream per page."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for page in range(pages):
+        text = ") Tj T* (".join(_lines(lines_per_page, page))
+        stream = f"BT /F1 9 Tf 11 TL 36 800 Td ({text}) Tj ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids),
+        pages,
+    )
+
+    with path.open("wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(
+            b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (len(objects) + 1, xref)
+        )
+
+
+_DOCX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" '
+        'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="word/document.xml" Type="http://schemas.'
+        'openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        "</Relationships>"
+    ),
+}
+
+
+def write_docx(path: Path, paragraphs: int) -> None:
+    """A minimal DOCX package, written directly (python-docx gets slow at this size)."""
+    body = "".join(f"<w:p><w:r><w:t>{line}</w:t></w:r></w:p>" for line in _lines(paragraphs, 0))
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{body}</w:body></w:document>"
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as package:
+        for name, xml in _DOCX_PARTS.items():
+            package.writestr(name, xml)
+        package.writestr("word/document.xml", document)
+
+
+def _legacy_chunks(file_path: Path) -> list[str]:
+    """The loaders as they were before streaming, kept here for comparison."""
+    if file_path.suffix == ".pdf":
+        from pypdf import PdfReader
+
+        full_text = ""
+        for page in PdfReader(str(file_path)).pages:
+            page_text = page.extract_text()
+            if page_text:
+                full_text += page_text + "\n"
+    else:
+        from docx import Document as DocxDocument
+
+        full_text = ""
+        for paragraph in DocxDocument(str(file_path)).paragraphs:
+            if paragraph.text.strip():
+                full_text += paragraph.text + "\n"
+
+    chunks = []
+    start = 0
+    while start < len(full_text):
+        end = start + 500
+        chunk = full_text[start:end]
+        if chunk.strip():
+            chunks.append(chunk.strip())
+        start = end - 50
+    return chunks
+
+
+def _measure(mode: str, file_path: Path) -> dict:
+    """Runs inside the child interpreter."""
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    digest = hashlib.sha256()
+    count = 0
+
+    started = time.perf_counter()
+    chunks = _legacy_chunks(file_path) if mode == "legacy" else iter_file_chunks(file_path)
+    for chunk in chunks:
+        digest.update(chunk.encode())
+        count += 1
+    elapsed = time.perf_counter() - started
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "seconds": round(elapsed, 3),
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "rss_growth_mb": round((peak_kb - baseline_kb) / 1024, 1),
+        "chunks": count,
+        "sha256": digest.hexdigest(),
+    }
+
+
+def run(mode: str, file_path: Path) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.chunking", "--measure", mode, str(file_path)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare legacy and streaming document loading")
+    parser.add_argument("--pages", type=int, default=500, help="Pages in the synthetic PDF")
+    parser.add_argument(
+        "--paragraphs", type=int, default=50_000, help="Paragraphs in the synthetic DOCX"
+    )
+    parser.add_argument("--json", metavar="PATH", help="Write the results to PATH")
+    parser.add_argument("--measure", nargs=2, metavar=("MODE", "FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        mode, file_path = args.measure
+        print(json.dumps(_measure(mode, Path(file_path))))
+        return
+
+    results: dict[str, dict] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        files = {"pdf": Path(tmp) / "synthetic.pdf", "docx": Path(tmp) / "synthetic.docx"}
+        write_pdf(files["pdf"], args.pages)
+        write_docx(files["docx"], args.paragraphs)
+
+        for kind, file_path in files.items():
+            size_mb = file_path.stat().st_size / 1e6
+            results[kind] = {"file_mb": round(size_mb, 1)}
+            for mode in MODES:
+                results[kind][mode] = run(mode, file_path)
+
+            legacy, streaming = results[kind]["legacy"], results[kind]["streaming"]
+            if legacy["sha256"] != streaming["sha256"]:
+                sys.exit(f"{kind}: streaming chunks differ from the legacy loader")
+
+            print(f"{kind} ({size_mb:.1f} MB, {legacy['chunks']} chunks)")
+            for mode in MODES:
+                r = results[kind][mode]
+                print(
+                    f"  {mode:<10} {r['seconds']:8.3f}s  peak RSS {r['peak_rss_mb']:7.1f} MB"
+                    f"  (+{r['rss_growth_mb']:.1f} MB while loading)"
+                )
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
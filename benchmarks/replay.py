@@ -0,0 +1,433 @@
+"""Offline replay and throughput harness.
+
+Drives recorded webhook payloads (or rows from a `messages` table, or synthetic
+traffic) through the real app: `POST /webhook` -> ingest queue ->
+`handle_incoming_message`. The expensive or external parts are replaced:
+
+- every agent runs on a pydantic-ai FunctionModel with configurable latency that
+  answers deterministically from keywords
+- the WhatsApp Graph API is an in-process httpx stub
+- the database is a throwaway SQLite file
+
+Reports throughput and p50/p95/p99 latency for every traced stage. Use
+`--compare` to fail when a run regresses against a saved baseline.
+
+    python -m benchmarks.replay --synthetic 500 --llm-latency-ms 300
+    python -m benchmarks.replay recorded/*.jsonl --json results.json
+    python -m benchmarks.replay --source-db "$READONLY_URL" --limit 1000 --compare baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from collections.abc import Iterable
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any
+
+from pydantic_ai.messages import ModelMessage, ModelRequest, ModelResponse, TextPart, ToolCallPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+GROUP_ID = "replay-group"
+
+_ERROR_WORDS = ("error", "crash", "bug", "exception", "500", "fails", "failed", "timeout")
+_COMPLAINT_WORDS = ("refund", "terrible", "unacceptable", "slow", "broken", "still", "waiting")
+_CASUAL_WORDS = ("thanks", "thank you", "hi", "hello", "ok", "cheers", "lol", "morning")
+
+_SYNTHETIC_MESSAGES = {
+    "ERROR": [
+        "The app shows error 500 when I open my invoices",
+        "Checkout crashes every time I press pay",
+        "Login failed with an exception about the session token",
+        "Export fails after the progress bar reaches 90%",
+    ],
+    "COMPLAINT": [
+        "This is unacceptable, my order is still not delivered",
+        "I want a refund, the service has been terrible this week",
+        "Support is so slow, I've been waiting three days",
+        "The dashboard is broken again and nobody replied",
+    ],
+    "CASUAL": ["thanks!", "ok 👍", "Good morning team", "cheers, that worked"],
+    "UNKNOWN": [
+        "Can you send me the address of the office?",
+        "Who should I talk to about the partnership?",
+        "Is the meeting moved to Thursday?",
+    ],
+}
+
+
+def stand_in_category(text: str) -> str:
+    lowered = text.lower()
+    if any(word in lowered for word in _ERROR_WORDS):
+        return "ERROR"
+    if any(word in lowered for word in _COMPLAINT_WORDS):
+        return "COMPLAINT"
+    if any(word in lowered for word in _CASUAL_WORDS):
+        return "CASUAL"
+    return "UNKNOWN"
+
+
+def _last_prompt(messages: list[ModelMessage]) -> str:
+    for message in reversed(messages):
+        if isinstance(message, ModelRequest):
+            for part in message.parts:
+                content = getattr(part, "content", None)
+                if part.part_kind != "user-prompt":
+                    continue
+                if isinstance(content, str):
+                    return content
+                return "".join(item for item in content if isinstance(item, str))
+    return ""
+
+
+def build_stand_in_models(
+    latency_ms: float, jitter_ms: float = 0.0, seed: int = 0
+) -> dict[str, FunctionModel]:
+    """One FunctionModel per agent, each sleeping latency ± jitter before answering."""
+    rng = random.Random(seed)
+
+    async def delay() -> None:
+        if latency_ms or jitter_ms:
+            await asyncio.sleep(max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000)
+
+    async def classify(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        await delay()
+        prompt = _last_prompt(messages).rsplit("Message:", 1)[-1]
+        return ModelResponse(parts=[TextPart(stand_in_category(prompt))])
+
+    async def classify_batch(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        await delay()
+        items = re.split(r"^\[\d+\] ", _last_prompt(messages), flags=re.MULTILINE)[1:]
+        categories = [stand_in_category(item) for item in items]
+        return ModelResponse(
+            parts=[ToolCallPart(info.output_tools[0].name, {"categories": categories})]
+        )
+
+    async def draft(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        await delay()
+        return ModelResponse(parts=[TextPart("Thanks for letting us know, we're looking into it.")])
+
+    async def triage(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        await delay()
+        category = stand_in_category(_last_prompt(messages).rsplit("Message:", 1)[-1])
+        reply = "" if category == "CASUAL" else "Thanks for letting us know, we're on it."
+        return ModelResponse(
+            parts=[ToolCallPart(info.output_tools[0].name, {"category": category, "reply": reply})]
+        )
+
+    async def summarize(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        await delay()
+        return ModelResponse(parts=[TextPart("Customer reported several issues.")])
+
+    return {
+        "classify": FunctionModel(classify, model_name="stand-in-classify"),
+        "classify_batch": FunctionModel(classify_batch, model_name="stand-in-batch"),
+        "draft": FunctionModel(draft, model_name="stand-in-draft"),
+        "triage": FunctionModel(triage, model_name="stand-in-triage"),
+        "summarize": FunctionModel(summarize, model_name="stand-in-summarize"),
+    }
+
+
+def make_payload(
+    message_id: str, phone: str, name: str, text: str, group_id: str = GROUP_ID
+) -> dict:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [
+            {
+                "id": group_id,
+                "changes": [
+                    {
+                        "field": "messages",
+                        "value": {
+                            "messaging_product": "whatsapp",
+                            "metadata": {
+                                "display_phone_number": "15550000000",
+                                "phone_number_id": group_id,
+                            },
+                            "contacts": [{"profile": {"name": name}, "wa_id": phone}],
+                            "messages": [
+                                {
+                                    "from": phone,
+                                    "id": message_id,
+                                    "timestamp": str(int(time.time())),
+                                    "type": "text",
+                                    "text": {"body": text},
+                                }
+                            ],
+                        },
+                    }
+                ],
+            }
+        ],
+    }
+
+
+def synthetic_payloads(count: int, senders: int = 50, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    texts = [text for group in _SYNTHETIC_MESSAGES.values() for text in group]
+    return [
+        make_payload(
+            f"wamid.replay.{i}",
+            phone=f"1555{rng.randrange(senders):07d}",
+            name=f"Customer {i % senders}",
+            text=rng.choice(texts),
+        )
+        for i in range(count)
+    ]
+
+
+def load_payloads(paths: Iterable[str]) -> list[dict]:
+    """Read recorded webhook bodies: .json (one payload or a list) or .jsonl files."""
+    payloads: list[dict] = []
+    for path in map(Path, paths):
+        if path.suffix == ".jsonl":
+            payloads.extend(json.loads(line) for line in path.read_text().splitlines() if line)
+        else:
+            data = json.loads(path.read_text())
+            payloads.extend(data if isinstance(data, list) else [data])
+    return payloads
+
+
+def payloads_from_db(url: str, limit: int) -> list[dict]:
+    """Turn stored `messages` rows into webhook payloads, oldest first."""
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(url.replace("postgresql://", "postgresql+psycopg://"))
+    with engine.connect() as connection:
+        rows = connection.execute(
+            text(
+                "SELECT wa_message_id, group_id, sender_phone, sender_name, content "
+                "FROM messages ORDER BY created_at DESC LIMIT :limit"
+            ),
+            {"limit": limit},
+        ).all()
+
+    return [
+        make_payload(wa_id, phone, name or "Unknown", content, group_id=group_id)
+        for wa_id, group_id, phone, name, content in reversed(rows)
+    ]
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize_spans(spans: Iterable[Any]) -> dict[str, dict[str, float]]:
+    durations: dict[str, list[float]] = defaultdict(list)
+    for span in spans:
+        # Log records are exported as zero-length spans; only real spans are stages.
+        if (span.attributes or {}).get("logfire.span_type") == "log":
+            continue
+        if span.end_time is not None:
+            durations[span.name].append((span.end_time - span.start_time) / 1e6)
+
+    return {
+        name: {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+        }
+        for name, values in sorted(durations.items())
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Describe every stage whose p95 (or the overall throughput) got worse than allowed."""
+    regressions = []
+    if report["throughput_per_s"] < baseline["throughput_per_s"] * (1 - tolerance):
+        regressions.append(
+            f"throughput {report['throughput_per_s']:.1f}/s "
+            f"< baseline {baseline['throughput_per_s']:.1f}/s"
+        )
+
+    for name, stats in report["stages"].items():
+        before = baseline["stages"].get(name)
+        if before and stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name} p95 {stats['p95_ms']}ms > baseline {before['p95_ms']}ms")
+
+    return regressions
+
+
+def _configure_environment(workdir: str) -> None:
+    # Must run before anything under src is imported: settings and the engine are
+    # created at import time.
+    os.environ.update(
+        {
+            "DATABASE_URL": f"sqlite:///{workdir}/replay.db",
+            "ANTHROPIC_API_KEY": "replay-stand-in",
+            "WA_APP_SECRET": "",
+            "WA_ACCESS_TOKEN": "replay",
+            "WA_PHONE_NUMBER_ID": GROUP_ID,
+            "PERSONAL_PHONE": os.environ.get("PERSONAL_PHONE") or "15550000001",
+            "LOGFIRE_TOKEN": "",
+            "CLASSIFICATION_CACHE_PATH": "",
+            "CHROMA_PATH": f"{workdir}/chroma",
+            # The stand-in models need no warmup, and the embedding model would be downloaded.
+            "WARMUP_ENABLED": "false",
+        }
+    )
+
+
+async def replay(
+    payloads: list[dict],
+    concurrency: int = 16,
+    llm_latency_ms: float = 300.0,
+    llm_jitter_ms: float = 0.0,
+    graph_latency_ms: float = 50.0,
+    seed: int = 0,
+) -> dict:
+    import httpx
+    import logfire
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    from src.agent.classifier import get_batch_classifier_agent, get_classifier_agent
+    from src.agent.core import get_prb_agent, get_triage_agent
+    from src.agent.summarizer import get_summarizer_agent
+    from src.main import app
+    from src.services import summaries
+    from src.services.queue import ingest_queue
+    from src.whatsapp.client import whatsapp_client
+
+    exporter = InMemorySpanExporter()
+    logfire.configure(
+        send_to_logfire=False,
+        console=False,
+        additional_span_processors=[SimpleSpanProcessor(exporter)],
+    )
+
+    sent = 0
+
+    async def graph_api(request: httpx.Request) -> httpx.Response:
+        nonlocal sent
+        await asyncio.sleep(graph_latency_ms / 1000)
+        sent += 1
+        return httpx.Response(200, json={"messages": [{"id": f"wamid.stub.{sent}"}]})
+
+    whatsapp_client.transport = httpx.MockTransport(graph_api)
+
+    models = build_stand_in_models(llm_latency_ms, llm_jitter_ms, seed)
+    overrides = [
+        (get_classifier_agent(), models["classify"]),
+        (get_batch_classifier_agent(), models["classify_batch"]),
+        (get_prb_agent(), models["draft"]),
+        (get_triage_agent(), models["triage"]),
+        (get_summarizer_agent(), models["summarize"]),
+    ]
+
+    shed = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def post(client: httpx.AsyncClient, payload: dict) -> None:
+        nonlocal shed
+        async with semaphore:
+            # Meta redelivers on 5xx; do the same, quickly, so shed load is replayed.
+            while (await client.post("/webhook", json=payload)).status_code == 503:
+                shed += 1
+                await asyncio.sleep(0.05)
+
+    with ExitStack() as stack:
+        for agent, model in overrides:
+            stack.enter_context(agent.override(model=model))
+
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+                started = time.perf_counter()
+                await asyncio.gather(*(post(client, payload) for payload in payloads))
+                await ingest_queue.join()
+                await asyncio.gather(*summaries._inflight.values(), return_exceptions=True)
+                elapsed = time.perf_counter() - started
+
+    stages = summarize_spans(exporter.get_finished_spans())
+    handled = stages.get("handle_incoming_message", {}).get("count", 0)
+    return {
+        "payloads": len(payloads),
+        "handled": handled,
+        "shed_retries": shed,
+        "graph_api_calls": sent,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(handled / elapsed, 2) if elapsed else 0.0,
+        "stages": stages,
+    }
+
+
+def _print_report(report: dict) -> None:
+    print(
+        f"handled {report['handled']} of {report['payloads']} payloads "
+        f"in {report['elapsed_s']}s -> {report['throughput_per_s']} msg/s "
+        f"({report['shed_retries']} shed retries, {report['graph_api_calls']} Graph API calls)"
+    )
+    print(f"{'stage':<40} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for name, stats in report["stages"].items():
+        print(
+            f"{name[:40]:<40} {stats['count']:>7} "
+            f"{stats['p50_ms']:>10} {stats['p95_ms']:>10} {stats['p99_ms']:>10}"
+        )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay traffic through the pipeline offline")
+    parser.add_argument("payloads", nargs="*", help="Recorded webhook bodies (.json/.jsonl)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Generate N synthetic messages")
+    parser.add_argument("--source-db", help="Replay rows from this database's messages table")
+    parser.add_argument("--limit", type=int, default=1000, help="Rows to read with --source-db")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent webhook posts")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--graph-latency-ms", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--compare", help="Baseline report; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression ratio")
+    args = parser.parse_args(argv)
+
+    payloads = load_payloads(args.payloads)
+    if args.source_db:
+        payloads += payloads_from_db(args.source_db, args.limit)
+    if args.synthetic:
+        payloads += synthetic_payloads(args.synthetic, seed=args.seed)
+    if not payloads:
+        parser.error("nothing to replay: pass payload files, --source-db or --synthetic")
+
+    with tempfile.TemporaryDirectory(prefix="replay-") as workdir:
+        _configure_environment(workdir)
+        report = asyncio.run(
+            replay(
+                payloads,
+                concurrency=args.concurrency,
+                llm_latency_ms=args.llm_latency_ms,
+                llm_jitter_ms=args.llm_jitter_ms,
+                graph_latency_ms=args.graph_latency_ms,
+                seed=args.seed,
+            )
+        )
+
+    _print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+    if args.compare:
+        regressions = compare(report, json.loads(Path(args.compare).read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Cold-start benchmark.
+
+Measures in fresh interpreters:
+- import time of `src.main` (median of several runs)
+- time from spawning uvicorn to the first 200 from /health
+- time to the first 200 from /ready, once warmup has finished
+
+It also lists which heavy, first-use-only dependencies are loaded by importing the
+app. That list should stay empty.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --record "lazy rag imports"   # append to results/startup.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS = Path(__file__).resolve().parent / "results" / "startup.json"
+
+# Only needed for ingestion, retrieval or a specific provider: must load on first use.
+LAZY_MODULES = ("chromadb", "pypdf", "docx", "anthropic", "onnxruntime")
+
+_IMPORT_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import src.main
+elapsed = time.perf_counter() - started
+loaded = [m for m in {LAZY_MODULES!r} if m in sys.modules]
+print(json.dumps({{"seconds": elapsed, "loaded": loaded}}))
+"""
+
+
+def measure_import(runs: int) -> tuple[float, list[str]]:
+    timings, loaded = [], []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", _IMPORT_PROBE],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result["seconds"])
+        loaded = result["loaded"]
+    return statistics.median(timings), loaded
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url: str, started: float, timeout: float) -> float | None:
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        time.sleep(0.02)
+    return None
+
+
+def measure_serving(ready_timeout: float) -> tuple[float | None, float | None]:
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port)],
+        cwd=ROOT,
+        env={**os.environ, "LOGFIRE_TOKEN": ""},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        healthy = _wait_for(f"http://127.0.0.1:{port}/health", started, timeout=60)
+        ready = _wait_for(f"http://127.0.0.1:{port}/ready", started, timeout=ready_timeout)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return healthy, ready
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Measure app import and cold-start time")
+    parser.add_argument("--runs", type=int, default=5, help="Import-time samples")
+    parser.add_argument("--ready-timeout", type=float, default=120.0)
+    parser.add_argument("--record", metavar="LABEL", help="Append the result to the results file")
+    args = parser.parse_args(argv)
+
+    import_s, loaded = measure_import(args.runs)
+    health_s, ready_s = measure_serving(args.ready_timeout)
+
+    result = {
+        "label": args.record,
+        "recorded_at": datetime.now(UTC).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "import_s": round(import_s, 3),
+        "first_health_s": round(health_s, 3) if health_s is not None else None,
+        "first_ready_s": round(ready_s, 3) if ready_s is not None else None,
+        "lazy_modules_loaded_at_import": loaded,
+    }
+
+    print(f"import src.main:        {result['import_s']}s (median of {args.runs})")
+    print(f"first healthy response: {result['first_health_s']}s")
+    print(f"first ready response:   {result['first_ready_s']}s")
+    print(f"lazy deps loaded early: {', '.join(loaded) or 'none'}")
+
+    if args.record:
+        history = json.loads(RESULTS.read_text()) if RESULTS.exists() else []
+        history.append(result)
+        RESULTS.parent.mkdir(parents=True, exist_ok=True)
+        RESULTS.write_text(json.dumps(history, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,17 @@
-from .classifier import classify_message
-from .core import AgentResponse, process_message
+from .classifier import classify_message, classify_with_source, fallback_classification
+from .core import AgentResponse, process_message, triage_message
+from .limiter import Priority
+from .local_classifier import classify_locally
 from .tools import AgentContext
 
-__all__ = ["classify_message", "process_message", "AgentResponse", "AgentContext"]
+__all__ = [
+    "classify_message",
+    "classify_with_source",
+    "fallback_classification",
+    "classify_locally",
+    "process_message",
+    "triage_message",
+    "AgentResponse",
+    "AgentContext",
+    "Priority",
+]
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+
+import logfire
+
+from src.batching import WindowedBatcher
+from src.db.models import MessageType
+
+_batch_size_histogram = logfire.metric_histogram(
+    "classifier.batch_size", description="Messages per batched classification request"
+)
+_batch_wait_histogram = logfire.metric_histogram(
+    "classifier.batch_wait", unit="s", description="Time a message waited for its batch to flush"
+)
+_batch_fallback_counter = logfire.metric_counter(
+    "classifier.batch_fallback", description="Batches re-run as per-message calls"
+)
+
+ClassifyOne = Callable[[str], Awaitable[MessageType]]
+ClassifyMany = Callable[[list[str]], Awaitable[list[MessageType]]]
+
+
+class ClassificationBatcher(WindowedBatcher):
+    """Collects concurrent classification requests into a single LLM call.
+
+    A batch is flushed after `window_ms` or once `max_size` requests are waiting,
+    whichever comes first. If the batched reply can't be mapped back to the
+    callers, every message in the batch is classified on its own instead.
+    """
+
+    task_name = "classification-batch"
+
+    def __init__(
+        self,
+        classify_one: ClassifyOne,
+        classify_many: ClassifyMany,
+        window_ms: int,
+        max_size: int,
+    ):
+        super().__init__(window_ms, max_size)
+        self.classify_one = classify_one
+        self.classify_many = classify_many
+
+    async def classify(self, content: str) -> MessageType:
+        return await self.submit(content)
+
+    async def _run(self, batch: list[tuple[str, asyncio.Future[MessageType], float]]) -> None:
+        flushed_at = time.monotonic()
+        _batch_size_histogram.record(len(batch))
+        for _, _, enqueued_at in batch:
+            _batch_wait_histogram.record(flushed_at - enqueued_at)
+
+        contents = [content for content, _, _ in batch]
+        results: list[MessageType | BaseException]
+
+        with logfire.span("classify_batch", size=len(batch)):
+            if len(batch) == 1:
+                results = await asyncio.gather(
+                    self.classify_one(contents[0]), return_exceptions=True
+                )
+            else:
+                try:
+                    results = list(await self.classify_many(contents))
+                    if len(results) != len(batch):
+                        raise ValueError(f"Expected {len(batch)} labels, got {len(results)}")
+                except Exception as e:
+                    _batch_fallback_counter.add(1)
+                    logfire.warn(
+                        "Batched classification failed, falling back to per-message calls",
+                        size=len(batch),
+                        error=str(e),
+                    )
+                    results = await asyncio.gather(
+                        *(self.classify_one(content) for content in contents),
+                        return_exceptions=True,
+                    )
+
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
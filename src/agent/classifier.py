@@ -1,42 +1,231 @@
+import hashlib
+import json
 import os
+from pathlib import Path
+from typing import Literal
 
 import logfire
+from pydantic import BaseModel
 from pydantic_ai import Agent
 
+from src.cache import TTLCache
 from src.config import settings
-from src.db.models import MessageType
+from src.db.models import LabelSource, MessageType
 
-from .prompts import CLASSIFICATION_PROMPT
+from .batching import ClassificationBatcher
+from .local_classifier import classify_locally, guess_locally
+from .prompts import BATCH_CLASSIFICATION_PROMPT, CLASSIFICATION_PROMPT
+from .routing import prompt_cache_settings, route, run_routed
 
 os.environ.setdefault("ANTHROPIC_API_KEY", settings.anthropic_api_key)
 
+CLASSIFIER_SYSTEM_PROMPT = "You are a message classifier. Respond with only the category name."
+
+_path_counter = logfire.metric_counter(
+    "classifier.requests", description="Classifications by path: rule, model, cache or llm"
+)
+
+
+class BatchClassification(BaseModel):
+    categories: list[Literal["COMPLAINT", "ERROR", "CASUAL", "UNKNOWN"]]
+
+
 _classifier_agent: Agent[None, str] | None = None
+_batch_classifier_agent: Agent[None, BatchClassification] | None = None
+_batcher: ClassificationBatcher | None = None
+
+_classification_cache = TTLCache(
+    maxsize=settings.classification_cache_size,
+    ttl=settings.classification_cache_ttl_seconds,
+)
 
 
 def get_classifier_agent() -> Agent[None, str]:
     global _classifier_agent
     if _classifier_agent is None:
         _classifier_agent = Agent(
-            "anthropic:claude-sonnet-4-20250514",
-            system_prompt="You are a message classifier. Respond with only the category name.",
+            settings.classifier_model,
+            system_prompt=CLASSIFIER_SYSTEM_PROMPT,
+            model_settings=prompt_cache_settings(),
         )
     return _classifier_agent
 
 
+def get_batch_classifier_agent() -> Agent[None, BatchClassification]:
+    global _batch_classifier_agent
+    if _batch_classifier_agent is None:
+        _batch_classifier_agent = Agent(
+            settings.classifier_model,
+            system_prompt="You are a message classifier.",
+            output_type=BatchClassification,
+            model_settings=prompt_cache_settings(),
+        )
+    return _batch_classifier_agent
+
+
+def get_batcher() -> ClassificationBatcher | None:
+    global _batcher
+    if _batcher is None and settings.classify_batch_window_ms > 0:
+        _batcher = ClassificationBatcher(
+            _classify_with_llm,
+            _classify_batch_with_llm,
+            window_ms=settings.classify_batch_window_ms,
+            max_size=settings.classify_batch_max_size,
+        )
+    return _batcher
+
+
+async def stop_batcher(timeout: float) -> None:
+    if _batcher is not None:
+        await _batcher.stop(timeout)
+
+
+def _cache_namespace() -> str:
+    """Fingerprint of everything that shapes an LLM answer; changing any of it
+    makes previously cached classifications unreachable."""
+    fingerprint = "\0".join(
+        [settings.classifier_model, CLASSIFIER_SYSTEM_PROMPT, CLASSIFICATION_PROMPT]
+    )
+    return hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+
+
+def _cache_key(content: str) -> str:
+    normalized = " ".join(content.lower().split())
+    return f"{_cache_namespace()}:{hashlib.sha256(normalized.encode()).hexdigest()}"
+
+
+def classification_cache_stats() -> dict:
+    stats = _classification_cache.stats
+    return {
+        "size": len(_classification_cache),
+        "hits": stats.hits,
+        "misses": stats.misses,
+        "evictions": stats.evictions,
+        "hit_rate": stats.hit_rate,
+    }
+
+
+def load_classification_cache(path: str | None = None) -> int:
+    """Warm the cache from disk, skipping entries from another prompt/model."""
+    path = path or settings.classification_cache_path
+    if not path or not Path(path).exists():
+        return 0
+
+    try:
+        payload = json.loads(Path(path).read_text())
+    except (OSError, ValueError) as e:
+        logfire.warn("Failed to read classification cache", path=path, error=str(e))
+        return 0
+
+    if payload.get("namespace") != _cache_namespace():
+        logfire.info("Classification cache is stale, ignoring", path=path)
+        return 0
+
+    before = len(_classification_cache)
+    for key, value, expires_at in payload.get("entries", []):
+        _classification_cache.set(key, MessageType(value), expires_at=expires_at)
+
+    loaded = len(_classification_cache) - before
+    logfire.info("Classification cache loaded", path=path, entries=loaded)
+    return loaded
+
+
+def save_classification_cache(path: str | None = None) -> None:
+    path = path or settings.classification_cache_path
+    if not path:
+        return
+
+    payload = {
+        "namespace": _cache_namespace(),
+        "entries": [
+            [key, value.value, expires_at]
+            for key, value, expires_at in _classification_cache.items()
+        ],
+    }
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_text(json.dumps(payload))
+    logfire.info("Classification cache saved", path=path, entries=len(payload["entries"]))
+
+
 async def classify_message(content: str) -> MessageType:
-    with logfire.span("classify_message", content_preview=content[:100]):
-        prompt = CLASSIFICATION_PROMPT.format(message=content)
-        agent = get_classifier_agent()
-
-        result = await agent.run(prompt)
-
-        classification = result.output.strip().upper()
-
-        if classification == "COMPLAINT":
-            return MessageType.COMPLAINT
-        elif classification == "ERROR":
-            return MessageType.ERROR
-        elif classification == "CASUAL":
-            return MessageType.CASUAL
-        else:
-            return MessageType.UNKNOWN
+    message_type, _ = await classify_with_source(content)
+    return message_type
+
+
+async def classify_with_source(content: str) -> tuple[MessageType, LabelSource | None]:
+    """Classify and report who labelled it: the local rules or model, or the LLM.
+
+    Cached classifications count as LLM labels; only LLM results are cached. When the
+    LLM stage runs out of time, the local model's best guess is used even below its
+    threshold, or UNKNOWN (with no label source) if there is no model.
+    """
+    with logfire.span("classify_message", content_preview=content[:100]) as span:
+        local = classify_locally(content)
+        if local is not None:
+            message_type, path = local
+            _path_counter.add(1, {"path": path})
+            span.set_attribute("path", path)
+            return message_type, LabelSource(path)
+
+        key = _cache_key(content)
+        cached = _classification_cache.get(key)
+        if cached is not None:
+            _path_counter.add(1, {"path": "cache"})
+            span.set_attribute("path", "cache")
+            return cached, LabelSource.LLM
+
+        _path_counter.add(1, {"path": "llm"})
+        span.set_attribute("path", "llm")
+        batcher = get_batcher()
+        try:
+            if batcher is not None:
+                message_type = await batcher.classify(content)
+            else:
+                message_type = await _classify_with_llm(content)
+        except TimeoutError:
+            span.set_attribute("path", "timeout")
+            return fallback_classification(content)
+
+        _classification_cache.set(key, message_type)
+        return message_type, LabelSource.LLM
+
+
+def fallback_classification(content: str) -> tuple[MessageType, LabelSource | None]:
+    """The label to use when the LLM stage is over budget: the local model's best guess
+    even below its threshold, else UNKNOWN."""
+    guess = guess_locally(content)
+    _path_counter.add(1, {"path": "timeout"})
+    logfire.warn(
+        "Classification over budget, using local guess", guess=guess.value if guess else None
+    )
+    if guess is None:
+        return MessageType.UNKNOWN, None
+    return guess, LabelSource.MODEL
+
+
+async def _classify_batch_with_llm(contents: list[str]) -> list[MessageType]:
+    numbered = "\n\n".join(f"[{i}] {content}" for i, content in enumerate(contents, start=1))
+    prompt = BATCH_CLASSIFICATION_PROMPT.format(messages=numbered)
+    agent = get_batch_classifier_agent()
+
+    result = await run_routed(agent, route("classify", numbered), prompt)
+
+    return [MessageType(category.lower()) for category in result.output.categories]
+
+
+async def _classify_with_llm(content: str) -> MessageType:
+    prompt = CLASSIFICATION_PROMPT.format(message=content)
+    agent = get_classifier_agent()
+
+    result = await run_routed(agent, route("classify", content), prompt)
+
+    classification = result.output.strip().upper()
+
+    if classification == "COMPLAINT":
+        return MessageType.COMPLAINT
+    elif classification == "ERROR":
+        return MessageType.ERROR
+    elif classification == "CASUAL":
+        return MessageType.CASUAL
+    else:
+        return MessageType.UNKNOWN
@@ -1,13 +1,18 @@
 import os
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Literal
 
 import logfire
-from pydantic_ai import Agent
+from pydantic import BaseModel, Field
+from pydantic_ai import Agent, CachePoint
+from pydantic_ai.messages import UserContent
 
 from src.config import settings
+from src.db.models import MessageType
 
-from .prompts import SYSTEM_PROMPT
+from .limiter import Priority
+from .prompts import SYSTEM_PROMPT, TRIAGE_PROMPT
+from .routing import prompt_cache_settings, route, run_routed
 from .tools import AgentContext, draft_reply, escalate_to_dev, forward_to_personal
 
 os.environ.setdefault("ANTHROPIC_API_KEY", settings.anthropic_api_key)
@@ -17,18 +22,27 @@ os.environ.setdefault("ANTHROPIC_API_KEY", settings.anthropic_api_key)
 class AgentResponse:
     message: str
     actions: list[dict[str, Any]]
+    # Only set by triage_message, which classifies and drafts in one call.
+    message_type: MessageType | None = None
+
+
+class TriageOutput(BaseModel):
+    category: Literal["COMPLAINT", "ERROR", "CASUAL", "UNKNOWN"]
+    reply: str = Field(default="", description="Drafted reply; empty for CASUAL messages")
 
 
 _prb_agent: Agent[AgentContext, str] | None = None
+_triage_agent: Agent[AgentContext, TriageOutput] | None = None
 
 
 def get_prb_agent() -> Agent[AgentContext, str]:
     global _prb_agent
     if _prb_agent is None:
         _prb_agent = Agent(
-            "anthropic:claude-sonnet-4-20250514",
+            settings.draft_model,
             system_prompt=SYSTEM_PROMPT,
             deps_type=AgentContext,
+            model_settings=prompt_cache_settings(),
         )
         _prb_agent.tool(draft_reply)
         _prb_agent.tool(escalate_to_dev)
@@ -36,25 +50,92 @@ def get_prb_agent() -> Agent[AgentContext, str]:
     return _prb_agent
 
 
-async def process_message(message: str, context: str | None = None) -> AgentResponse:
-    with logfire.span("process_message", message_preview=message[:100]):
+def get_triage_agent() -> Agent[AgentContext, TriageOutput]:
+    global _triage_agent
+    if _triage_agent is None:
+        _triage_agent = Agent(
+            settings.draft_model,
+            system_prompt=f"{SYSTEM_PROMPT}\n\n{TRIAGE_PROMPT}",
+            deps_type=AgentContext,
+            output_type=TriageOutput,
+            model_settings=prompt_cache_settings(),
+        )
+        _triage_agent.tool(draft_reply)
+        _triage_agent.tool(escalate_to_dev)
+        _triage_agent.tool(forward_to_personal)
+    return _triage_agent
+
+
+def _build_prompt(
+    message: str, context: str | None, history: str | None = None
+) -> str | list[UserContent]:
+    tail = f"Message: {message}"
+    if history:
+        # History changes with every message, so it goes after the cacheable context.
+        tail = f"Recent conversation:\n{history}\n\n{tail}"
+
+    if not context:
+        return tail if history else message
+
+    if settings.prompt_caching:
+        # Retrieved context goes first and ends in a cache point, so repeated
+        # retrievals reuse the system prompt + tools + context prefix.
+        return [f"Context: {context}\n\n", CachePoint(), tail]
+
+    return f"Context: {context}\n\n{tail}"
+
+
+def _collect_actions(result) -> list[dict[str, Any]]:
+    actions = []
+    for call in result.all_messages():
+        if hasattr(call, "parts"):
+            for part in call.parts:
+                if hasattr(part, "content") and isinstance(part.content, dict):
+                    actions.append(part.content)
+    return actions
+
+
+async def process_message(
+    message: str,
+    context: str | None = None,
+    low_confidence: bool = False,
+    priority: Priority = Priority.NORMAL,
+    history: str | None = None,
+) -> AgentResponse:
+    with logfire.span("process_message", message_preview=message[:100]) as span:
         deps = AgentContext(message_content=message)
 
-        prompt = message
-        if context:
-            prompt = f"Context: {context}\n\nMessage: {message}"
+        prompt = _build_prompt(message, context, history)
 
-        agent = get_prb_agent()
-        result = await agent.run(prompt, deps=deps)
+        selected = route("draft", message, low_confidence=low_confidence)
+        span.set_attribute("route_reason", selected.reason)
 
-        actions = []
-        for call in result.all_messages():
-            if hasattr(call, "parts"):
-                for part in call.parts:
-                    if hasattr(part, "content") and isinstance(part.content, dict):
-                        actions.append(part.content)
+        agent = get_prb_agent()
+        result = await run_routed(agent, selected, prompt, priority=priority, deps=deps)
 
         return AgentResponse(
             message=result.output,
-            actions=actions,
+            actions=_collect_actions(result),
+        )
+
+
+async def triage_message(
+    message: str, context: str | None = None, history: str | None = None
+) -> AgentResponse:
+    """Classify and draft in one structured call (AGENT_MODE=combined)."""
+    with logfire.span("triage_message", message_preview=message[:100]) as span:
+        deps = AgentContext(message_content=message)
+
+        agent = get_triage_agent()
+        result = await run_routed(
+            agent, route("draft", message), _build_prompt(message, context, history), deps=deps
+        )
+
+        message_type = MessageType(result.output.category.lower())
+        span.set_attribute("message_type", message_type.value)
+
+        return AgentResponse(
+            message=result.output.reply,
+            actions=_collect_actions(result),
+            message_type=message_type,
         )
@@ -0,0 +1,187 @@
+"""Process-wide limits on LLM traffic.
+
+All agent calls share one `LLMLimiter`, which caps in-flight calls, paces requests
+and tokens per minute, and retries rate-limit and overload errors with
+exponential backoff. Waiting calls are admitted by priority, so complaint and
+error drafting goes ahead of lower-value work during a burst.
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from collections.abc import Awaitable, Callable
+from enum import IntEnum
+from typing import TypeVar
+
+import logfire
+from pydantic_ai.exceptions import ModelHTTPError
+
+from src.config import settings
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504, 529}
+
+_throttle_histogram = logfire.metric_histogram(
+    "llm.throttle_time", unit="s", description="Time an LLM call waited on the limiter"
+)
+_retry_counter = logfire.metric_counter(
+    "llm.retries", description="LLM calls retried after a rate-limit or overload error"
+)
+
+
+class Priority(IntEnum):
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+class _TokenBucket:
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    async def acquire(self, amount: float) -> None:
+        amount = min(amount, self.capacity)
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def retry_after(exc: BaseException) -> float | None:
+    """Seconds from a Retry-After header on the error or the provider error it wraps."""
+    for error in (exc, exc.__cause__):
+        response = getattr(error, "response", None)
+        value = getattr(response, "headers", {}).get("retry-after")
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return None
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    return isinstance(exc, ModelHTTPError) and exc.status_code in RETRYABLE_STATUS_CODES
+
+
+def estimate_tokens(prompt: object) -> int:
+    parts = prompt if isinstance(prompt, list) else [prompt]
+    return sum(len(part) for part in parts if isinstance(part, str)) // 4 + 1
+
+
+class LLMLimiter:
+    def __init__(
+        self,
+        max_concurrency: int,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_retries: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._requests = _TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = _TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._sequence = itertools.count()
+
+    @property
+    def in_flight(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def _acquire_slot(self, priority: Priority) -> None:
+        if self._active < self.max_concurrency and not self.waiting:
+            self._active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled; pass it on.
+                self._release_slot()
+            raise
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot straight to the next waiter; _active is unchanged.
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    def _backoff(self, exc: BaseException, attempt: int) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        hinted = retry_after(exc)
+        return max(delay, hinted) if hinted is not None else delay
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        priority: Priority = Priority.NORMAL,
+        estimated_tokens: int = 0,
+    ) -> T:
+        attempt = 0
+        while True:
+            waited_from = time.monotonic()
+            # Pace before taking a slot, so a call waiting on the buckets doesn't hold
+            # one that a ready call could use.
+            if self._requests:
+                await self._requests.acquire(1)
+            if self._tokens and estimated_tokens:
+                await self._tokens.acquire(estimated_tokens)
+            await self._acquire_slot(priority)
+            try:
+                _throttle_histogram.record(
+                    time.monotonic() - waited_from, {"priority": priority.name}
+                )
+
+                return await call()
+            except ModelHTTPError as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                status_code, delay = e.status_code, self._backoff(e, attempt)
+            finally:
+                self._release_slot()
+
+            attempt += 1
+            _retry_counter.add(1, {"status": str(status_code)})
+            logfire.warn(
+                "LLM call rate limited, retrying",
+                status_code=status_code,
+                attempt=attempt,
+                delay=delay,
+            )
+            await asyncio.sleep(delay)
+
+
+llm_limiter = LLMLimiter(
+    max_concurrency=settings.llm_max_concurrency,
+    requests_per_minute=settings.llm_requests_per_minute,
+    tokens_per_minute=settings.llm_tokens_per_minute,
+    max_retries=settings.llm_max_retries,
+    base_delay=settings.llm_retry_base_delay,
+    max_delay=settings.llm_retry_max_delay,
+)
@@ -0,0 +1,282 @@
+"""Local first-stage classifier that answers confident cases without an LLM call.
+
+Two layers: hand-written rules for unmistakable casual one-liners ("thanks!",
+"ok 👍", greetings), then a multinomial naive Bayes model over word unigrams and
+bigrams trained offline from the `messages` rows labelled by the LLM or a human.
+The rule and model paths' own labels are never trained on, so the model cannot
+learn from its own mistakes.
+
+Train and evaluate with:
+
+    python -m src.agent.local_classifier train
+    python -m src.agent.local_classifier evaluate
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from sqlmodel import Session, select
+
+from src.config import settings
+from src.db.database import engine
+from src.db.models import LabelSource, Message, MessageType
+
+_CASUAL_RULE = re.compile(
+    r"^(hi|hello|hey|hiya|morning|good (morning|afternoon|evening|night)"
+    r"|thanks?( you)?( so much| a lot)?|thx|ty|cheers|ok(ay)?|kk?|cool|great|nice|noted"
+    r"|got it|sure|sounds good|perfect|bye|see (you|ya)|np|no problem|you'?re welcome"
+    r"|lol|ha(ha)+)( (all|guys|team|everyone))?[\s!.,:)]*$",
+    re.IGNORECASE,
+)
+_TOKEN_RE = re.compile(r"[a-z0-9']+|[^\w\s]", re.IGNORECASE)
+
+RULE_CONFIDENCE = 1.0
+
+
+def _strip_emoji(text: str) -> str:
+    # Symbols plus the modifiers, variation selectors and joiners that build emoji.
+    return "".join(ch for ch in text if unicodedata.category(ch) not in ("So", "Sk", "Mn", "Cf"))
+
+
+def match_rules(content: str) -> MessageType | None:
+    text = content.strip()
+    if not text:
+        return None
+
+    without_emoji = _strip_emoji(text).strip()
+    if not without_emoji:
+        # Emoji-only messages: reactions, thumbs up, hearts.
+        return MessageType.CASUAL
+
+    if len(without_emoji) <= 40 and _CASUAL_RULE.match(without_emoji):
+        return MessageType.CASUAL
+
+    return None
+
+
+def featurize(content: str) -> list[str]:
+    tokens = [t.lower() for t in _TOKEN_RE.findall(content)]
+    bigrams = [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return tokens + bigrams
+
+
+@dataclass
+class LinearTextModel:
+    """Naive Bayes expressed as per-class log weights, i.e. a linear model."""
+
+    priors: dict[str, float]
+    weights: dict[str, dict[str, float]]
+    unseen: dict[str, float]
+    metadata: dict = field(default_factory=dict)
+
+    @classmethod
+    def train(cls, samples: list[tuple[str, MessageType]], alpha: float = 1.0) -> "LinearTextModel":
+        class_counts: Counter[str] = Counter()
+        feature_counts: dict[str, Counter[str]] = {}
+        vocabulary: set[str] = set()
+
+        for content, label in samples:
+            class_counts[label.value] += 1
+            features = featurize(content)
+            feature_counts.setdefault(label.value, Counter()).update(features)
+            vocabulary.update(features)
+
+        total = sum(class_counts.values())
+        priors = {label: math.log(count / total) for label, count in class_counts.items()}
+        weights: dict[str, dict[str, float]] = {}
+        unseen: dict[str, float] = {}
+
+        for label, counts in feature_counts.items():
+            denominator = sum(counts.values()) + alpha * (len(vocabulary) + 1)
+            weights[label] = {
+                feature: math.log((count + alpha) / denominator)
+                for feature, count in counts.items()
+            }
+            unseen[label] = math.log(alpha / denominator)
+
+        return cls(priors=priors, weights=weights, unseen=unseen)
+
+    def predict(self, content: str) -> tuple[MessageType, float]:
+        features = featurize(content)
+        scores = {
+            label: prior + sum(self.weights[label].get(f, self.unseen[label]) for f in features)
+            for label, prior in self.priors.items()
+        }
+
+        best = max(scores, key=scores.__getitem__)
+        normalizer = sum(math.exp(score - scores[best]) for score in scores.values())
+        return MessageType(best), 1.0 / normalizer
+
+    def save(self, path: str | Path) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "priors": self.priors,
+            "weights": self.weights,
+            "unseen": self.unseen,
+            "metadata": self.metadata,
+        }
+        Path(path).write_text(json.dumps(payload))
+
+    @classmethod
+    def load(cls, path: str | Path) -> "LinearTextModel":
+        payload = json.loads(Path(path).read_text())
+        return cls(**payload)
+
+
+_local_model: LinearTextModel | None = None
+_local_model_loaded = False
+
+
+def get_local_model() -> LinearTextModel | None:
+    global _local_model, _local_model_loaded
+    if not _local_model_loaded:
+        path = Path(settings.local_classifier_path)
+        _local_model = LinearTextModel.load(path) if path.exists() else None
+        _local_model_loaded = True
+    return _local_model
+
+
+def classify_locally(content: str) -> tuple[MessageType, str] | None:
+    """Return (category, path) when the local stage is confident, else None."""
+    if not settings.local_classifier_enabled:
+        return None
+
+    ruled = match_rules(content)
+    if ruled is not None:
+        return ruled, "rule"
+
+    model = get_local_model()
+    if model is None:
+        return None
+
+    label, confidence = model.predict(content)
+    if confidence >= settings.local_classifier_threshold:
+        return label, "model"
+
+    return None
+
+
+def guess_locally(content: str) -> MessageType | None:
+    """The model's best label regardless of confidence, for when the LLM is unavailable."""
+    if not settings.local_classifier_enabled:
+        return None
+
+    ruled = match_rules(content)
+    if ruled is not None:
+        return ruled
+
+    model = get_local_model()
+    return model.predict(content)[0] if model is not None else None
+
+
+def _load_labelled_messages() -> list[tuple[str, MessageType]]:
+    if not engine:
+        raise SystemExit("DATABASE_URL is not configured")
+
+    with Session(engine) as session:
+        statement = (
+            select(Message.content, Message.message_type)
+            .where(Message.message_type != MessageType.UNKNOWN)
+            .where(Message.label_source.in_([LabelSource.LLM.value, LabelSource.HUMAN.value]))
+            .order_by(Message.created_at)
+        )
+        return [(content, MessageType(label)) for content, label in session.exec(statement)]
+
+
+def split_holdout(
+    samples: list[tuple[str, MessageType]], holdout: float
+) -> tuple[list[tuple[str, MessageType]], list[tuple[str, MessageType]]]:
+    """Split by a hash of the content, so `train` and `evaluate` agree on the holdout
+    set and a message never lands on both sides as more rows are labelled."""
+    train_set, holdout_set = [], []
+    for content, label in samples:
+        bucket = int.from_bytes(hashlib.sha256(content.encode()).digest()[:8]) / 2**64
+        (holdout_set if bucket < holdout else train_set).append((content, label))
+    return train_set, holdout_set
+
+
+def evaluate(
+    model: LinearTextModel | None,
+    samples: list[tuple[str, MessageType]],
+    threshold: float,
+) -> dict:
+    """Accuracy of the local stage, overall and on the messages it would answer alone."""
+    correct = covered = covered_correct = 0
+
+    for content, label in samples:
+        ruled = match_rules(content)
+        if ruled is not None:
+            prediction, confidence = ruled, RULE_CONFIDENCE
+        elif model is not None:
+            prediction, confidence = model.predict(content)
+        else:
+            continue
+
+        correct += prediction == label
+        if confidence >= threshold:
+            covered += 1
+            covered_correct += prediction == label
+
+    total = len(samples)
+    return {
+        "samples": total,
+        "accuracy": correct / total if total else 0.0,
+        "coverage": covered / total if total else 0.0,
+        "covered_accuracy": covered_correct / covered if covered else 0.0,
+    }
+
+
+def _print_report(report: dict, threshold: float) -> None:
+    print(f"samples:          {report['samples']}")
+    print(f"accuracy:         {report['accuracy']:.3f}")
+    print(f"coverage @ {threshold:.2f}:  {report['coverage']:.3f}  (skips the LLM)")
+    print(f"accuracy covered: {report['covered_accuracy']:.3f}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Train or evaluate the local pre-classifier")
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("--model", default=settings.local_classifier_path)
+    parser.add_argument("--threshold", type=float, default=settings.local_classifier_threshold)
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction held out for eval")
+    args = parser.parse_args(argv)
+
+    if args.command == "evaluate" and not Path(args.model).exists():
+        raise SystemExit(f"No model at {args.model}; run `train` first")
+
+    samples = _load_labelled_messages()
+    if not samples:
+        raise SystemExit("No labelled messages found")
+
+    train_set, holdout_set = split_holdout(samples, args.holdout)
+    if not train_set or not holdout_set:
+        raise SystemExit(f"Not enough labelled messages to hold out {args.holdout:.0%}")
+
+    if args.command == "evaluate":
+        # Only the holdout set: the saved model was trained on the rest.
+        print(f"holdout ({len(holdout_set)} of {len(samples)}):")
+        _print_report(
+            evaluate(LinearTextModel.load(args.model), holdout_set, args.threshold),
+            args.threshold,
+        )
+        return
+
+    model = LinearTextModel.train(train_set)
+    report = evaluate(model, holdout_set, args.threshold)
+    print(f"holdout ({len(holdout_set)} of {len(samples)}):")
+    _print_report(report, args.threshold)
+
+    model.metadata = {"samples": len(train_set), "holdout": report}
+    model.save(args.model)
+    print(f"saved model to {args.model}")
+
+
+if __name__ == "__main__":
+    main()
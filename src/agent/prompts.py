@@ -23,3 +23,47 @@ categories:
 Respond with ONLY the category name in uppercase (COMPLAINT, ERROR, CASUAL, or UNKNOWN).
 
 Message: {message}"""
+
+BATCH_CLASSIFICATION_PROMPT = """Classify each of the following messages into one of these \
+categories:
+
+- COMPLAINT: Customer expressing dissatisfaction, frustration, or reporting a service problem
+- ERROR: Technical error report, bug report, system malfunction, or application issue
+- CASUAL: General conversation, greetings, thank you messages, or non-urgent inquiries
+- UNKNOWN: Message that doesn't clearly fit into the above categories
+
+Classify every message independently. Return exactly one category per message in \
+`categories`, in the same order as the messages are numbered.
+
+{messages}"""
+
+TRIAGE_PROMPT = """In a single pass, classify the incoming message and draft the reply.
+
+Set `category` to one of:
+- COMPLAINT: Customer expressing dissatisfaction, frustration, or reporting a service problem
+- ERROR: Technical error report, bug report, system malfunction, or application issue
+- CASUAL: General conversation, greetings, thank you messages, or non-urgent inquiries
+- UNKNOWN: Message that doesn't clearly fit into the above categories
+
+For COMPLAINT, ERROR and UNKNOWN messages, put the drafted reply in `reply` and use your \
+tools as you normally would. For CASUAL messages leave `reply` empty and do not call tools."""
+
+SUMMARY_PROMPT = """Update the running summary of a support conversation with one customer.
+
+Keep what matters for replying later: the customer's open issues, what has been tried or \
+promised, error details, and their mood. Drop greetings and small talk. Write at most 120 words \
+of plain prose.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Respond with only the updated summary."""
+
+# Drafted for COMPLAINT/ERROR messages when the draft stage runs out of time, so the
+# approval request still goes out and a human can write the real answer.
+HOLDING_REPLY = (
+    "Thanks for letting us know. We're looking into this and will get back to you shortly."
+)
@@ -0,0 +1,213 @@
+"""Model selection and latency budgets for each LLM stage.
+
+Every agent call goes through `run_routed`, which tries the stage's models in order
+within one latency budget for the whole stage, and records which model answered and
+how long it took. Every model but the last must answer before ROUTE_FALLBACK_SHARE of
+the budget is left, so a model that times out or keeps failing with a retryable error
+still leaves the next one time to answer; retries and fallbacks never extend the budget.
+Attempts are admitted by the shared `llm_limiter`; the budget starts when the first
+attempt does, so time queued before it does not count.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from functools import cache
+from typing import TYPE_CHECKING, Any, Literal
+
+import logfire
+from pydantic_ai import Agent
+from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_ai.models import Model, infer_model
+from pydantic_ai.usage import RunUsage
+
+from src.config import settings
+
+from .limiter import Priority, estimate_tokens, is_retryable, llm_limiter
+
+if TYPE_CHECKING:
+    # Importing it at runtime would load the whole anthropic SDK at startup; it's a
+    # TypedDict, so a plain dict is identical.
+    from pydantic_ai.models.anthropic import AnthropicModelSettings
+
+Stage = Literal["classify", "draft", "summarize"]
+
+_latency_histogram = logfire.metric_histogram(
+    "llm.latency", unit="s", description="Agent run latency by stage, model and outcome"
+)
+_route_counter = logfire.metric_counter(
+    "llm.route", description="Routing decisions by stage, model and reason"
+)
+_input_tokens_counter = logfire.metric_counter(
+    "llm.input_tokens", description="Uncached input tokens by stage and model"
+)
+_cache_read_counter = logfire.metric_counter(
+    "llm.cache_read_tokens", description="Input tokens served from the provider prompt cache"
+)
+_cache_write_counter = logfire.metric_counter(
+    "llm.cache_write_tokens", description="Input tokens written to the provider prompt cache"
+)
+
+
+@dataclass
+class Route:
+    stage: Stage
+    models: list[str]
+    timeout: float
+    reason: str
+
+
+@cache
+def _anthropic_provider() -> Any:
+    from anthropic import AsyncAnthropic
+    from pydantic_ai.providers.anthropic import AnthropicProvider
+
+    # `llm_limiter` is the only retry layer; SDK retries would multiply its attempts
+    # and hold the concurrency slot through their backoff.
+    return AnthropicProvider(anthropic_client=AsyncAnthropic(max_retries=0))
+
+
+async def open_anthropic_connection() -> None:
+    """Put one connection in the Anthropic client's pool with a free request (listing
+    models), so the first message doesn't pay for the TLS handshake."""
+    await _anthropic_provider().client.models.list(limit=1)
+
+
+@cache
+def get_model(name: str) -> Model:
+    """Build each model (and its provider client) once and reuse it across runs."""
+    provider, _, model_name = name.partition(":")
+    if provider == "anthropic":
+        from pydantic_ai.models.anthropic import AnthropicModel
+
+        return AnthropicModel(model_name, provider=_anthropic_provider())
+    return infer_model(name)
+
+
+def prompt_cache_settings() -> "AnthropicModelSettings | None":
+    """Mark the system prompt and tool schemas as cacheable prefixes.
+
+    Providers other than Anthropic ignore these keys.
+    """
+    if not settings.prompt_caching:
+        return None
+    return {
+        "anthropic_cache_instructions": True,
+        "anthropic_cache_tool_definitions": True,
+    }
+
+
+def _record_usage(result: Any, attributes: dict[str, str]) -> None:
+    usage = result.usage()
+    if not isinstance(usage, RunUsage):
+        return
+
+    _input_tokens_counter.add(usage.input_tokens, attributes)
+    _cache_read_counter.add(usage.cache_read_tokens, attributes)
+    _cache_write_counter.add(usage.cache_write_tokens, attributes)
+    logfire.info(
+        "LLM usage",
+        input_tokens=usage.input_tokens,
+        cache_read_tokens=usage.cache_read_tokens,
+        cache_write_tokens=usage.cache_write_tokens,
+        output_tokens=usage.output_tokens,
+        **attributes,
+    )
+
+
+def _dedupe(models: list[str]) -> list[str]:
+    return list(dict.fromkeys(m for m in models if m))
+
+
+def route(stage: Stage, content: str, low_confidence: bool = False) -> Route:
+    if stage == "classify":
+        primary, fallback = settings.classifier_model, settings.classifier_fallback_model
+        timeout = settings.classify_timeout_seconds
+    elif stage == "summarize":
+        primary, fallback = settings.summary_model, ""
+        timeout = settings.summary_timeout_seconds
+    else:
+        primary, fallback = settings.draft_model, settings.draft_fallback_model
+        timeout = settings.draft_timeout_seconds
+
+    reason = "default"
+    if settings.escalation_model and stage == "draft":
+        if low_confidence:
+            reason = "low_confidence"
+        elif len(content) >= settings.escalation_min_chars:
+            reason = "long_message"
+
+    if reason != "default":
+        models = _dedupe([settings.escalation_model, primary, fallback])
+    else:
+        models = _dedupe([primary, fallback])
+
+    return Route(stage=stage, models=models, timeout=timeout, reason=reason)
+
+
+async def run_routed(
+    agent: Agent,
+    selected: Route,
+    prompt: Any,
+    *,
+    priority: Priority = Priority.NORMAL,
+    **kwargs: Any,
+) -> Any:
+    """Run `agent` on the routed models in order until one answers within the stage budget."""
+    estimated_tokens = estimate_tokens(prompt)
+    deadline: float | None = None
+    last_error: ModelHTTPError | None = None
+    reserve = selected.timeout * settings.route_fallback_share
+    later = len(selected.models) - 1
+
+    for position, model_name in enumerate(selected.models):
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        attributes = {"stage": selected.stage, "model": model_name}
+        # Held back for the models after this one, shrinking towards the last.
+        held_back = reserve * (later - position) / later if later else 0.0
+        start = 0.0
+
+        async def attempt(model_name: str = model_name, held_back: float = held_back) -> Any:
+            nonlocal start, deadline
+            start = time.perf_counter()
+            if deadline is None:
+                deadline = start + selected.timeout
+            return await asyncio.wait_for(
+                agent.run(prompt, model=get_model(model_name), **kwargs),
+                timeout=max(deadline - held_back - start, 0.0),
+            )
+
+        try:
+            result = await llm_limiter.run(attempt, priority, estimated_tokens)
+        except TimeoutError:
+            _latency_histogram.record(
+                time.perf_counter() - start, {**attributes, "outcome": "timeout"}
+            )
+            logfire.warn("LLM model over budget", timeout=selected.timeout, **attributes)
+            last_error = None
+            continue
+        except ModelHTTPError as e:
+            if not is_retryable(e):
+                raise
+            _latency_histogram.record(
+                time.perf_counter() - start, {**attributes, "outcome": "error"}
+            )
+            logfire.warn(
+                "LLM model unavailable, falling back",
+                status_code=e.status_code,
+                **attributes,
+            )
+            last_error = e
+            continue
+
+        _latency_histogram.record(time.perf_counter() - start, {**attributes, "outcome": "ok"})
+        _route_counter.add(1, {**attributes, "reason": selected.reason})
+        _record_usage(result, attributes)
+        return result
+
+    if last_error is not None:
+        raise last_error
+    raise TimeoutError(
+        f"All models for stage {selected.stage!r} exceeded the {selected.timeout}s budget"
+    )
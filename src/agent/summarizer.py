@@ -0,0 +1,35 @@
+import os
+
+import logfire
+from pydantic_ai import Agent
+
+from src.config import settings
+
+from .limiter import Priority
+from .prompts import SUMMARY_PROMPT
+from .routing import prompt_cache_settings, route, run_routed
+
+os.environ.setdefault("ANTHROPIC_API_KEY", settings.anthropic_api_key)
+
+_summarizer_agent: Agent[None, str] | None = None
+
+
+def get_summarizer_agent() -> Agent[None, str]:
+    global _summarizer_agent
+    if _summarizer_agent is None:
+        _summarizer_agent = Agent(
+            settings.summary_model,
+            system_prompt="You maintain concise running summaries of support conversations.",
+            model_settings=prompt_cache_settings(),
+        )
+    return _summarizer_agent
+
+
+async def summarize_conversation(summary: str | None, messages: str) -> str:
+    """Fold `messages` into the existing rolling `summary`."""
+    with logfire.span("summarize_conversation", chars=len(messages)):
+        prompt = SUMMARY_PROMPT.format(summary=summary or "(none yet)", messages=messages)
+        result = await run_routed(
+            get_summarizer_agent(), route("summarize", messages), prompt, priority=Priority.LOW
+        )
+        return result.output.strip()
@@ -1,9 +1,14 @@
+from typing import Any
+
 import logfire
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request
+import orjson
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import ValidationError
 
 from src.config import settings
-from src.services.handler import handle_incoming_message
-from src.whatsapp.models import ParsedMessage, WhatsAppWebhookPayload
+from src.services.queue import ingest_queue
+from src.whatsapp.models import ParsedMessage, WhatsAppValue
+from src.whatsapp.signature import verify_signature
 
 router = APIRouter(prefix="/webhook", tags=["webhook"])
 
@@ -21,54 +26,72 @@ async def verify_webhook(
     raise HTTPException(status_code=403, detail="Verification failed")
 
 
+def _message_values(data: Any) -> list[dict]:
+    """Pick out the raw `value` dicts that carry inbound messages.
+
+    Works on the decoded JSON directly so status receipts and other change types
+    are discarded without building any models.
+    """
+    values: list[dict] = []
+
+    for entry in data["entry"]:
+        for change in entry["changes"]:
+            if change.get("field") != "messages":
+                continue
+
+            value = change.get("value") or {}
+            if value.get("messages") and value.get("contacts"):
+                values.append(value)
+
+    return values
+
+
 @router.post("")
-async def receive_webhook(request: Request, background_tasks: BackgroundTasks) -> dict:
-    body = await request.json()
-    logfire.info("Webhook received", payload=body)
+async def receive_webhook(request: Request) -> dict:
+    body = await request.body()
+
+    if settings.wa_app_secret and not verify_signature(
+        body, request.headers.get("X-Hub-Signature-256"), settings.wa_app_secret
+    ):
+        logfire.warn("Webhook signature verification failed")
+        raise HTTPException(status_code=403, detail="Invalid signature")
 
     try:
-        payload = WhatsAppWebhookPayload.model_validate(body)
-    except Exception as e:
+        raw_values = _message_values(orjson.loads(body))
+        values = [WhatsAppValue.model_validate(v) for v in raw_values]
+    except (orjson.JSONDecodeError, ValidationError, KeyError, TypeError, AttributeError) as e:
         logfire.error("Failed to parse webhook payload", error=str(e))
         return {"status": "error", "message": "Invalid payload"}
 
-    messages: list[ParsedMessage] = []
+    messages: list[tuple[ParsedMessage, str]] = []
 
-    for entry in payload.entry:
-        for change in entry.changes:
-            if change.field != "messages":
-                continue
+    for value in values:
+        contacts_map = {c.wa_id: c.profile.name for c in value.contacts}
+        group_id = value.metadata.phone_number_id
 
-            value = change.value
-            if not value.messages or not value.contacts:
+        for msg in value.messages:
+            if msg.type != "text" or not msg.text:
                 continue
 
-            contacts_map = {c.wa_id: c.profile.name for c in value.contacts}
-            group_id = value.metadata.phone_number_id
-
-            for msg in value.messages:
-                if msg.type != "text" or not msg.text:
-                    continue
-
-                parsed = ParsedMessage(
-                    message_id=msg.id,
-                    from_phone=msg.from_,
-                    sender_name=contacts_map.get(msg.from_, "Unknown"),
-                    text=msg.text.body,
-                    timestamp=msg.timestamp,
-                )
-                messages.append(parsed)
-
-                background_tasks.add_task(
-                    handle_incoming_message,
-                    parsed=parsed,
-                    group_id=group_id,
-                )
-
-                logfire.info(
-                    "Message queued for processing",
-                    message_id=parsed.message_id,
-                    from_phone=parsed.from_phone,
-                )
+            parsed = ParsedMessage(
+                message_id=msg.id,
+                from_phone=msg.from_,
+                sender_name=contacts_map.get(msg.from_, "Unknown"),
+                text=msg.text.body,
+                timestamp=msg.timestamp,
+            )
+            messages.append((parsed, group_id))
+
+    # All or nothing: a non-2xx response makes Meta redeliver the whole webhook later,
+    # after the burst has drained, so none of its messages may have been queued.
+    if messages and not ingest_queue.submit_all(messages):
+        raise HTTPException(status_code=503, detail="Ingest queue full")
+
+    for parsed, _ in messages:
+        logfire.info(
+            "Message queued for processing",
+            message_id=parsed.message_id,
+            from_phone=parsed.from_phone,
+        )
 
     return {"status": "ok", "messages_received": len(messages)}
@@ -0,0 +1,73 @@
+import asyncio
+import time
+from typing import Any
+
+# (request, future for its result, enqueue time)
+Pending = tuple[Any, asyncio.Future, float]
+
+
+class WindowedBatcher:
+    """Collects concurrent requests and hands them to `_run` as one batch.
+
+    A batch is flushed after `window_ms` or once `max_size` requests are waiting,
+    whichever comes first. Subclasses implement `_run`, which must resolve every
+    future in the batch.
+    """
+
+    task_name = "batch"
+
+    def __init__(self, window_ms: int, max_size: int):
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self._pending: list[Pending] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._inflight: set[asyncio.Task] = set()
+
+    async def submit(self, request: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((request, future, time.monotonic()))
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._run(batch), name=self.task_name)
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+        # A batch cancelled on shutdown must not leave its callers waiting forever.
+        task.add_done_callback(lambda _: self._cancel_unresolved(batch))
+
+    @staticmethod
+    def _cancel_unresolved(batch: list[Pending]) -> None:
+        for _, future, _ in batch:
+            if not future.done():
+                future.cancel()
+
+    async def _run(self, batch: list[Pending]) -> None:
+        raise NotImplementedError
+
+    async def stop(self, timeout: float) -> None:
+        """Flush what is waiting, let batches finish for up to `timeout` seconds, then
+        cancel the rest."""
+        self._flush()
+        tasks = list(self._inflight)
+        if not tasks:
+            return
+
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
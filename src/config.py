@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -9,6 +11,7 @@ class Settings(BaseSettings):
     wa_business_account_id: str = ""
     wa_access_token: str = ""
     wa_verify_token: str = "personal-messaging-agent-verify"
+    wa_app_secret: str = ""
 
     # Phone Numbers
     work_phone: str = ""
@@ -18,6 +21,78 @@ class Settings(BaseSettings):
 
     # AI
     anthropic_api_key: str = ""
+    # "pipeline": classify, then draft. "combined": one structured classify-and-draft call.
+    agent_mode: Literal["pipeline", "combined"] = "pipeline"
+    # Pipeline mode only: run retrieval ("context") or retrieval plus drafting ("draft")
+    # concurrently with classification, cancelling it if the message is casual.
+    speculative_execution: Literal["off", "context", "draft"] = "off"
+
+    # Model routing: each stage tries its model, then its fallback if the first times out
+    # or keeps failing with rate-limit or overload errors, all within one stage timeout;
+    # ROUTE_FALLBACK_SHARE of it is held back for the fallback. Drafts escalate to
+    # ESCALATION_MODEL (when set) for low-confidence or long messages.
+    classifier_model: str = "anthropic:claude-haiku-4-5"
+    classifier_fallback_model: str = "anthropic:claude-sonnet-4-20250514"
+    draft_model: str = "anthropic:claude-sonnet-4-20250514"
+    draft_fallback_model: str = "anthropic:claude-haiku-4-5"
+    escalation_model: str = ""
+    escalation_min_chars: int = 1500
+    classify_timeout_seconds: float = 10.0
+    draft_timeout_seconds: float = 45.0
+    route_fallback_share: float = 0.3
+    local_classifier_enabled: bool = True
+    local_classifier_path: str = "models/local_classifier.json"
+    local_classifier_threshold: float = 0.9
+    classification_cache_size: int = 5_000
+    classification_cache_ttl_seconds: float = 24 * 3600.0
+    classification_cache_path: str = ""
+    # Provider-side caching of the system prompt, tool schemas and RAG context
+    prompt_caching: bool = True
+    # Micro-batching of LLM classifications under burst load (0 disables)
+    classify_batch_window_ms: int = 0
+    classify_batch_max_size: int = 16
+
+    # Semantic reuse of approved drafts for near-duplicate complaints
+    reply_cache_enabled: bool = True
+    reply_cache_threshold: float = 0.92
+    reply_cache_size: int = 500
+    reply_cache_ttl_seconds: float = 7 * 24 * 3600.0
+
+    # Recent conversation history added to draft prompts (budget 0 disables)
+    history_messages: int = 20
+    history_max_chars: int = 2_000_000
+    history_token_budget: int = 800
+    # Fold older messages into a rolling summary once this many are unsummarized
+    # (0 disables; keep it at or below history_messages)
+    summary_threshold: int = 12
+    summary_keep_recent: int = 6
+    summary_model: str = "anthropic:claude-haiku-4-5"
+    summary_timeout_seconds: float = 30.0
+    # Messages folded per summarizer call, and the wait before retrying a failed update
+    summary_batch_size: int = 60
+    summary_retry_seconds: float = 300.0
+
+    # Shared LLM limiter (0 disables the per-minute buckets)
+    llm_max_concurrency: int = 8
+    llm_requests_per_minute: int = 0
+    llm_tokens_per_minute: int = 0
+    llm_max_retries: int = 3
+    llm_retry_base_delay: float = 1.0
+    llm_retry_max_delay: float = 30.0
+
+    # Knowledge base: on-disk vector index (empty keeps it in memory), optionally opened
+    # read-only by serving instances that share a prebuilt index
+    chroma_path: str = ".chroma_db"
+    chroma_read_only: bool = False
+    # Cached search results per normalized query (0 disables); any write invalidates them
+    rag_search_cache_size: int = 1_000
+    rag_search_cache_ttl_seconds: float = 600.0
+    # Concurrent retrievals are embedded and searched together, in a worker thread
+    # (0 disables batching; each retrieval still runs in a worker thread)
+    rag_batch_window_ms: int = 5
+    rag_batch_max_size: int = 32
+    # Ingestion parser processes (0 = one per CPU)
+    rag_load_workers: int = 0
 
     # Database (Neon)
     database_url: str = ""
@@ -27,6 +102,22 @@ class Settings(BaseSettings):
 
     # App
     debug: bool = False
+    # Build agents, connection pools and the embedding model before reporting ready
+    warmup_enabled: bool = True
+
+    # Ingest queue
+    ingest_workers: int = 4
+    ingest_queue_size: int = 100
+    ingest_drain_timeout: float = 30.0
+
+    # Burst coalescing (0 disables; per-group overrides keyed by group_id)
+    coalesce_window_seconds: float = 0.0
+    coalesce_max_wait_seconds: float = 15.0
+    coalesce_group_windows: dict[str, float] = {}
+
+    # Webhook redelivery dedupe
+    dedupe_cache_size: int = 10_000
+    dedupe_ttl_seconds: float = 3600.0
 
 
 settings = Settings()
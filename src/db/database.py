@@ -1,3 +1,5 @@
+import logfire
+from sqlalchemy import inspect, text
 from sqlmodel import SQLModel, create_engine
 
 from src.config import settings
@@ -21,6 +23,69 @@ def get_engine():
 engine = get_engine()
 
 
+# Columns added to existing tables after their first release. create_all only creates
+# missing tables, so these are added with ALTER TABLE when absent.
+ADDED_COLUMNS = {"messages": {"label_source": "VARCHAR"}}
+
+
+def _add_missing_columns():
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {column["name"] for column in inspector.get_columns(table)}
+            for name, column_type in columns.items():
+                if name not in existing:
+                    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}"))
+
+
+def _make_message_ids_unique():
+    """Merge rows logged twice for one WhatsApp message id, then enforce uniqueness.
+
+    Tables created before `wa_message_id` became unique only have a plain index. The
+    earliest row of each duplicate set is kept and the others' actions are moved to it.
+    """
+    indexes = {index["name"]: index for index in inspect(engine).get_indexes("messages")}
+    index = indexes.get("ix_messages_wa_message_id")
+    if index is not None and index["unique"]:
+        return
+
+    merged = 0
+    with engine.begin() as connection:
+        duplicated = connection.execute(
+            text("SELECT wa_message_id FROM messages GROUP BY wa_message_id HAVING COUNT(*) > 1")
+        ).scalars()
+        for wa_message_id in list(duplicated):
+            keep, *extra = connection.execute(
+                text(
+                    "SELECT id FROM messages WHERE wa_message_id = :wa_message_id "
+                    "ORDER BY created_at, id"
+                ),
+                {"wa_message_id": wa_message_id},
+            ).scalars()
+            for duplicate in extra:
+                connection.execute(
+                    text(
+                        "UPDATE agent_actions SET message_id = :keep WHERE message_id = :duplicate"
+                    ),
+                    {"keep": keep, "duplicate": duplicate},
+                )
+                connection.execute(
+                    text("DELETE FROM messages WHERE id = :duplicate"), {"duplicate": duplicate}
+                )
+                merged += 1
+        if index is not None:
+            connection.execute(text("DROP INDEX ix_messages_wa_message_id"))
+        connection.execute(
+            text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ix_messages_wa_message_id "
+                "ON messages (wa_message_id)"
+            )
+        )
+    logfire.info("Made messages.wa_message_id unique", merged_duplicates=merged)
+
+
 def create_db_tables():
     if engine:
         SQLModel.metadata.create_all(engine)
+        _add_missing_columns()
+        _make_message_ids_unique()
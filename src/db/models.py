@@ -3,7 +3,7 @@ from datetime import datetime
 from enum import Enum
 from typing import TYPE_CHECKING, Any, Optional
 
-from sqlmodel import JSON, Column, Field, Relationship, SQLModel
+from sqlmodel import JSON, Column, Field, Relationship, SQLModel, UniqueConstraint
 
 
 class MessageType(str, Enum):
@@ -13,6 +13,15 @@ class MessageType(str, Enum):
     UNKNOWN = "unknown"
 
 
+class LabelSource(str, Enum):
+    """Who assigned a message's type; only LLM and human labels are used for training."""
+
+    RULE = "rule"
+    MODEL = "model"
+    LLM = "llm"
+    HUMAN = "human"
+
+
 class ActionType(str, Enum):
     DRAFT_REPLY = "draft_reply"
     FORWARD_DEV = "forward_dev"
@@ -31,13 +40,15 @@ class Message(SQLModel, table=True):
     __tablename__ = "messages"
 
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    wa_message_id: str = Field(index=True)
+    wa_message_id: str = Field(index=True, unique=True)
     group_id: str = Field(index=True)
     group_name: str | None = None
     sender_phone: str
     sender_name: str | None = None
     content: str
     message_type: MessageType = Field(default=MessageType.UNKNOWN)
+    # A LabelSource value; plain text so adding it to existing tables is a simple ALTER.
+    label_source: str | None = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     actions: list["AgentAction"] = Relationship(back_populates="message")
@@ -69,3 +80,17 @@ class ApprovalQueue(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     action: AgentAction = Relationship(back_populates="approval")
+
+
+class ConversationSummary(SQLModel, table=True):
+    __tablename__ = "conversation_summaries"
+    __table_args__ = (UniqueConstraint("group_id", "sender_phone"),)
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    group_id: str = Field(index=True)
+    sender_phone: str
+    summary: str
+    # created_at of the newest message folded into the summary
+    summarized_through: datetime
+    message_count: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
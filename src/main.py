@@ -1,12 +1,28 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
 import logfire
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 
+from src.agent.classifier import (
+    load_classification_cache,
+    save_classification_cache,
+    stop_batcher,
+)
 from src.api.webhooks import router as webhook_router
 from src.config import settings
 from src.db.database import create_db_tables
-from src.db.models import AgentAction, ApprovalQueue, Message  # noqa: F401
+from src.db.models import (  # noqa: F401
+    AgentAction,
+    ApprovalQueue,
+    ConversationSummary,
+    Message,
+)
+from src.rag import stop_retrieval_batcher
+from src.services.queue import ingest_queue
+from src.services.summaries import stop_summaries
+from src.warmup import is_ready, set_ready, warm_up
+from src.whatsapp.client import whatsapp_client
 
 if settings.logfire_token:
     logfire.configure(token=settings.logfire_token)
@@ -19,8 +35,26 @@ async def lifespan(app: FastAPI):
     logfire.info("Starting Personal Messaging Agent")
     create_db_tables()
     logfire.info("Database tables ready")
+    load_classification_cache()
+    ingest_queue.start()
+    # Warm up in the background: /health answers immediately, /ready once warm.
+    warmup = asyncio.create_task(warm_up(), name="warmup") if settings.warmup_enabled else None
+    if warmup is None:
+        set_ready(True)
     yield
     logfire.info("Shutting down Personal Messaging Agent")
+    set_ready(False)
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+        # Let it unwind before the clients it may be opening are closed.
+        with suppress(asyncio.CancelledError):
+            await warmup
+    await ingest_queue.stop(timeout=settings.ingest_drain_timeout)
+    await stop_batcher(timeout=settings.ingest_drain_timeout)
+    await stop_retrieval_batcher(timeout=settings.ingest_drain_timeout)
+    await stop_summaries(timeout=settings.ingest_drain_timeout)
+    await whatsapp_client.aclose()
+    save_classification_cache()
 
 
 app = FastAPI(
@@ -38,3 +72,10 @@ app.include_router(webhook_router)
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+
+@app.get("/ready")
+async def readiness_check():
+    if not is_ready():
+        raise HTTPException(status_code=503, detail="Warming up")
+    return {"status": "ready"}
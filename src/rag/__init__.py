@@ -1,5 +1,9 @@
+import asyncio
+
+from src.config import settings
+from src.rag.batching import RetrievalBatcher
 from src.rag.loader import Document, load_documents, load_docx, load_pdf
-from src.rag.store import add_documents, clear_store, initialize_store, search
+from src.rag.store import add_documents, clear_store, initialize_store, search, search_many
 
 __all__ = [
     "Document",
@@ -9,15 +13,44 @@ __all__ = [
     "initialize_store",
     "add_documents",
     "search",
+    "search_many",
     "clear_store",
     "get_context",
+    "aget_context",
+    "stop_retrieval_batcher",
 ]
 
+_batcher: RetrievalBatcher | None = None
 
-def get_context(query: str) -> str:
-    chunks = search(query, k=3)
 
-    if not chunks:
-        return ""
+def get_retrieval_batcher() -> RetrievalBatcher | None:
+    global _batcher
+    if _batcher is None and settings.rag_batch_window_ms > 0:
+        _batcher = RetrievalBatcher(
+            search_many,
+            window_ms=settings.rag_batch_window_ms,
+            max_size=settings.rag_batch_max_size,
+        )
+    return _batcher
+
+
+async def stop_retrieval_batcher(timeout: float) -> None:
+    if _batcher is not None:
+        await _batcher.stop(timeout)
+
 
+def _format_context(chunks: list[str]) -> str:
+    # Most relevant first.
     return "\n\n---\n\n".join(chunks)
+
+
+def get_context(query: str) -> str:
+    return _format_context(search(query, k=3))
+
+
+async def aget_context(query: str) -> str:
+    """`get_context` off the event loop; concurrent callers share one embedding batch."""
+    batcher = get_retrieval_batcher()
+    if batcher is None:
+        return await asyncio.to_thread(get_context, query)
+    return _format_context(await batcher.search(query, k=3))
@@ -0,0 +1,61 @@
+import asyncio
+import time
+from collections.abc import Callable
+
+import logfire
+
+from src.batching import WindowedBatcher
+
+_batch_size_histogram = logfire.metric_histogram(
+    "rag.batch_size", description="Queries per batched retrieval"
+)
+_batch_wait_histogram = logfire.metric_histogram(
+    "rag.batch_wait", unit="s", description="Time a query waited for its batch to flush"
+)
+
+SearchMany = Callable[[list[str], int], list[list[str]]]
+
+
+class RetrievalBatcher(WindowedBatcher):
+    """Collects concurrent retrievals into one `search_many` call in a worker thread.
+
+    A batch is flushed after `window_ms` or once `max_size` queries are waiting,
+    whichever comes first. The query embeddings of a batch are computed together,
+    and neither embedding nor the vector search runs on the event loop.
+    """
+
+    task_name = "retrieval-batch"
+
+    def __init__(self, search_many: SearchMany, window_ms: int, max_size: int):
+        super().__init__(window_ms, max_size)
+        self.search_many = search_many
+
+    async def search(self, query: str, k: int = 3) -> list[str]:
+        return await self.submit((query, k))
+
+    async def _run(
+        self, batch: list[tuple[tuple[str, int], asyncio.Future[list[str]], float]]
+    ) -> None:
+        flushed_at = time.monotonic()
+        _batch_size_histogram.record(len(batch))
+        for _, _, enqueued_at in batch:
+            _batch_wait_histogram.record(flushed_at - enqueued_at)
+
+        by_k: dict[int, list[tuple[str, asyncio.Future[list[str]]]]] = {}
+        for (query, k), future, _ in batch:
+            by_k.setdefault(k, []).append((query, future))
+
+        with logfire.span("retrieval_batch", size=len(batch)):
+            for k, requests in by_k.items():
+                queries = [query for query, _ in requests]
+                try:
+                    results = await asyncio.to_thread(self.search_many, queries, k)
+                except Exception as e:
+                    for _, future in requests:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+
+                for (_, future), result in zip(requests, results):
+                    if not future.done():
+                        future.set_result(result)
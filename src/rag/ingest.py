@@ -0,0 +1,218 @@
+"""Incremental ingestion of the knowledge base into the vector store.
+
+Chunk ids are derived from the file name and chunk text (`store.chunk_id`), and
+every chunk records the sha256 of the file it came from. A sync compares the
+files on disk with that manifest:
+
+- unchanged files are not parsed at all
+- changed files are re-parsed; only chunks whose text is new are embedded, the
+  rest just get their metadata updated, and chunks that are gone are deleted
+- chunks of files that no longer exist are deleted
+
+so re-indexing costs work proportional to what changed, not to the corpus.
+
+Changed files are parsed in a process pool; one that fails to parse is reported
+and skipped without aborting the batch.
+
+    python -m src.rag.ingest docs/
+    python -m src.rag.ingest docs/ --rebuild     # drop the collection and embed everything
+    python -m src.rag.ingest docs/ --workers 8   # parser processes (default: one per CPU)
+"""
+
+import argparse
+import hashlib
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import logfire
+
+from src.config import settings
+from src.rag.loader import LOADERS, Document, iter_load_files
+from src.rag.store import (
+    add_documents,
+    chunk_id,
+    clear_store,
+    delete_documents,
+    initialize_store,
+    update_metadata,
+)
+
+
+@dataclass
+class IndexedFile:
+    file_hash: str
+    chunk_ids: set[str] = field(default_factory=set)
+
+
+@dataclass
+class IngestReport:
+    added: list[str] = field(default_factory=list)
+    updated: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+    unchanged: int = 0
+    chunks_embedded: int = 0
+    chunks_deleted: int = 0
+    # Parse time per re-loaded file, in seconds
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest() -> dict[str, IndexedFile]:
+    """What is indexed per source file, read back from the chunk metadata.
+
+    Reading it from the collection keeps it consistent with the index by
+    construction. Chunks added without a file hash count as stale and are replaced
+    on the next sync. So does a file whose chunks disagree on the hash, which an
+    interrupted sync can leave behind.
+    """
+    result = initialize_store().get(include=["metadatas"])
+    manifest: dict[str, IndexedFile] = {}
+
+    for id_, metadata in zip(result["ids"], result["metadatas"] or []):
+        metadata = metadata or {}
+        source = str(metadata.get("source", "unknown"))
+        digest = str(metadata.get("file_hash", ""))
+        entry = manifest.setdefault(source, IndexedFile(digest))
+        if entry.file_hash != digest:
+            entry.file_hash = ""
+        entry.chunk_ids.add(id_)
+
+    return manifest
+
+
+def _sync_file(
+    path: Path,
+    digest: str,
+    docs: list[Document],
+    indexed: IndexedFile | None,
+    report: IngestReport,
+) -> None:
+    chunks = {}
+    for doc in docs:
+        doc.metadata["file_hash"] = digest
+        chunks.setdefault(chunk_id(path.name, doc.content), doc)
+
+    existing = indexed.chunk_ids if indexed else set()
+    new = [doc for id_, doc in chunks.items() if id_ not in existing]
+    kept = [id_ for id_ in chunks if id_ in existing]
+    stale = sorted(existing - chunks.keys())
+
+    add_documents(new)
+    update_metadata(kept, [chunks[id_].metadata for id_ in kept])
+    delete_documents(stale)
+
+    report.chunks_embedded += len(new)
+    report.chunks_deleted += len(stale)
+    (report.updated if indexed else report.added).append(path.name)
+
+
+def sync_directory(
+    docs_dir: str, rebuild: bool = False, workers: int | None = None
+) -> IngestReport:
+    """Bring the index in line with `docs_dir`, parsing changed files in `workers` processes.
+
+    `workers` defaults to RAG_LOAD_WORKERS (0: one per CPU). A file that fails to
+    parse is reported in `failed` and keeps whatever it had indexed before.
+    """
+    if workers is None:
+        workers = settings.rag_load_workers
+    workers = workers or os.cpu_count() or 1
+
+    docs_path = Path(docs_dir)
+    if not docs_path.is_dir():
+        # Treating a mistyped path as "every file was deleted" would empty the index.
+        raise FileNotFoundError(f"Documents directory not found: {docs_dir}")
+
+    with logfire.span(
+        "Sync knowledge base", docs_dir=docs_dir, rebuild=rebuild, workers=workers
+    ) as span:
+        if rebuild:
+            clear_store()
+
+        manifest = load_manifest()
+        report = IngestReport()
+        present: set[str] = set()
+        changed: dict[Path, str] = {}
+
+        for path in sorted(docs_path.iterdir()):
+            if not path.is_file() or path.suffix.lower() not in LOADERS:
+                continue
+
+            present.add(path.name)
+            digest = file_hash(path)
+            indexed = manifest.get(path.name)
+            if indexed and indexed.file_hash == digest:
+                report.unchanged += 1
+                continue
+            changed[path] = digest
+
+        # Parsed in parallel, but applied in directory order as results stream back.
+        for result in iter_load_files(changed, workers):
+            source = result.path.name
+            report.timings[source] = round(result.seconds, 3)
+            if result.error:
+                report.failed[source] = result.error
+                logfire.warn("Failed to load document", source=source, error=result.error)
+                continue
+
+            _sync_file(
+                result.path, changed[result.path], result.documents, manifest.get(source), report
+            )
+
+        for source in sorted(manifest.keys() - present):
+            stale = sorted(manifest[source].chunk_ids)
+            delete_documents(stale)
+            report.chunks_deleted += len(stale)
+            report.removed.append(source)
+
+        logfire.info(
+            "Knowledge base synced",
+            added=len(report.added),
+            updated=len(report.updated),
+            removed=len(report.removed),
+            failed=len(report.failed),
+            unchanged=report.unchanged,
+            chunks_embedded=report.chunks_embedded,
+            chunks_deleted=report.chunks_deleted,
+        )
+        span.set_attribute("timings", report.timings)
+
+    return report
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Index PDF/DOCX files into the vector store")
+    parser.add_argument("docs_dir", help="Directory with the knowledge base documents")
+    parser.add_argument(
+        "--rebuild", action="store_true", help="Drop the collection and embed every file"
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Parser processes (default: RAG_LOAD_WORKERS, 0 = per CPU)"
+    )
+    args = parser.parse_args(argv)
+
+    report = sync_directory(args.docs_dir, rebuild=args.rebuild, workers=args.workers)
+
+    for source, seconds in report.timings.items():
+        status = "FAILED " + report.failed[source] if source in report.failed else "ok"
+        print(f"  {seconds:8.3f}s  {source}  {status}")
+
+    print(f"added:     {len(report.added)} files")
+    print(f"updated:   {len(report.updated)} files")
+    print(f"removed:   {len(report.removed)} files")
+    print(f"unchanged: {report.unchanged} files")
+    print(f"failed:    {len(report.failed)} files")
+    print(f"chunks embedded: {report.chunks_embedded}, deleted: {report.chunks_deleted}")
+
+
+if __name__ == "__main__":
+    main()
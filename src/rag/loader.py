@@ -1,8 +1,11 @@
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
 
-from docx import Document as DocxDocument
+import logfire
 from pydantic import BaseModel
-from pypdf import PdfReader
 
 
 class Document(BaseModel):
@@ -14,81 +17,155 @@ CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
 
 
-def _chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list[str]:
-    if not text.strip():
-        return []
-
-    chunks = []
-    start = 0
-    text_length = len(text)
+def iter_chunks(
+    pieces: Iterable[str], chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP
+) -> Iterator[str]:
+    """Chunk a stream of text pieces lazily, exactly as `_chunk_text` chunks their concatenation.
+
+    Windows of `chunk_size` characters start every `chunk_size - overlap`
+    characters. Only the text from the current window start onwards is buffered,
+    so memory is bounded by the chunk size plus the largest piece, not by the
+    document.
+    """
+    step = chunk_size - overlap
+    buffer = ""
+    offset = 0  # position of buffer[0] in the whole text
+    start = 0  # position of the next window
+
+    for piece in pieces:
+        buffer = buffer[start - offset :] + piece
+        offset = start
+        end = offset + len(buffer)
+
+        while start + chunk_size <= end:
+            chunk = buffer[start - offset : start - offset + chunk_size].strip()
+            if chunk:
+                yield chunk
+            start += step
+
+    # The last windows may run past the end of the text.
+    end = offset + len(buffer)
+    while start < end:
+        chunk = buffer[start - offset : start - offset + chunk_size].strip()
+        if chunk:
+            yield chunk
+        start += step
 
-    while start < text_length:
-        end = start + chunk_size
-        chunk = text[start:end]
 
-        if chunk.strip():
-            chunks.append(chunk.strip())
-
-        start = end - overlap
-        if start >= text_length:
-            break
+def _chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list[str]:
+    return list(iter_chunks([text], chunk_size, overlap))
 
-    return chunks
 
+def iter_pdf_text(file_path: str) -> Iterator[str]:
+    # Parsers are only needed for offline ingestion; keep them off the serving import path.
+    from pypdf import PdfReader
 
-def load_pdf(file_path: str) -> list[str]:
     reader = PdfReader(file_path)
-    full_text = ""
-
     for page in reader.pages:
         page_text = page.extract_text()
         if page_text:
-            full_text += page_text + "\n"
+            yield page_text + "\n"
 
-    return _chunk_text(full_text)
 
+def iter_docx_text(file_path: str) -> Iterator[str]:
+    from docx import Document as DocxDocument
+    from docx.oxml.ns import qn
+    from docx.text.paragraph import Paragraph
 
-def load_docx(file_path: str) -> list[str]:
     doc = DocxDocument(file_path)
-    full_text = ""
-
-    for paragraph in doc.paragraphs:
+    # Same paragraphs as `doc.paragraphs`, without building a list of all of them.
+    for element in doc.element.body.iterchildren(qn("w:p")):
+        paragraph = Paragraph(element, doc)
         if paragraph.text.strip():
-            full_text += paragraph.text + "\n"
+            yield paragraph.text + "\n"
 
-    return _chunk_text(full_text)
 
+READERS = {".pdf": iter_pdf_text, ".docx": iter_docx_text, ".doc": iter_docx_text}
 
-def load_documents(docs_dir: str) -> list[Document]:
+
+def iter_file_chunks(file_path: Path) -> Iterator[str]:
+    """Stream a file's chunks page by page (PDF) or paragraph by paragraph (DOCX)."""
+    reader = READERS.get(file_path.suffix.lower())
+    if reader is None:
+        return iter(())
+    return iter_chunks(reader(str(file_path)))
+
+
+def load_pdf(file_path: str) -> list[str]:
+    return list(iter_chunks(iter_pdf_text(file_path)))
+
+
+def load_docx(file_path: str) -> list[str]:
+    return list(iter_chunks(iter_docx_text(file_path)))
+
+
+LOADERS = {".pdf": load_pdf, ".docx": load_docx, ".doc": load_docx}
+
+
+def load_file(file_path: Path) -> list[Document]:
+    return [
+        Document(
+            content=chunk,
+            metadata={
+                "source": file_path.name,
+                "chunk_index": str(i),
+            },
+        )
+        for i, chunk in enumerate(iter_file_chunks(file_path))
+    ]
+
+
+@dataclass
+class LoadResult:
+    path: Path
+    documents: list[Document] = field(default_factory=list)
+    seconds: float = 0.0
+    error: str | None = None
+
+
+def _load_timed(file_path: Path) -> LoadResult:
+    started = time.perf_counter()
+    try:
+        documents = load_file(file_path)
+    except Exception as e:
+        # One corrupt file must not abort the rest of the batch.
+        return LoadResult(file_path, seconds=time.perf_counter() - started, error=repr(e))
+    return LoadResult(file_path, documents, seconds=time.perf_counter() - started)
+
+
+def iter_load_files(paths: Iterable[Path], workers: int = 1) -> Iterator[LoadResult]:
+    """Parse files, in a process pool when `workers` > 1, yielding results in input order.
+
+    PDF text extraction is CPU-bound, so processes rather than threads. Results
+    stream back as soon as every earlier file is done; a failed file (or a
+    crashed worker) is reported in its result instead of raising.
+    """
+    paths = list(paths)
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield _load_timed(path)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as executor:
+        futures = [executor.submit(_load_timed, path) for path in paths]
+        for path, future in zip(paths, futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield LoadResult(path, error=repr(e))
+
+
+def load_documents(docs_dir: str, workers: int = 1) -> list[Document]:
     docs_path = Path(docs_dir)
     documents: list[Document] = []
 
     if not docs_path.exists():
         return documents
 
-    for file_path in docs_path.iterdir():
-        if not file_path.is_file():
-            continue
-
-        suffix = file_path.suffix.lower()
-        chunks: list[str] = []
-
-        if suffix == ".pdf":
-            chunks = load_pdf(str(file_path))
-        elif suffix in (".docx", ".doc"):
-            chunks = load_docx(str(file_path))
-        else:
-            continue
-
-        for i, chunk in enumerate(chunks):
-            documents.append(
-                Document(
-                    content=chunk,
-                    metadata={
-                        "source": file_path.name,
-                        "chunk_index": str(i),
-                    },
-                )
-            )
+    paths = [p for p in sorted(docs_path.iterdir()) if p.is_file() and p.suffix.lower() in LOADERS]
+    for result in iter_load_files(paths, workers):
+        if result.error:
+            logfire.warn("Failed to load document", source=result.path.name, error=result.error)
+        documents.extend(result.documents)
 
     return documents
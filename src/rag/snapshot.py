@@ -0,0 +1,112 @@
+"""Snapshots of the on-disk vector index.
+
+Build the index once, snapshot it, and restore the snapshot when a new container
+starts. The first retrieval then only opens the index instead of re-embedding
+the whole corpus.
+
+    python -m src.rag.ingest docs/
+    python -m src.rag.snapshot save index.tar.gz
+    python -m src.rag.snapshot restore index.tar.gz --if-missing
+
+Save while no ingestion is running, and restore before the app opens the index.
+"""
+
+import argparse
+import os
+import shutil
+import tarfile
+import tempfile
+from pathlib import Path
+
+import logfire
+
+from src.config import settings
+
+# Written by chromadb's PersistentClient in every index directory.
+INDEX_FILE = "chroma.sqlite3"
+
+
+def _index_dir(path: str | None) -> Path:
+    path = path or settings.chroma_path
+    if not path:
+        raise ValueError("CHROMA_PATH is empty: the vector store is in memory")
+    return Path(path)
+
+
+def has_index(path: str | None = None) -> bool:
+    return (_index_dir(path) / INDEX_FILE).exists()
+
+
+def save_snapshot(snapshot: str, path: str | None = None) -> int:
+    """Write the index directory to a .tar.gz and return its size in bytes."""
+    source = _index_dir(path)
+    if not has_index(str(source)):
+        raise FileNotFoundError(f"No vector index at {source}")
+
+    partial = f"{snapshot}.partial"
+    with tarfile.open(partial, "w:gz") as tar:
+        tar.add(source, arcname=".")
+    os.replace(partial, snapshot)
+
+    size = os.path.getsize(snapshot)
+    logfire.info("Vector index snapshot saved", path=str(source), snapshot=snapshot, bytes=size)
+    return size
+
+
+def restore_snapshot(snapshot: str, path: str | None = None, if_missing: bool = False) -> bool:
+    """Replace the index directory with a snapshot. Returns False if skipped.
+
+    The snapshot is unpacked next to the index and swapped in with renames, so an
+    interrupted restore never leaves a half-written index behind.
+    """
+    target = _index_dir(path)
+    if if_missing and has_index(str(target)):
+        return False
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=f".{target.name}-restore-", dir=target.parent))
+    previous = target.with_name(f"{target.name}.previous")
+    try:
+        with tarfile.open(snapshot) as tar:
+            tar.extractall(staging, filter="data")
+        if not (staging / INDEX_FILE).exists():
+            raise ValueError(f"{snapshot} is not a vector index snapshot")
+
+        shutil.rmtree(previous, ignore_errors=True)
+        if target.exists():
+            target.rename(previous)
+        staging.rename(target)
+        shutil.rmtree(previous, ignore_errors=True)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    logfire.info("Vector index snapshot restored", path=str(target), snapshot=snapshot)
+    return True
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Save or restore the on-disk vector index")
+    parser.add_argument("--path", help="Index directory (default: CHROMA_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    save = commands.add_parser("save", help="Write the index to a .tar.gz snapshot")
+    save.add_argument("snapshot")
+
+    restore = commands.add_parser("restore", help="Replace the index with a snapshot")
+    restore.add_argument("snapshot")
+    restore.add_argument(
+        "--if-missing", action="store_true", help="Keep an index that already exists"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "save":
+        size = save_snapshot(args.snapshot, args.path)
+        print(f"saved {args.snapshot} ({size / 1e6:.1f} MB)")
+    elif restore_snapshot(args.snapshot, args.path, if_missing=args.if_missing):
+        print(f"restored {args.snapshot}")
+    else:
+        print("index already present, not restored")
+
+
+if __name__ == "__main__":
+    main()
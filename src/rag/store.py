@@ -1,71 +1,226 @@
-import chromadb
-from chromadb.config import Settings
+import hashlib
+import threading
+import time
+from typing import TYPE_CHECKING
 
+import logfire
+
+from src.cache import TTLCache
+from src.config import settings
 from src.rag.loader import Document
 
+if TYPE_CHECKING:
+    # chromadb takes most of a second to import; the server loads it on first use
+    # (or during warmup) instead of at startup.
+    import chromadb
+    from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
 COLLECTION_NAME = "prb_documents"
-PERSIST_DIRECTORY = ".chroma_db"
 
-_client: chromadb.ClientAPI | None = None
-_collection: chromadb.Collection | None = None
+_client: "chromadb.ClientAPI | None" = None
+_collection: "chromadb.Collection | None" = None
+_embedding_function: "DefaultEmbeddingFunction | None" = None
+
+# Bumped after every write to the collection. Cached searches and the cached count
+# are tagged with the generation they were computed in, so a write makes them stale.
+_generation = 0
+_count: tuple[int, int] | None = None  # (generation, collection.count())
+
+_search_cache = TTLCache(
+    maxsize=settings.rag_search_cache_size,
+    ttl=settings.rag_search_cache_ttl_seconds,
+)
+# search() also runs in worker threads. Guards the cache, _generation and _count.
+_search_lock = threading.Lock()
+
+_search_counter = logfire.metric_counter(
+    "rag.searches", description="Vector store searches by outcome: cache hit or miss"
+)
+_search_histogram = logfire.metric_histogram(
+    "rag.search_time", unit="s", description="Vector store search latency, including cache hits"
+)
+
+
+def get_embedding_function() -> "DefaultEmbeddingFunction":
+    """Shared embedding model; the ONNX weights load on the first call."""
+    global _embedding_function
+    if _embedding_function is None:
+        from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+        _embedding_function = DefaultEmbeddingFunction()
+    return _embedding_function
 
 
-def initialize_store() -> chromadb.Collection:
+def initialize_store() -> "chromadb.Collection":
     global _client, _collection
 
     if _collection is not None:
         return _collection
 
-    _client = chromadb.Client(
-        Settings(
-            persist_directory=PERSIST_DIRECTORY,
-            anonymized_telemetry=False,
+    import chromadb
+    from chromadb.config import Settings
+    from chromadb.errors import NotFoundError
+
+    from src.rag.snapshot import has_index
+
+    if settings.chroma_read_only and not (settings.chroma_path and has_index()):
+        # Opening a PersistentClient on a missing index would create one.
+        raise RuntimeError(
+            f"No vector index at {settings.chroma_path!r} (CHROMA_READ_ONLY=true); "
+            "run ingestion or restore a snapshot"
         )
-    )
 
-    _collection = _client.get_or_create_collection(
-        name=COLLECTION_NAME,
-        metadata={"hnsw:space": "cosine"},
-    )
+    client_settings = Settings(anonymized_telemetry=False)
+    if settings.chroma_path:
+        # On disk: the index survives restarts, so a new instance only opens it.
+        _client = chromadb.PersistentClient(path=settings.chroma_path, settings=client_settings)
+    else:
+        _client = chromadb.EphemeralClient(settings=client_settings)
+
+    if settings.chroma_read_only:
+        try:
+            _collection = _client.get_collection(
+                name=COLLECTION_NAME, embedding_function=get_embedding_function()
+            )
+        except NotFoundError:
+            raise RuntimeError(
+                f"Vector index at {settings.chroma_path!r} has no {COLLECTION_NAME!r} "
+                "collection (CHROMA_READ_ONLY=true); run ingestion or restore a snapshot"
+            ) from None
+    else:
+        _collection = _client.get_or_create_collection(
+            name=COLLECTION_NAME,
+            metadata={"hnsw:space": "cosine"},
+            embedding_function=get_embedding_function(),
+        )
 
+    _bump_generation()
     return _collection
 
 
+def chunk_id(source: str, content: str) -> str:
+    """Stable id for a chunk: the same text from the same file always gets the same id."""
+    return hashlib.sha256(f"{source}\0{content}".encode()).hexdigest()[:32]
+
+
+def _bump_generation() -> None:
+    global _generation
+    with _search_lock:
+        _generation += 1
+
+
+def _check_writable() -> None:
+    if settings.chroma_read_only:
+        raise RuntimeError("Vector store is read-only (CHROMA_READ_ONLY=true)")
+
+
 def add_documents(docs: list[Document]) -> None:
     if not docs:
         return
 
+    _check_writable()
     collection = initialize_store()
 
-    ids = [f"doc_{i}_{doc.metadata.get('source', 'unknown')}" for i, doc in enumerate(docs)]
-    contents = [doc.content for doc in docs]
-    metadatas = [doc.metadata for doc in docs]
+    # Upsert by content-addressed id, so adding a chunk again replaces it instead of
+    # duplicating it. Identical chunks from the same file collapse into one.
+    unique = {chunk_id(doc.metadata.get("source", "unknown"), doc.content): doc for doc in docs}
 
-    collection.add(
-        ids=ids,
-        documents=contents,
-        metadatas=metadatas,
+    collection.upsert(
+        ids=list(unique),
+        documents=[doc.content for doc in unique.values()],
+        metadatas=[doc.metadata for doc in unique.values()],
     )
+    _bump_generation()
 
 
-def search(query: str, k: int = 3) -> list[str]:
-    collection = initialize_store()
+def update_metadata(ids: list[str], metadatas: list[dict[str, str]]) -> None:
+    """Change chunk metadata in place, without re-embedding the chunks."""
+    if ids:
+        _check_writable()
+        initialize_store().update(ids=ids, metadatas=metadatas)
 
-    if collection.count() == 0:
-        return []
 
-    results = collection.query(
-        query_texts=[query],
-        n_results=min(k, collection.count()),
-    )
+def delete_documents(ids: list[str]) -> None:
+    if ids:
+        _check_writable()
+        initialize_store().delete(ids=ids)
+        _bump_generation()
+
+
+def _collection_count(collection: "chromadb.Collection", generation: int) -> int:
+    global _count
+    with _search_lock:
+        cached = _count
+    if cached is not None and cached[0] == generation:
+        return cached[1]
 
-    documents = results.get("documents", [[]])
-    return documents[0] if documents else []
+    count = collection.count()
+    with _search_lock:
+        _count = (generation, count)
+    return count
+
+
+def _query_key(query: str, k: int, generation: int) -> tuple[int, int, str]:
+    return generation, k, " ".join(query.lower().split())
+
+
+def search(query: str, k: int = 3) -> list[str]:
+    return search_many([query], k)[0]
+
+
+def search_many(queries: list[str], k: int = 3) -> list[list[str]]:
+    """Top-k chunk texts per query. Cache misses are embedded and queried in one batch."""
+    started = time.perf_counter()
+    # Opened first: opening bumps the generation, which must not happen after it is read.
+    collection = initialize_store()
+    with _search_lock:
+        generation = _generation
+        keys = [_query_key(query, k, generation) for query in queries]
+        found = {key: _search_cache.get(key) for key in keys}
+    # Identical normalized queries in one batch are only looked up once.
+    misses: dict[tuple[int, int, str], str] = {}
+    for key, query in zip(keys, queries):
+        if found[key] is None:
+            misses.setdefault(key, query)
+    _search_counter.add(len(queries) - len(misses), {"outcome": "hit"})
+    _search_counter.add(len(misses), {"outcome": "miss"})
+
+    if misses:
+        count = _collection_count(collection, generation)
+        for key in misses:
+            found[key] = ([], [])
+
+        if count:
+            results = collection.query(query_texts=list(misses.values()), n_results=min(k, count))
+            for key, ids, documents in zip(misses, results["ids"], results["documents"] or []):
+                found[key] = (ids, documents)
+
+        with _search_lock:
+            for key in misses:
+                _search_cache.set(key, found[key])
+
+    _search_histogram.record(time.perf_counter() - started, {"cached": not misses})
+    return [list(found[key][1]) for key in keys]
+
+
+def search_cache_stats() -> dict:
+    stats = _search_cache.stats
+    return {
+        "size": len(_search_cache),
+        "generation": _generation,
+        "hits": stats.hits,
+        "misses": stats.misses,
+        "evictions": stats.evictions,
+        "hit_rate": stats.hit_rate,
+    }
 
 
 def clear_store() -> None:
     global _collection, _client
 
-    if _client is not None:
-        _client.delete_collection(COLLECTION_NAME)
-        _collection = None
+    _check_writable()
+    # Opened first so that a fresh process can also clear an index already on disk.
+    initialize_store()
+    _client.delete_collection(COLLECTION_NAME)
+    _collection = None
+    _bump_generation()
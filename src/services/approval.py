@@ -6,6 +6,7 @@ from sqlmodel import Session, select
 
 from src.db.database import engine
 from src.db.models import ActionStatus, ActionType, AgentAction, ApprovalQueue, Message
+from src.services.reply_cache import remember_approved_draft
 
 
 async def create_approval_request(
@@ -13,16 +14,26 @@ async def create_approval_request(
     draft_reply: str,
     target_group: str,
     expires_hours: int = 24,
+    wa_message_ids: list[str] | None = None,
+    reused_from: str | None = None,
 ) -> ApprovalQueue | None:
     if not engine:
         logfire.warn("Database not configured")
         return None
 
+    action_data = {"draft": draft_reply, "target": target_group}
+    if wa_message_ids:
+        # A coalesced burst spans several WhatsApp messages; keep them all linked.
+        action_data["wa_message_ids"] = wa_message_ids
+    if reused_from:
+        # Draft came from the reply cache: the id of the approved action it copies.
+        action_data["reused_from"] = reused_from
+
     with Session(engine) as session:
         action = AgentAction(
             message_id=message.id,
             action_type=ActionType.DRAFT_REPLY,
-            action_data={"draft": draft_reply, "target": target_group},
+            action_data=action_data,
             status=ActionStatus.PENDING_APPROVAL,
         )
         session.add(action)
@@ -83,7 +94,11 @@ async def approve_action(approval_id: uuid.UUID) -> AgentAction | None:
         session.refresh(action)
 
         logfire.info("Action approved", action_id=str(action.id))
-        return action
+        message = session.get(Message, action.message_id)
+
+    if message:
+        await remember_approved_draft(action, message.content)
+    return action
 
 
 async def reject_action(approval_id: uuid.UUID) -> AgentAction | None:
@@ -123,4 +138,8 @@ async def mark_action_sent(action_id: uuid.UUID) -> AgentAction | None:
         session.refresh(action)
 
         logfire.info("Action marked as sent", action_id=str(action.id))
-        return action
+        message = session.get(Message, action.message_id)
+
+    if message:
+        await remember_approved_draft(action, message.content)
+    return action
@@ -1,51 +1,171 @@
+import asyncio
+
 import logfire
 
-from src.agent import classify_message, process_message
+from src.agent import (
+    AgentResponse,
+    Priority,
+    classify_locally,
+    classify_with_source,
+    fallback_classification,
+    process_message,
+    triage_message,
+)
+from src.agent.prompts import HOLDING_REPLY
+from src.cache import TTLCache
 from src.config import settings
-from src.db.models import MessageType
-from src.rag import get_context
+from src.db.models import ActionType, LabelSource, Message, MessageType
+from src.rag import aget_context
 from src.services.approval import create_approval_request
-from src.services.tracking import log_action, log_message
+from src.services.history import get_history_prompt
+from src.services.reply_cache import find_cached_reply
+from src.services.tracking import log_action, log_message, update_message_type
 from src.whatsapp.client import whatsapp_client
-from src.whatsapp.models import ParsedMessage
-from src.db.models import ActionType
+from src.whatsapp.models import ParsedMessage, coalesce_messages
 
+_speculation_counter = logfire.metric_counter(
+    "handler.speculation", description="Speculative retrieval/draft runs by outcome"
+)
 
-async def handle_incoming_message(parsed: ParsedMessage, group_id: str, group_name: str | None = None):
-    with logfire.span("handle_incoming_message", message_id=parsed.message_id):
-        message_type = await classify_message(parsed.text)
+# In-memory front for the unique wa_message_id constraint, so retry storms are
+# dropped without a DB round trip.
+_recent_message_ids = TTLCache(
+    maxsize=settings.dedupe_cache_size,
+    ttl=settings.dedupe_ttl_seconds,
+)
 
-        message = await log_message(
-            wa_message_id=parsed.message_id,
-            group_id=group_id,
-            sender_phone=parsed.from_phone,
-            sender_name=parsed.sender_name,
-            content=parsed.text,
-            message_type=message_type,
-        )
 
-        if not message:
-            logfire.warn("Failed to log message")
+async def handle_incoming_message(
+    parsed: ParsedMessage, group_id: str, group_name: str | None = None
+):
+    with logfire.span(
+        "handle_incoming_message",
+        message_id=parsed.message_id,
+        parts=len(parsed.message_ids),
+        agent_mode=settings.agent_mode,
+    ):
+        fresh = [
+            part for part in parsed.parts or [parsed] if _recent_message_ids.add(part.message_id)
+        ]
+        if not fresh:
+            logfire.info("Duplicate message skipped", wa_message_id=parsed.message_id)
+            return
+
+        # Log before any LLM work: the insert doubles as the durable dedupe check.
+        logged: list[tuple[ParsedMessage, Message]] = []
+        for part in fresh:
+            row = await log_message(
+                wa_message_id=part.message_id,
+                group_id=group_id,
+                group_name=group_name,
+                sender_phone=part.from_phone,
+                sender_name=part.sender_name,
+                content=part.text,
+            )
+            if row:
+                logged.append((part, row))
+
+        if not logged:
+            logfire.warn("Message not logged, skipping", wa_message_id=parsed.message_id)
             return
 
+        # Drop any parts that turned out to be duplicates so the agent only sees new text.
+        parsed = coalesce_messages([part for part, _ in logged])
+        message = logged[-1][1]
+
+        # History is only needed to draft, and loading it can schedule a summary, so it is
+        # loaded up front only where the draft starts alongside classification.
+        history: str | None = None
+        if settings.agent_mode == "combined" or settings.speculative_execution == "draft":
+            history = await get_history_prompt(
+                group_id, parsed.from_phone, exclude=parsed.message_ids
+            )
+
+        agent_response: AgentResponse | None = None
+        speculation: asyncio.Task | None = None
+        if settings.agent_mode == "combined":
+            message_type, label_source, agent_response = await _classify_and_draft(
+                parsed.text, history
+            )
+        else:
+            speculation = _start_speculation(parsed.text, history)
+            try:
+                message_type, label_source = await classify_with_source(parsed.text)
+            except BaseException:
+                await _discard_speculation(speculation)
+                raise
+
+        await update_message_type([row.id for _, row in logged], message_type, label_source)
+        message.message_type = message_type
+
         if message_type == MessageType.CASUAL:
+            await _discard_speculation(speculation)
             await _forward_to_personal(message, parsed)
             return
 
-        context = get_context(parsed.text)
-        agent_response = await process_message(parsed.text, context=context)
+        reused_from: str | None = None
+        if agent_response is None and message_type in (MessageType.COMPLAINT, MessageType.ERROR):
+            cached = await find_cached_reply(parsed.text)
+            if cached is not None:
+                await _discard_speculation(speculation)
+                speculation = None
+                reused_from = cached.action_id
+                agent_response = AgentResponse(message=cached.draft, actions=[])
+
+        # The speculative draft is routed like a complaint or error. Anything else needs the
+        # low-confidence route and priority, so it is drafted again.
+        if settings.speculative_execution == "draft" and message_type not in (
+            MessageType.COMPLAINT,
+            MessageType.ERROR,
+        ):
+            await _discard_speculation(speculation)
+            speculation = None
+
+        if agent_response is not None:
+            context = None
+        elif speculation is not None:
+            _speculation_counter.add(1, {"mode": settings.speculative_execution, "outcome": "used"})
+            try:
+                context, agent_response = await speculation
+            except TimeoutError:
+                context, agent_response = None, _holding_response()
+        else:
+            context = await aget_context(parsed.text)
+
+        if agent_response is None:
+            if history is None:
+                history = await get_history_prompt(
+                    group_id, parsed.from_phone, exclude=parsed.message_ids
+                )
+            try:
+                agent_response = await process_message(
+                    parsed.text,
+                    context=context,
+                    low_confidence=message_type == MessageType.UNKNOWN,
+                    priority=(
+                        Priority.HIGH
+                        if message_type in (MessageType.COMPLAINT, MessageType.ERROR)
+                        else Priority.LOW
+                    ),
+                    history=history,
+                )
+            except TimeoutError:
+                agent_response = _holding_response()
 
         if message_type in (MessageType.COMPLAINT, MessageType.ERROR):
             await create_approval_request(
                 message=message,
                 draft_reply=agent_response.message,
                 target_group=group_id,
+                wa_message_ids=parsed.message_ids,
+                reused_from=reused_from,
             )
 
             notification = (
                 f"New {message_type.value} from {parsed.sender_name}:\n"
                 f"'{parsed.text[:100]}...'\n\n"
-                f"Draft reply:\n'{agent_response.message[:200]}...'\n\n"
+                f"Draft reply{' (reused from an approved reply)' if reused_from else ''}:\n"
+                f"'{agent_response.message[:200]}...'\n\n"
                 f"Reply 'approve' or send edited response."
             )
 
@@ -59,22 +179,73 @@ async def handle_incoming_message(parsed: ParsedMessage, group_id: str, group_na
         )
 
 
+def _start_speculation(text: str, history: str | None) -> asyncio.Task | None:
+    """Start retrieval (and optionally drafting) while classification is in flight."""
+    mode = settings.speculative_execution
+    if mode == "off":
+        return None
+
+    async def speculate() -> tuple[str, AgentResponse | None]:
+        context = await aget_context(text)
+        if mode != "draft":
+            return context, None
+        return context, await process_message(
+            text, context=context, priority=Priority.HIGH, history=history
+        )
+
+    return asyncio.create_task(speculate(), name="speculative-draft")
+
+
+async def _discard_speculation(speculation: asyncio.Task | None) -> None:
+    if speculation is None:
+        return
+
+    _speculation_counter.add(1, {"mode": settings.speculative_execution, "outcome": "wasted"})
+    speculation.cancel()
+    # Collect the cancellation (or any failure) so it isn't reported as never retrieved.
+    await asyncio.gather(speculation, return_exceptions=True)
+
+
+def _holding_response() -> AgentResponse:
+    logfire.warn("Draft over budget, using the holding reply")
+    return AgentResponse(message=HOLDING_REPLY, actions=[])
+
+
+async def _classify_and_draft(
+    text: str, history: str
+) -> tuple[MessageType, LabelSource | None, AgentResponse | None]:
+    # Casual messages the local stage is sure about never need a draft.
+    local = classify_locally(text)
+    if local is not None and local[0] == MessageType.CASUAL:
+        return MessageType.CASUAL, LabelSource(local[1]), None
+
+    try:
+        agent_response = await triage_message(
+            text, context=await aget_context(text), history=history
+        )
+    except TimeoutError:
+        message_type, label_source = fallback_classification(text)
+        draft = None if message_type == MessageType.CASUAL else _holding_response()
+        return message_type, label_source, draft
+    return agent_response.message_type, LabelSource.LLM, agent_response
+
+
 async def _forward_to_personal(message, parsed: ParsedMessage):
     if not settings.personal_phone:
         logfire.warn("Personal phone not configured")
         return
 
-    forward_text = (
-        f"[Casual] From {parsed.sender_name}:\n"
-        f"{parsed.text}"
-    )
+    forward_text = f"[Casual] From {parsed.sender_name}:\n{parsed.text}"
 
     await whatsapp_client.send_message(settings.personal_phone, forward_text)
 
     await log_action(
         message_id=message.id,
         action_type=ActionType.FORWARD_PERSONAL,
-        action_data={"forwarded_to": settings.personal_phone},
+        action_data={
+            "forwarded_to": settings.personal_phone,
+            "wa_message_ids": parsed.message_ids,
+        },
     )
 
 
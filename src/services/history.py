@@ -0,0 +1,166 @@
+"""In-memory recent history per conversation (group + sender).
+
+Each conversation keeps a ring buffer of its last N messages. The buffer is loaded
+from the database on first use and then kept current by `log_message`.
+Conversations are evicted least-recently-used once the buffered text exceeds a
+total character budget. Older messages are covered by the rolling summary in
+`src.services.summaries`.
+"""
+
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime
+
+import logfire
+
+from src.config import settings
+from src.db.models import Message
+from src.services.summaries import get_summary, schedule_summary
+
+ConversationKey = tuple[str, str]
+
+_lookup_counter = logfire.metric_counter(
+    "history.lookups", description="Conversation history lookups by outcome: hit or miss"
+)
+
+
+@dataclass
+class HistoryEntry:
+    wa_message_id: str
+    sender_name: str | None
+    content: str
+    created_at: datetime
+
+    @classmethod
+    def from_message(cls, message: Message) -> "HistoryEntry":
+        return cls(
+            wa_message_id=message.wa_message_id,
+            sender_name=message.sender_name,
+            content=message.content,
+            created_at=message.created_at,
+        )
+
+
+class ConversationHistory:
+    def __init__(self, per_conversation: int, max_chars: int):
+        self.per_conversation = per_conversation
+        self.max_chars = max_chars
+        self.chars = 0
+        self._buffers: OrderedDict[ConversationKey, deque[HistoryEntry]] = OrderedDict()
+
+    def __contains__(self, key: ConversationKey) -> bool:
+        return key in self._buffers
+
+    def __len__(self) -> int:
+        return len(self._buffers)
+
+    def _store(self, key: ConversationKey, entries: list[HistoryEntry]) -> None:
+        self._drop(key)
+        buffer = deque(entries[-self.per_conversation :], maxlen=self.per_conversation)
+        self._buffers[key] = buffer
+        self.chars += sum(len(entry.content) for entry in buffer)
+        self._evict()
+
+    def _drop(self, key: ConversationKey) -> None:
+        buffer = self._buffers.pop(key, None)
+        if buffer is not None:
+            self.chars -= sum(len(entry.content) for entry in buffer)
+
+    def _evict(self) -> None:
+        # Never evict the conversation that was just touched.
+        while self.chars > self.max_chars and len(self._buffers) > 1:
+            self._drop(next(iter(self._buffers)))
+
+    def record(self, group_id: str, sender_phone: str, entry: HistoryEntry) -> None:
+        """Append to a buffered conversation. Unbuffered ones load everything from the DB."""
+        key = (group_id, sender_phone)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            return
+
+        if len(buffer) == buffer.maxlen:
+            self.chars -= len(buffer[0].content)
+        buffer.append(entry)
+        self.chars += len(entry.content)
+        self._buffers.move_to_end(key)
+        self._evict()
+
+    async def get(self, group_id: str, sender_phone: str) -> list[HistoryEntry]:
+        """Oldest-first recent messages, loading the conversation from the DB on a miss."""
+        key = (group_id, sender_phone)
+        buffer = self._buffers.get(key)
+        if buffer is not None:
+            _lookup_counter.add(1, {"outcome": "hit"})
+            self._buffers.move_to_end(key)
+            return list(buffer)
+
+        _lookup_counter.add(1, {"outcome": "miss"})
+        # Deferred: tracking imports this module to keep buffers current.
+        from src.services.tracking import get_message_history
+
+        rows = await get_message_history(
+            group_id=group_id, sender_phone=sender_phone, limit=self.per_conversation
+        )
+        entries = [HistoryEntry.from_message(row) for row in reversed(rows)]
+        self._store(key, entries)
+        return entries
+
+    def clear(self) -> None:
+        self._buffers.clear()
+        self.chars = 0
+
+
+def format_history(
+    entries: list[HistoryEntry], token_budget: int, exclude: set[str] | None = None
+) -> str:
+    """Render the most recent entries that fit in `token_budget` (estimated as chars / 4)."""
+    exclude = exclude or set()
+    lines: list[str] = []
+    remaining = token_budget * 4
+
+    for entry in reversed(entries):
+        if entry.wa_message_id in exclude:
+            continue
+        line = (
+            f"[{entry.created_at:%Y-%m-%d %H:%M}] {entry.sender_name or 'Sender'}: {entry.content}"
+        )
+        if len(line) > remaining:
+            break
+        lines.append(line)
+        remaining -= len(line) + 1
+
+    return "\n".join(reversed(lines))
+
+
+conversation_history = ConversationHistory(
+    per_conversation=settings.history_messages,
+    max_chars=settings.history_max_chars,
+)
+
+
+async def get_history_prompt(group_id: str, sender_phone: str, exclude: list[str]) -> str:
+    """Rolling summary (if any) plus the messages it doesn't cover yet, within budget."""
+    if settings.history_token_budget <= 0:
+        return ""
+
+    try:
+        entries = await conversation_history.get(group_id, sender_phone)
+        summary = await get_summary(group_id, sender_phone)
+    except Exception as e:
+        logfire.warn("Failed to load conversation history", group_id=group_id, error=str(e))
+        return ""
+
+    budget = settings.history_token_budget
+    sections = []
+    if summary is not None:
+        entries = [e for e in entries if e.created_at > summary.summarized_through]
+        sections.append(f"Summary of earlier messages: {summary.summary}")
+        budget -= len(sections[0]) // 4
+
+    if settings.summary_threshold and len(entries) >= settings.summary_threshold:
+        schedule_summary(group_id, sender_phone)
+
+    recent = format_history(entries, max(budget, 0), exclude=set(exclude))
+    if recent:
+        sections.append(recent)
+    return "\n\n".join(sections)
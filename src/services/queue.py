@@ -0,0 +1,215 @@
+import asyncio
+import time
+import zlib
+from dataclasses import dataclass, field
+
+import logfire
+
+from src.config import settings
+from src.services.handler import handle_incoming_message
+from src.whatsapp.models import ParsedMessage, coalesce_messages
+
+_depth_gauge = logfire.metric_gauge(
+    "ingest_queue.depth", description="Messages waiting for a worker"
+)
+_wait_histogram = logfire.metric_histogram(
+    "ingest_queue.wait_time", unit="s", description="Time a message spent queued"
+)
+_shed_counter = logfire.metric_counter(
+    "ingest_queue.shed", description="Messages rejected because the queue was full"
+)
+_burst_histogram = logfire.metric_histogram(
+    "ingest_queue.burst_size", description="Messages coalesced into one agent run"
+)
+
+
+@dataclass
+class QueuedMessage:
+    parsed: ParsedMessage
+    group_id: str
+    group_name: str | None = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class _Burst:
+    group_id: str
+    group_name: str | None
+    messages: list[ParsedMessage] = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+    timer: asyncio.TimerHandle | None = None
+
+
+class IngestQueue:
+    """Bounded, sender-sharded queue feeding a fixed pool of message-handling workers.
+
+    Each worker owns one shard and messages are routed by `from_phone`, so a
+    sender's messages are handled strictly in order while different senders
+    proceed in parallel.
+
+    With a coalescing window set, messages from the same sender in the same group
+    are held until the sender has been quiet for the window (or the burst hits
+    `coalesce_max_wait_seconds`) and then handled as one combined message.
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        max_size: int | None = None,
+        coalesce_window: float | None = None,
+    ):
+        self.workers = workers or settings.ingest_workers
+        self.max_size = max_size or settings.ingest_queue_size
+        self.coalesce_window = (
+            settings.coalesce_window_seconds if coalesce_window is None else coalesce_window
+        )
+        self._shards: list[asyncio.Queue[QueuedMessage]] = [
+            asyncio.Queue() for _ in range(self.workers)
+        ]
+        self._bursts: dict[tuple[str, str], _Burst] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        pending = sum(len(burst.messages) for burst in self._bursts.values())
+        return pending + sum(shard.qsize() for shard in self._shards)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def shard_for(self, from_phone: str) -> int:
+        return zlib.crc32(from_phone.encode()) % self.workers
+
+    def submit(self, parsed: ParsedMessage, group_id: str, group_name: str | None = None) -> bool:
+        """Enqueue a message without waiting. Returns False if it was shed."""
+        if self.depth >= self.max_size:
+            _shed_counter.add(1)
+            logfire.warn(
+                "Ingest queue full, shedding message",
+                message_id=parsed.message_id,
+                depth=self.depth,
+            )
+            return False
+
+        self._accept(parsed, group_id, group_name)
+        _depth_gauge.set(self.depth)
+        return True
+
+    def submit_all(self, messages: list[tuple[ParsedMessage, str]]) -> bool:
+        """Enqueue every (message, group_id) pair, or none of them if they don't all fit.
+
+        Returns False if the batch was shed, so a webhook can be redelivered whole
+        instead of half of it being processed twice.
+        """
+        if self.depth + len(messages) > self.max_size:
+            _shed_counter.add(len(messages))
+            logfire.warn(
+                "Ingest queue full, shedding batch",
+                message_ids=[parsed.message_id for parsed, _ in messages],
+                depth=self.depth,
+            )
+            return False
+
+        for parsed, group_id in messages:
+            self._accept(parsed, group_id)
+        _depth_gauge.set(self.depth)
+        return True
+
+    def _accept(self, parsed: ParsedMessage, group_id: str, group_name: str | None = None) -> None:
+        window = settings.coalesce_group_windows.get(group_id, self.coalesce_window)
+        if window > 0:
+            self._add_to_burst(parsed, group_id, group_name, window)
+        else:
+            self._enqueue(QueuedMessage(parsed, group_id, group_name))
+
+    def _enqueue(self, item: QueuedMessage) -> None:
+        self._shards[self.shard_for(item.parsed.from_phone)].put_nowait(item)
+
+    def _add_to_burst(
+        self, parsed: ParsedMessage, group_id: str, group_name: str | None, window: float
+    ) -> None:
+        key = (group_id, parsed.from_phone)
+        burst = self._bursts.get(key)
+        if burst is None:
+            burst = self._bursts[key] = _Burst(group_id, group_name)
+        elif burst.timer:
+            burst.timer.cancel()
+
+        burst.messages.append(parsed)
+
+        # Debounce on the latest message, but never hold a burst past the max wait.
+        remaining = burst.started_at + settings.coalesce_max_wait_seconds - time.monotonic()
+        delay = max(0.0, min(window, remaining))
+        burst.timer = asyncio.get_running_loop().call_later(delay, self._flush_burst, key)
+
+    def _flush_burst(self, key: tuple[str, str]) -> None:
+        burst = self._bursts.pop(key, None)
+        if burst is None:
+            return
+
+        if burst.timer:
+            burst.timer.cancel()
+
+        _burst_histogram.record(len(burst.messages))
+        self._enqueue(
+            QueuedMessage(
+                coalesce_messages(burst.messages),
+                burst.group_id,
+                burst.group_name,
+                enqueued_at=burst.started_at,
+            )
+        )
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+
+        self._tasks = [
+            asyncio.create_task(self._worker(shard), name=f"ingest-worker-{i}")
+            for i, shard in enumerate(self._shards)
+        ]
+        logfire.info("Ingest queue started", workers=self.workers, max_size=self.max_size)
+
+    async def join(self) -> None:
+        await asyncio.gather(*(shard.join() for shard in self._shards))
+
+    async def stop(self, timeout: float | None = None) -> None:
+        if not self._tasks:
+            return
+
+        for key in list(self._bursts):
+            self._flush_burst(key)
+
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except TimeoutError:
+            logfire.warn("Ingest queue drain timed out", remaining=self.depth)
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logfire.info("Ingest queue stopped")
+
+    async def _worker(self, shard: asyncio.Queue[QueuedMessage]) -> None:
+        while True:
+            item = await shard.get()
+            try:
+                _wait_histogram.record(time.monotonic() - item.enqueued_at)
+                _depth_gauge.set(self.depth)
+                await handle_incoming_message(
+                    parsed=item.parsed,
+                    group_id=item.group_id,
+                    group_name=item.group_name,
+                )
+            except Exception:
+                logfire.exception(
+                    "Failed to handle queued message",
+                    message_id=item.parsed.message_id,
+                )
+            finally:
+                shard.task_done()
+
+
+ingest_queue = IngestQueue()
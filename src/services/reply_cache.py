@@ -0,0 +1,204 @@
+"""Semantic cache of approved reply drafts.
+
+During an outage many customers send near-identical complaints. Each approved or
+sent DRAFT_REPLY is kept here as an embedding of the customer's message plus
+the draft. A new complaint whose embedding is close enough reuses that draft
+instead of calling the agent.
+"""
+
+import asyncio
+import math
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+
+import logfire
+from sqlmodel import Session, select
+
+from src.cache import CacheStats, TTLCache
+from src.config import settings
+from src.db.database import engine
+from src.db.models import ActionStatus, ActionType, AgentAction, Message
+from src.rag.store import get_embedding_function
+
+Embed = Callable[[list[str]], Sequence[Sequence[float]]]
+
+_lookup_counter = logfire.metric_counter(
+    "reply_cache.lookups", description="Reply cache lookups by outcome: hit or miss"
+)
+_similarity_histogram = logfire.metric_histogram(
+    "reply_cache.similarity", description="Best cosine similarity found per lookup"
+)
+
+
+@dataclass
+class CachedReply:
+    action_id: str
+    draft: str
+    similarity: float
+
+
+def _normalize(vector: Sequence[float]) -> list[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [float(x) / norm for x in vector]
+
+
+def _timestamp(value: datetime) -> float:
+    return value.replace(tzinfo=UTC).timestamp()
+
+
+class ReplyCache:
+    def __init__(
+        self,
+        threshold: float,
+        maxsize: int,
+        ttl: float,
+        embed: Embed | None = None,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._embed = embed
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._warmed = False
+        self._warm_lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _vectors(self, texts: list[str]) -> list[list[float]]:
+        if self._embed is None:
+            # The same embedding model the RAG store uses, so it is only loaded once.
+            self._embed = get_embedding_function()
+        return [_normalize(vector) for vector in self._embed(texts)]
+
+    async def add(
+        self, action_id: str, content: str, draft: str, created_at: datetime | None = None
+    ) -> None:
+        (vector,) = await asyncio.to_thread(self._vectors, [content])
+        expires_at = _timestamp(created_at) + self.ttl if created_at else None
+        self._entries.set(action_id, (vector, draft), expires_at=expires_at)
+
+    def _best_match(
+        self, content: str, entries: list[tuple[str, tuple[list[float], str], float]]
+    ) -> CachedReply | None:
+        (query,) = self._vectors([content])
+        best: CachedReply | None = None
+        for action_id, (vector, draft), _ in entries:
+            similarity = sum(a * b for a, b in zip(query, vector))
+            if best is None or similarity > best.similarity:
+                best = CachedReply(str(action_id), draft, similarity)
+        return best
+
+    async def lookup(self, content: str) -> CachedReply | None:
+        if not self._warmed:
+            async with self._warm_lock:
+                if not self._warmed:
+                    await self.warm()
+
+        best: CachedReply | None = None
+        entries = self._entries.items()
+        if entries:
+            # Embedding and the scan over every entry both stay off the event loop.
+            best = await asyncio.to_thread(self._best_match, content, entries)
+            _similarity_histogram.record(best.similarity)
+
+        if best is None or best.similarity < self.threshold:
+            self.stats.misses += 1
+            _lookup_counter.add(1, {"outcome": "miss"})
+            return None
+
+        self.stats.hits += 1
+        _lookup_counter.add(1, {"outcome": "hit"})
+        logfire.info(
+            "Reply cache hit",
+            action_id=best.action_id,
+            similarity=round(best.similarity, 3),
+            hit_rate=round(self.stats.hit_rate, 3),
+        )
+        return best
+
+    async def warm(self) -> int:
+        """Load recent approved/sent drafts from the database.
+
+        A failed load leaves the cache unwarmed, so the next lookup tries again.
+        """
+        rows = await asyncio.to_thread(_load_approved_drafts, self.ttl, self._entries.maxsize)
+        if not rows:
+            self._warmed = True
+            return 0
+
+        vectors = await asyncio.to_thread(self._vectors, [content for _, content, _, _ in rows])
+        # Oldest first so the most recent drafts survive LRU eviction.
+        for (action_id, _, draft, created_at), vector in reversed(list(zip(rows, vectors))):
+            self._entries.set(
+                action_id, (vector, draft), expires_at=_timestamp(created_at) + self.ttl
+            )
+
+        self._warmed = True
+        logfire.info("Reply cache warmed", entries=len(self._entries))
+        return len(rows)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._warmed = False
+
+
+def _load_approved_drafts(ttl: float, limit: int) -> list[tuple[str, str, str, datetime]]:
+    if not engine:
+        return []
+
+    with Session(engine) as session:
+        statement = (
+            select(AgentAction, Message.content)
+            .join(Message)
+            .where(AgentAction.action_type == ActionType.DRAFT_REPLY)
+            .where(AgentAction.status.in_([ActionStatus.APPROVED, ActionStatus.SENT]))
+            .where(AgentAction.created_at > datetime.utcnow() - timedelta(seconds=ttl))
+            .order_by(AgentAction.created_at.desc())
+            .limit(limit)
+        )
+        return [
+            (str(action.id), content, action.action_data["draft"], action.created_at)
+            for action, content in session.exec(statement)
+            if action.action_data.get("draft")
+        ]
+
+
+_reply_cache: ReplyCache | None = None
+
+
+def get_reply_cache() -> ReplyCache:
+    global _reply_cache
+    if _reply_cache is None:
+        _reply_cache = ReplyCache(
+            threshold=settings.reply_cache_threshold,
+            maxsize=settings.reply_cache_size,
+            ttl=settings.reply_cache_ttl_seconds,
+        )
+    return _reply_cache
+
+
+async def remember_approved_draft(action: AgentAction, content: str) -> None:
+    """Offer an approved draft to future near-duplicate messages. Never raises."""
+    draft = action.action_data.get("draft")
+    if not settings.reply_cache_enabled or action.action_type != ActionType.DRAFT_REPLY:
+        return
+    if not draft:
+        return
+
+    try:
+        await get_reply_cache().add(str(action.id), content, draft, created_at=action.created_at)
+    except Exception as e:
+        logfire.warn("Failed to cache approved draft", action_id=str(action.id), error=str(e))
+
+
+async def find_cached_reply(content: str) -> CachedReply | None:
+    if not settings.reply_cache_enabled:
+        return None
+
+    try:
+        return await get_reply_cache().lookup(content)
+    except Exception as e:
+        logfire.warn("Reply cache lookup failed", error=str(e))
+        return None
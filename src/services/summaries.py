@@ -0,0 +1,172 @@
+"""Rolling per-conversation summaries.
+
+Once a conversation has more than `summary_threshold` messages that are not yet
+summarized, a background task folds all but the newest `summary_keep_recent` of
+them into the stored summary. Draft prompts then get that summary plus only the
+recent messages, so prompt size stays flat however long the thread runs.
+
+A long backlog (e.g. the first summary of an old thread) is folded oldest first,
+at most `summary_batch_size` messages per LLM call. After a failure the
+conversation is not retried until `summary_retry_seconds` have passed.
+"""
+
+import asyncio
+from datetime import datetime
+
+import logfire
+from sqlmodel import Session, select
+
+from src.agent.summarizer import summarize_conversation
+from src.cache import TTLCache
+from src.config import settings
+from src.db.database import engine
+from src.db.models import ConversationSummary, Message
+
+ConversationKey = tuple[str, str]
+
+_update_counter = logfire.metric_counter(
+    "summaries.updates", description="Rolling summary updates by outcome"
+)
+
+_MISSING = object()
+
+# None is cached too, so conversations without a summary don't hit the DB each message.
+_summaries = TTLCache(maxsize=10_000, ttl=3600.0)
+_inflight: dict[ConversationKey, asyncio.Task] = {}
+# Conversations whose last update failed, until their cooldown expires.
+_cooldown = TTLCache(maxsize=10_000, ttl=settings.summary_retry_seconds)
+
+
+def _load_summary(key: ConversationKey) -> ConversationSummary | None:
+    if not engine:
+        return None
+
+    group_id, sender_phone = key
+    with Session(engine) as session:
+        statement = select(ConversationSummary).where(
+            ConversationSummary.group_id == group_id,
+            ConversationSummary.sender_phone == sender_phone,
+        )
+        return session.exec(statement).first()
+
+
+async def get_summary(group_id: str, sender_phone: str) -> ConversationSummary | None:
+    key = (group_id, sender_phone)
+    cached = _summaries.get(key, _MISSING)
+    if cached is _MISSING:
+        cached = await asyncio.to_thread(_load_summary, key)
+        _summaries.set(key, cached)
+    return cached
+
+
+def schedule_summary(group_id: str, sender_phone: str) -> asyncio.Task | None:
+    """Start a background summary update unless one is running or recently failed."""
+    key = (group_id, sender_phone)
+    if settings.summary_threshold <= 0 or key in _inflight or key in _cooldown:
+        return None
+
+    task = asyncio.create_task(update_summary(group_id, sender_phone), name="summarize")
+    _inflight[key] = task
+    task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return task
+
+
+async def stop_summaries(timeout: float) -> None:
+    """Let running updates finish for up to `timeout` seconds, then cancel the rest."""
+    tasks = list(_inflight.values())
+    if not tasks:
+        return
+
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+def _unsummarized(key: ConversationKey, since: datetime | None, limit: int) -> list[Message]:
+    """The oldest `limit` messages after `since`."""
+    group_id, sender_phone = key
+    with Session(engine) as session:
+        statement = (
+            select(Message)
+            .where(Message.group_id == group_id, Message.sender_phone == sender_phone)
+            .order_by(Message.created_at)
+            .limit(limit)
+        )
+        if since is not None:
+            statement = statement.where(Message.created_at > since)
+        return list(session.exec(statement).all())
+
+
+def _save_summary(key: ConversationKey, text: str, through: datetime, count: int):
+    group_id, sender_phone = key
+    with Session(engine) as session:
+        row = session.exec(
+            select(ConversationSummary).where(
+                ConversationSummary.group_id == group_id,
+                ConversationSummary.sender_phone == sender_phone,
+            )
+        ).first() or ConversationSummary(
+            group_id=group_id, sender_phone=sender_phone, summary="", summarized_through=through
+        )
+        row.summary = text
+        row.summarized_through = through
+        row.message_count += count
+        row.updated_at = datetime.utcnow()
+        session.add(row)
+        session.commit()
+        session.refresh(row)
+        return row
+
+
+async def update_summary(group_id: str, sender_phone: str) -> ConversationSummary | None:
+    if not engine:
+        return None
+
+    key = (group_id, sender_phone)
+    keep_recent = settings.summary_keep_recent
+    # Each pass folds at most `summary_batch_size` messages, so a long backlog never
+    # ends up in a single prompt.
+    limit = max(settings.summary_batch_size, 1) + keep_recent
+    folded_total = 0
+
+    with logfire.span("update_summary", group_id=group_id):
+        try:
+            current = await asyncio.to_thread(_load_summary, key)
+            while True:
+                since = current.summarized_through if current else None
+                pending = await asyncio.to_thread(_unsummarized, key, since, limit)
+                if len(pending) < settings.summary_threshold:
+                    break
+
+                folded = pending[: len(pending) - keep_recent]
+                if not folded:
+                    break
+
+                transcript = "\n".join(
+                    f"{message.sender_name or 'Sender'}: {message.content}" for message in folded
+                )
+                text = await summarize_conversation(
+                    current.summary if current else None, transcript
+                )
+                current = await asyncio.to_thread(
+                    _save_summary, key, text, folded[-1].created_at, len(folded)
+                )
+                _summaries.set(key, current)
+                folded_total += len(folded)
+
+                if len(pending) < limit:
+                    break
+        except Exception as e:
+            _cooldown.add(key)
+            _update_counter.add(1, {"outcome": "error"})
+            logfire.warn("Summary update failed", group_id=group_id, error=str(e))
+            return None
+
+        if not folded_total:
+            _update_counter.add(1, {"outcome": "skipped"})
+            return current
+
+        _update_counter.add(1, {"outcome": "updated"})
+        logfire.info("Summary updated", group_id=group_id, folded=folded_total)
+        return current
@@ -3,10 +3,12 @@ from datetime import datetime
 from typing import Any
 
 import logfire
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select
 
 from src.db.database import engine
-from src.db.models import ActionType, AgentAction, Message, MessageType
+from src.db.models import ActionType, AgentAction, LabelSource, Message, MessageType
+from src.services.history import HistoryEntry, conversation_history
 
 
 async def log_message(
@@ -33,8 +35,15 @@ async def log_message(
             message_type=message_type,
         )
         session.add(message)
-        session.commit()
+        try:
+            session.commit()
+        except IntegrityError:
+            # wa_message_id is unique: Meta redelivered a message we already have.
+            session.rollback()
+            logfire.info("Duplicate message ignored", wa_message_id=wa_message_id)
+            return None
         session.refresh(message)
+        conversation_history.record(group_id, sender_phone, HistoryEntry.from_message(message))
 
         logfire.info(
             "Message logged",
@@ -46,6 +55,23 @@ async def log_message(
         return message
 
 
+async def update_message_type(
+    message_ids: list[uuid.UUID],
+    message_type: MessageType,
+    label_source: LabelSource | None = None,
+) -> None:
+    if not engine or not message_ids:
+        return
+
+    with Session(engine) as session:
+        statement = select(Message).where(Message.id.in_(message_ids))
+        for message in session.exec(statement).all():
+            message.message_type = message_type
+            message.label_source = label_source.value if label_source else None
+            session.add(message)
+        session.commit()
+
+
 async def log_action(
     message_id: uuid.UUID,
     action_type: ActionType,
@@ -76,6 +102,7 @@ async def log_action(
 async def get_message_history(
     group_id: str | None = None,
     limit: int = 50,
+    sender_phone: str | None = None,
 ) -> list[Message]:
     if not engine:
         return []
@@ -84,6 +111,8 @@ async def get_message_history(
         statement = select(Message).order_by(Message.created_at.desc()).limit(limit)
         if group_id:
             statement = statement.where(Message.group_id == group_id)
+        if sender_phone:
+            statement = statement.where(Message.sender_phone == sender_phone)
 
         results = session.exec(statement).all()
         return list(results)
@@ -0,0 +1,110 @@
+"""Startup warmup.
+
+Agents, model clients, outbound connections and the embedding model are
+normally created lazily, which makes the first messages after a deploy several
+seconds slower. `warm_up` builds all of them in the background during the
+lifespan. `/ready` reports not-ready until it finishes, so the platform only
+routes traffic to warm instances.
+"""
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+
+import logfire
+
+from src.agent.classifier import get_batch_classifier_agent, get_classifier_agent
+from src.agent.core import get_prb_agent, get_triage_agent
+from src.agent.local_classifier import get_local_model
+from src.agent.routing import get_model, open_anthropic_connection
+from src.agent.summarizer import get_summarizer_agent
+from src.config import settings
+from src.rag import get_context
+from src.rag.store import get_embedding_function
+from src.whatsapp.client import whatsapp_client
+
+_ready = False
+
+
+def is_ready() -> bool:
+    return _ready
+
+
+def set_ready(ready: bool) -> None:
+    global _ready
+    _ready = ready
+
+
+def _model_names() -> set[str]:
+    names = {
+        settings.classifier_model,
+        settings.classifier_fallback_model,
+        settings.draft_model,
+        settings.draft_fallback_model,
+        settings.escalation_model,
+        settings.summary_model,
+    }
+    return set(filter(None, names))
+
+
+def _build_agents() -> None:
+    get_classifier_agent()
+    get_prb_agent()
+    get_summarizer_agent()
+    if settings.classify_batch_window_ms > 0:
+        get_batch_classifier_agent()
+    if settings.agent_mode == "combined":
+        get_triage_agent()
+
+    # Model objects own the provider HTTP clients; build each one up front.
+    for name in _model_names():
+        get_model(name)
+
+
+async def _open_http_pools() -> None:
+    # Building a client opens no connections; a cheap request leaves one in each pool.
+    await whatsapp_client.open()
+    if any(name.startswith("anthropic:") for name in _model_names()):
+        await open_anthropic_connection()
+
+
+def _load_embeddings() -> None:
+    get_embedding_function()(["warmup"])
+
+
+def _dummy_retrieval() -> None:
+    get_context("warmup")
+
+
+def _in_thread(step: Callable[[], None]) -> Callable[[], Awaitable[None]]:
+    return lambda: asyncio.to_thread(step)
+
+
+_STEPS: list[tuple[str, Callable[[], Awaitable[None]]]] = [
+    ("agents", _in_thread(_build_agents)),
+    ("local_classifier", _in_thread(get_local_model)),
+    ("http_pools", _open_http_pools),
+    ("embeddings", _in_thread(_load_embeddings)),
+    ("retrieval", _in_thread(_dummy_retrieval)),
+]
+
+
+async def warm_up() -> None:
+    """Run every warmup step, then mark the instance ready.
+
+    A failing step is logged and skipped. Whatever it was meant to preload is
+    built lazily on first use instead, so the instance is still usable.
+    """
+    with logfire.span("warmup") as span:
+        started = time.perf_counter()
+        for name, step in _STEPS:
+            step_started = time.perf_counter()
+            try:
+                await step()
+            except Exception as e:
+                logfire.warn("Warmup step failed", step=name, error=str(e))
+                continue
+            span.set_attribute(f"{name}_s", round(time.perf_counter() - step_started, 3))
+
+        set_ready(True)
+        logfire.info("Warmup complete", duration_s=round(time.perf_counter() - started, 3))
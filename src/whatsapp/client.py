@@ -11,10 +11,30 @@ class WhatsAppClient:
         self,
         phone_number_id: str | None = None,
         access_token: str | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
     ):
         self.phone_number_id = phone_number_id or settings.wa_phone_number_id
         self.access_token = access_token or settings.wa_access_token
         self.base_url = f"{BASE_URL}/{self.phone_number_id}"
+        # Overridable so tests and benchmarks can stub the Graph API.
+        self.transport = transport
+        self._client: httpx.AsyncClient | None = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # One pooled client for the process, so sends reuse warm TLS connections.
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(transport=self.transport)
+        return self._client
+
+    async def open(self) -> None:
+        """Put one Graph API connection in the pool ahead of the first send."""
+        # Any response will do: the request only pays for DNS, TCP and TLS up front.
+        await self._get_client().head(BASE_URL)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     def _get_headers(self) -> dict[str, str]:
         return {
@@ -32,13 +52,13 @@ class WhatsAppClient:
             "text": {"preview_url": False, "body": message},
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, headers=self._get_headers())
-            response.raise_for_status()
-            result = response.json()
-            msg_id = result.get("messages", [{}])[0].get("id")
-            logfire.info("WhatsApp message sent", to=to, message_id=msg_id)
-            return result
+        client = self._get_client()
+        response = await client.post(url, json=payload, headers=self._get_headers())
+        response.raise_for_status()
+        result = response.json()
+        msg_id = result.get("messages", [{}])[0].get("id")
+        logfire.info("WhatsApp message sent", to=to, message_id=msg_id)
+        return result
 
     async def send_template(self, to: str, template_name: str, params: list[str]) -> dict:
         url = f"{self.base_url}/messages"
@@ -61,12 +81,12 @@ class WhatsAppClient:
             },
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, headers=self._get_headers())
-            response.raise_for_status()
-            result = response.json()
-            logfire.info("WhatsApp template sent", to=to, template=template_name)
-            return result
+        client = self._get_client()
+        response = await client.post(url, json=payload, headers=self._get_headers())
+        response.raise_for_status()
+        result = response.json()
+        logfire.info("WhatsApp template sent", to=to, template=template_name)
+        return result
 
     async def mark_as_read(self, message_id: str) -> dict:
         url = f"{self.base_url}/messages"
@@ -76,12 +96,12 @@ class WhatsAppClient:
             "message_id": message_id,
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, headers=self._get_headers())
-            response.raise_for_status()
-            result = response.json()
-            logfire.info("WhatsApp message marked as read", message_id=message_id)
-            return result
+        client = self._get_client()
+        response = await client.post(url, json=payload, headers=self._get_headers())
+        response.raise_for_status()
+        result = response.json()
+        logfire.info("WhatsApp message marked as read", message_id=message_id)
+        return result
 
 
 whatsapp_client = WhatsAppClient()
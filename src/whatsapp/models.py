@@ -65,3 +65,25 @@ class ParsedMessage(BaseModel):
     sender_name: str
     text: str
     timestamp: str
+    # Original messages folded into this one by burst coalescing, oldest first.
+    parts: list["ParsedMessage"] = []
+
+    @property
+    def message_ids(self) -> list[str]:
+        return [part.message_id for part in self.parts] or [self.message_id]
+
+
+def coalesce_messages(messages: list[ParsedMessage]) -> ParsedMessage:
+    """Merge consecutive messages from one sender into a single agent input."""
+    if len(messages) == 1:
+        return messages[0]
+
+    last = messages[-1]
+    return ParsedMessage(
+        message_id=last.message_id,
+        from_phone=last.from_phone,
+        sender_name=last.sender_name,
+        text="\n".join(m.text for m in messages),
+        timestamp=last.timestamp,
+        parts=[part for m in messages for part in (m.parts or [m])],
+    )
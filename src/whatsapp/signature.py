@@ -0,0 +1,13 @@
+import hashlib
+import hmac
+
+SIGNATURE_PREFIX = "sha256="
+
+
+def verify_signature(body: bytes, signature_header: str | None, app_secret: str) -> bool:
+    """Check Meta's X-Hub-Signature-256 header against the raw request body."""
+    if not signature_header or not signature_header.startswith(SIGNATURE_PREFIX):
+        return False
+
+    expected = hmac.new(app_secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature_header[len(SIGNATURE_PREFIX) :])
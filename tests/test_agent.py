@@ -1,12 +1,50 @@
+import asyncio
 from unittest.mock import AsyncMock, MagicMock, patch
 
+import httpx
 import pytest
-
-from src.agent.classifier import classify_message
-from src.agent.core import AgentResponse, process_message
+from pydantic_ai import CachePoint
+from pydantic_ai.exceptions import ModelHTTPError
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+
+from src.agent import classifier, local_classifier
+from src.agent.batching import ClassificationBatcher
+from src.agent.classifier import (
+    classification_cache_stats,
+    classify_message,
+    load_classification_cache,
+    save_classification_cache,
+)
+from src.agent.core import AgentResponse, TriageOutput, process_message, triage_message
+from src.agent.limiter import LLMLimiter, Priority, retry_after
+from src.agent.local_classifier import (
+    LinearTextModel,
+    classify_locally,
+    evaluate,
+    match_rules,
+    split_holdout,
+)
 from src.agent.prompts import CLASSIFICATION_PROMPT, SYSTEM_PROMPT
+from src.agent.routing import Route, get_model, route, run_routed
 from src.agent.tools import AgentContext, draft_reply, escalate_to_dev, forward_to_personal
-from src.db.models import MessageType
+from src.config import settings
+from src.db.models import LabelSource, Message, MessageType
+
+
+@pytest.fixture(autouse=True)
+def clear_classification_cache():
+    classifier._classification_cache.clear()
+    yield
+    classifier._classification_cache.clear()
+
+
+def make_classifier_agent(output: str) -> MagicMock:
+    mock_result = MagicMock()
+    mock_result.output = output
+    mock_agent = MagicMock()
+    mock_agent.run = AsyncMock(return_value=mock_result)
+    return mock_agent
 
 
 class TestPrompts:
@@ -141,6 +179,213 @@ class TestClassifier:
             result = await classify_message("Bad service")
             assert result == MessageType.COMPLAINT
 
+    @pytest.mark.asyncio
+    async def test_classify_skips_llm_for_casual_one_liner(self):
+        mock_agent = MagicMock()
+        mock_agent.run = AsyncMock()
+
+        with patch("src.agent.classifier.get_classifier_agent", return_value=mock_agent):
+            result = await classify_message("ok 👍")
+            assert result == MessageType.CASUAL
+            mock_agent.run.assert_not_called()
+
+
+class TestClassificationCache:
+    @pytest.mark.asyncio
+    async def test_normalized_repeat_hits_cache(self):
+        mock_agent = make_classifier_agent("ERROR")
+
+        with patch("src.agent.classifier.get_classifier_agent", return_value=mock_agent):
+            first = await classify_message("Is the system down?")
+            second = await classify_message("  is the   SYSTEM down?")
+
+        assert first == second == MessageType.ERROR
+        assert mock_agent.run.await_count == 1
+        assert classification_cache_stats()["hits"] >= 1
+
+    @pytest.mark.asyncio
+    async def test_prompt_change_invalidates_entries(self):
+        mock_agent = make_classifier_agent("ERROR")
+
+        with patch("src.agent.classifier.get_classifier_agent", return_value=mock_agent):
+            await classify_message("Is the system down?")
+            with patch("src.agent.classifier.CLASSIFICATION_PROMPT", "New prompt {message}"):
+                await classify_message("Is the system down?")
+
+        assert mock_agent.run.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_persisted_cache_starts_warm(self, tmp_path):
+        path = str(tmp_path / "classifications.json")
+
+        with patch(
+            "src.agent.classifier.get_classifier_agent",
+            return_value=make_classifier_agent("COMPLAINT"),
+        ):
+            await classify_message("Any update on my refund?")
+        save_classification_cache(path)
+        classifier._classification_cache.clear()
+
+        assert load_classification_cache(path) == 1
+        mock_agent = make_classifier_agent("CASUAL")
+        with patch("src.agent.classifier.get_classifier_agent", return_value=mock_agent):
+            assert await classify_message("any update on my refund?") == MessageType.COMPLAINT
+        mock_agent.run.assert_not_called()
+
+    def test_stale_persisted_cache_is_ignored(self, tmp_path):
+        path = tmp_path / "classifications.json"
+        path.write_text('{"namespace": "other", "entries": [["k", "error", 9999999999]]}')
+
+        assert load_classification_cache(str(path)) == 0
+
+
+class TestClassificationBatcher:
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_call(self):
+        classify_many = AsyncMock(
+            side_effect=lambda contents: [
+                MessageType.ERROR if "down" in c else MessageType.CASUAL for c in contents
+            ]
+        )
+        classify_one = AsyncMock()
+        batcher = ClassificationBatcher(classify_one, classify_many, window_ms=20, max_size=10)
+
+        results = await asyncio.gather(
+            batcher.classify("the site is down"),
+            batcher.classify("see you tomorrow"),
+            batcher.classify("server down again"),
+        )
+
+        assert results == [MessageType.ERROR, MessageType.CASUAL, MessageType.ERROR]
+        assert classify_many.await_count == 1
+        classify_one.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_flushes_early_at_max_size(self):
+        classify_many = AsyncMock(side_effect=lambda contents: [MessageType.CASUAL] * len(contents))
+        batcher = ClassificationBatcher(AsyncMock(), classify_many, window_ms=10_000, max_size=2)
+
+        results = await asyncio.wait_for(
+            asyncio.gather(batcher.classify("a"), batcher.classify("b")), timeout=1
+        )
+
+        assert results == [MessageType.CASUAL, MessageType.CASUAL]
+
+    @pytest.mark.asyncio
+    async def test_bad_batch_falls_back_to_single_calls(self):
+        classify_many = AsyncMock(return_value=[MessageType.ERROR])
+        classify_one = AsyncMock(side_effect=[MessageType.COMPLAINT, MessageType.CASUAL])
+        batcher = ClassificationBatcher(classify_one, classify_many, window_ms=10, max_size=10)
+
+        results = await asyncio.gather(batcher.classify("bad service"), batcher.classify("hi all"))
+
+        assert results == [MessageType.COMPLAINT, MessageType.CASUAL]
+        assert classify_one.await_count == 2
+
+
+class TestLocalClassifier:
+    SAMPLES = [
+        ("the app keeps crashing on login", MessageType.ERROR),
+        ("error 500 when I open the dashboard", MessageType.ERROR),
+        ("login page shows an error", MessageType.ERROR),
+        ("I am really unhappy with the service", MessageType.COMPLAINT),
+        ("terrible service, nobody answered my request", MessageType.COMPLAINT),
+        ("very disappointed with the delay", MessageType.COMPLAINT),
+        ("see you at lunch tomorrow", MessageType.CASUAL),
+        ("happy birthday!", MessageType.CASUAL),
+        ("have a nice weekend", MessageType.CASUAL),
+    ]
+
+    def test_rules_match_casual_one_liners(self):
+        for text in ["thanks!", "ok 👍", "👍", "Good morning all", "hello team"]:
+            assert match_rules(text) == MessageType.CASUAL
+
+    def test_rules_leave_other_messages_alone(self):
+        for text in ["...", "", "thanks but the app is still broken", "hello, my order failed"]:
+            assert match_rules(text) is None
+
+    def test_model_learns_categories(self):
+        model = LinearTextModel.train(self.SAMPLES)
+
+        label, confidence = model.predict("the dashboard keeps crashing with an error")
+        assert label == MessageType.ERROR
+        assert 0.0 < confidence <= 1.0
+
+    def test_model_round_trips_through_json(self, tmp_path):
+        model = LinearTextModel.train(self.SAMPLES)
+        path = tmp_path / "model.json"
+        model.save(path)
+
+        loaded = LinearTextModel.load(path)
+        assert loaded.predict("unhappy with the delay") == model.predict("unhappy with the delay")
+
+    def test_low_confidence_falls_through_to_llm(self):
+        model = LinearTextModel.train(self.SAMPLES)
+
+        with (
+            patch("src.agent.local_classifier.get_local_model", return_value=model),
+            patch("src.agent.local_classifier.settings.local_classifier_threshold", 1.01),
+        ):
+            assert classify_locally("the app keeps crashing") is None
+
+    def test_evaluate_reports_coverage(self):
+        model = LinearTextModel.train(self.SAMPLES)
+        report = evaluate(model, self.SAMPLES, threshold=0.0)
+
+        assert report["samples"] == len(self.SAMPLES)
+        assert report["coverage"] == 1.0
+        assert report["accuracy"] > 0.5
+
+    def test_holdout_split_is_stable(self):
+        samples = [(f"message number {i}", MessageType.CASUAL) for i in range(200)]
+        train_set, holdout_set = split_holdout(samples, 0.2)
+
+        assert 20 < len(holdout_set) < 60
+        assert not {c for c, _ in train_set} & {c for c, _ in holdout_set}
+        # Adding rows never moves an existing message to the other side.
+        _, grown_holdout = split_holdout(samples + [("another one", MessageType.ERROR)], 0.2)
+        assert set(holdout_set) <= set(grown_holdout)
+
+    def test_trains_only_on_llm_and_human_labels(self):
+        engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        SQLModel.metadata.create_all(engine)
+        labels = [
+            ("rule", LabelSource.RULE),
+            ("model", LabelSource.MODEL),
+            ("unlabelled", None),
+            ("llm", LabelSource.LLM),
+            ("human", LabelSource.HUMAN),
+        ]
+        with Session(engine) as session:
+            for content, source in labels:
+                session.add(
+                    Message(
+                        wa_message_id=f"wamid.{content}",
+                        group_id="123",
+                        sender_phone="+15550001",
+                        content=content,
+                        message_type=MessageType.ERROR,
+                        label_source=source.value if source else None,
+                    )
+                )
+            session.commit()
+
+        with patch.object(local_classifier, "engine", engine):
+            samples = local_classifier._load_labelled_messages()
+
+        assert sorted(content for content, _ in samples) == ["human", "llm"]
+
+    def test_evaluate_without_model_exits_clearly(self, tmp_path):
+        load = MagicMock()
+        with (
+            patch.object(local_classifier, "_load_labelled_messages", load),
+            pytest.raises(SystemExit, match="run `train` first"),
+        ):
+            local_classifier.main(["evaluate", "--model", str(tmp_path / "missing.json")])
+        load.assert_not_called()
+
 
 class TestCoreAgent:
     @pytest.mark.asyncio
@@ -168,8 +413,313 @@ class TestCoreAgent:
         with patch("src.agent.core.get_prb_agent", return_value=mock_agent):
             await process_message("Help me", context="Previous conversation")
             call_args = mock_agent.run.call_args
-            assert "Context:" in call_args[0][0]
-            assert "Previous conversation" in call_args[0][0]
+            prompt = "".join(part for part in call_args[0][0] if isinstance(part, str))
+            assert "Context:" in prompt
+            assert "Previous conversation" in prompt
+
+    @pytest.mark.asyncio
+    async def test_process_message_puts_cache_point_after_context(self):
+        mock_result = MagicMock()
+        mock_result.all_messages.return_value = []
+        mock_agent = MagicMock()
+        mock_agent.run = AsyncMock(return_value=mock_result)
+
+        with patch("src.agent.core.get_prb_agent", return_value=mock_agent):
+            await process_message("Help me", context="Knowledge base chunk")
+
+        prompt = mock_agent.run.call_args[0][0]
+        assert isinstance(prompt[1], CachePoint)
+        assert prompt[-1] == "Message: Help me"
+
+    @pytest.mark.asyncio
+    async def test_process_message_without_prompt_caching(self):
+        mock_result = MagicMock()
+        mock_result.all_messages.return_value = []
+        mock_agent = MagicMock()
+        mock_agent.run = AsyncMock(return_value=mock_result)
+
+        with (
+            patch.object(settings, "prompt_caching", False),
+            patch("src.agent.core.get_prb_agent", return_value=mock_agent),
+        ):
+            await process_message("Help me", context="Knowledge base chunk")
+
+        assert mock_agent.run.call_args[0][0] == (
+            "Context: Knowledge base chunk\n\nMessage: Help me"
+        )
+
+    @pytest.mark.asyncio
+    async def test_process_message_adds_history_after_cache_point(self):
+        mock_result = MagicMock()
+        mock_result.all_messages.return_value = []
+        mock_agent = MagicMock()
+        mock_agent.run = AsyncMock(return_value=mock_result)
+
+        with patch("src.agent.core.get_prb_agent", return_value=mock_agent):
+            await process_message(
+                "Still broken", context="Knowledge base chunk", history="John: login fails"
+            )
+
+        prompt = mock_agent.run.call_args[0][0]
+        assert isinstance(prompt[1], CachePoint)
+        assert prompt[-1] == "Recent conversation:\nJohn: login fails\n\nMessage: Still broken"
+
+
+class TestTriage:
+    @pytest.mark.asyncio
+    async def test_triage_returns_category_and_draft(self):
+        mock_result = MagicMock()
+        mock_result.output = TriageOutput(category="COMPLAINT", reply="Sorry about the delay.")
+        mock_result.all_messages.return_value = []
+        mock_agent = MagicMock()
+        mock_agent.run = AsyncMock(return_value=mock_result)
+
+        with patch("src.agent.core.get_triage_agent", return_value=mock_agent):
+            result = await triage_message("Still waiting on my order!", context="Shipping FAQ")
+
+        assert result.message_type == MessageType.COMPLAINT
+        assert result.message == "Sorry about the delay."
+        assert "Context: Shipping FAQ\n\n" in mock_agent.run.call_args[0][0]
+
+
+class TestRouting:
+    def test_default_routes(self):
+        with (
+            patch.object(settings, "classifier_model", "test:small"),
+            patch.object(settings, "classifier_fallback_model", "test:large"),
+            patch.object(settings, "escalation_model", ""),
+        ):
+            selected = route("classify", "hello")
+
+        assert selected.models == ["test:small", "test:large"]
+        assert selected.reason == "default"
+
+    def test_draft_escalates_for_low_confidence_and_long_messages(self):
+        with (
+            patch.object(settings, "draft_model", "test:medium"),
+            patch.object(settings, "draft_fallback_model", "test:small"),
+            patch.object(settings, "escalation_model", "test:large"),
+            patch.object(settings, "escalation_min_chars", 100),
+        ):
+            low = route("draft", "short", low_confidence=True)
+            long = route("draft", "x" * 200)
+            normal = route("draft", "short")
+
+        assert low.reason == "low_confidence"
+        assert low.models == ["test:large", "test:medium", "test:small"]
+        assert long.reason == "long_message"
+        assert normal.models == ["test:medium", "test:small"]
+
+    @pytest.mark.asyncio
+    async def test_run_routed_falls_back_on_retryable_errors(self):
+        async def run(prompt, model, **kwargs):
+            if model == "test:overloaded":
+                raise ModelHTTPError(status_code=529, model_name=model)
+            return MagicMock(output=f"answered by {model}")
+
+        mock_agent = MagicMock()
+        mock_agent.run = run
+        selected = Route(
+            stage="draft", models=["test:overloaded", "test:ok"], timeout=1, reason="default"
+        )
+
+        with (
+            patch("src.agent.routing.get_model", side_effect=lambda name: name),
+            patch("src.agent.routing.llm_limiter", LLMLimiter(1, max_retries=0)),
+        ):
+            result = await run_routed(mock_agent, selected, "prompt")
+
+        assert result.output == "answered by test:ok"
+
+    @pytest.mark.asyncio
+    async def test_run_routed_shares_one_budget_across_attempts(self):
+        calls = []
+
+        async def run(prompt, model, **kwargs):
+            calls.append(model)
+            if model == "test:flaky":
+                await asyncio.sleep(0.03)
+                raise ModelHTTPError(status_code=503, model_name=model)
+            await asyncio.sleep(1)
+
+        mock_agent = MagicMock()
+        mock_agent.run = run
+        selected = Route(
+            stage="draft", models=["test:flaky", "test:slow"], timeout=0.05, reason="default"
+        )
+
+        started = asyncio.get_running_loop().time()
+        with (
+            patch("src.agent.routing.get_model", side_effect=lambda name: name),
+            patch("src.agent.routing.llm_limiter", LLMLimiter(1, max_retries=0)),
+            pytest.raises(TimeoutError),
+        ):
+            await run_routed(mock_agent, selected, "prompt")
+
+        assert calls == ["test:flaky", "test:slow"]
+        assert asyncio.get_running_loop().time() - started < 0.09
+
+    @pytest.mark.asyncio
+    async def test_run_routed_keeps_budget_for_fallback_after_timeout(self):
+        async def run(prompt, model, **kwargs):
+            if model == "test:slow":
+                await asyncio.sleep(1)
+            return MagicMock(output=f"answered by {model}")
+
+        mock_agent = MagicMock()
+        mock_agent.run = run
+        selected = Route(
+            stage="draft", models=["test:slow", "test:fast"], timeout=0.1, reason="default"
+        )
+
+        with (
+            patch.object(settings, "route_fallback_share", 0.3),
+            patch("src.agent.routing.get_model", side_effect=lambda name: name),
+            patch("src.agent.routing.llm_limiter", LLMLimiter(1, max_retries=0)),
+        ):
+            result = await run_routed(mock_agent, selected, "prompt")
+
+        assert result.output == "answered by test:fast"
+
+    @pytest.mark.asyncio
+    async def test_run_routed_raises_when_every_model_times_out(self):
+        async def run(prompt, model, **kwargs):
+            await asyncio.sleep(1)
+
+        mock_agent = MagicMock()
+        mock_agent.run = run
+        selected = Route(stage="classify", models=["test:slow"], timeout=0.01, reason="default")
+
+        with patch("src.agent.routing.get_model", side_effect=lambda name: name):
+            with pytest.raises(TimeoutError):
+                await run_routed(mock_agent, selected, "prompt")
+
+
+class TestLLMLimiter:
+    def rate_limited(self, retry_after: str | None = None) -> ModelHTTPError:
+        error = ModelHTTPError(status_code=429, model_name="test")
+        cause = RuntimeError("rate limited")
+        cause.response = httpx.Response(
+            429, headers={"retry-after": retry_after} if retry_after else {}
+        )
+        error.__cause__ = cause
+        return error
+
+    def test_retry_after_reads_wrapped_provider_error(self):
+        assert retry_after(self.rate_limited("2")) == 2.0
+        assert retry_after(self.rate_limited()) is None
+
+    @pytest.mark.asyncio
+    async def test_caps_concurrency(self):
+        limiter = LLMLimiter(max_concurrency=2)
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            peak = max(peak, limiter.in_flight)
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        results = await asyncio.gather(*(limiter.run(call) for _ in range(6)))
+
+        assert results == ["ok"] * 6
+        assert peak == 2
+        assert limiter.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_admits_waiters_by_priority(self):
+        limiter = LLMLimiter(max_concurrency=1)
+        release = asyncio.Event()
+        order = []
+
+        async def blocker():
+            await release.wait()
+
+        def call(name):
+            async def run():
+                order.append(name)
+
+            return run
+
+        first = asyncio.create_task(limiter.run(blocker))
+        await asyncio.sleep(0)
+        waiters = [
+            asyncio.create_task(limiter.run(call("low"), Priority.LOW)),
+            asyncio.create_task(limiter.run(call("normal"), Priority.NORMAL)),
+            asyncio.create_task(limiter.run(call("high"), Priority.HIGH)),
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, *waiters)
+
+        assert order == ["high", "normal", "low"]
+
+    @pytest.mark.asyncio
+    async def test_retries_rate_limits_honouring_retry_after(self):
+        limiter = LLMLimiter(max_concurrency=1, base_delay=0.0, max_delay=0.0)
+        call = AsyncMock(side_effect=[self.rate_limited("0.01"), "ok"])
+
+        with patch("src.agent.limiter.asyncio.sleep", new_callable=AsyncMock) as sleep:
+            result = await limiter.run(call)
+
+        assert result == "ok"
+        assert call.await_count == 2
+        sleep.assert_awaited_once_with(0.01)
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_max_retries_and_on_other_errors(self):
+        limiter = LLMLimiter(max_concurrency=1, max_retries=2, base_delay=0.0)
+        rate_limited = AsyncMock(side_effect=self.rate_limited())
+        bad_request = AsyncMock(side_effect=ModelHTTPError(status_code=400, model_name="test"))
+
+        with pytest.raises(ModelHTTPError):
+            await limiter.run(rate_limited)
+        with pytest.raises(ModelHTTPError):
+            await limiter.run(bad_request)
+
+        assert rate_limited.await_count == 3
+        assert bad_request.await_count == 1
+        assert limiter.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_paced_call_does_not_hold_a_slot(self):
+        limiter = LLMLimiter(max_concurrency=1, requests_per_minute=1)
+        await limiter.run(AsyncMock(return_value="ok"))
+
+        # The request bucket is empty now; the next call waits without a slot.
+        paced = asyncio.create_task(limiter.run(AsyncMock(return_value="ok")))
+        await asyncio.sleep(0.01)
+        assert limiter.in_flight == 0
+        assert limiter.waiting == 0
+
+        paced.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await paced
+
+    def test_anthropic_client_does_not_retry(self, monkeypatch):
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+        get_model.cache_clear()
+        try:
+            model = get_model("anthropic:claude-haiku-4-5")
+        finally:
+            get_model.cache_clear()
+
+        assert model.model_name == "claude-haiku-4-5"
+        assert model.client.max_retries == 0
+
+    @pytest.mark.asyncio
+    async def test_run_routed_passes_priority_to_limiter(self):
+        mock_agent = make_classifier_agent("ok")
+        selected = Route(stage="draft", models=["test:model"], timeout=1, reason="default")
+
+        with (
+            patch("src.agent.routing.get_model", side_effect=lambda name: name),
+            patch("src.agent.routing.llm_limiter.run", wraps=LLMLimiter(1).run) as run,
+        ):
+            await run_routed(mock_agent, selected, "prompt", priority=Priority.HIGH)
+
+        assert run.call_args.args[1] == Priority.HIGH
+        mock_agent.run.assert_awaited_once_with("prompt", model="test:model")
 
 
 class TestAgentContext:
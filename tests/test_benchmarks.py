@@ -0,0 +1,66 @@
+from pydantic_ai import Agent
+
+from benchmarks.chunking import _legacy_chunks, write_docx, write_pdf
+from benchmarks.replay import (
+    build_stand_in_models,
+    compare,
+    percentile,
+    stand_in_category,
+    synthetic_payloads,
+)
+from src.agent.classifier import BatchClassification
+from src.agent.core import TriageOutput
+from src.rag.loader import iter_file_chunks
+from src.whatsapp.models import WhatsAppWebhookPayload
+
+
+class TestReplayHarness:
+    def test_stand_in_category_is_keyword_based(self):
+        assert stand_in_category("Checkout crashes on pay") == "ERROR"
+        assert stand_in_category("I want a refund") == "COMPLAINT"
+        assert stand_in_category("thanks!") == "CASUAL"
+        assert stand_in_category("Where is the office?") == "UNKNOWN"
+
+    async def test_stand_in_models_answer_each_agent(self):
+        models = build_stand_in_models(latency_ms=0)
+
+        text = await Agent(models["classify"]).run("Message: the app shows error 500")
+        batch = await Agent(models["classify_batch"], output_type=BatchClassification).run(
+            "[1] thanks!\n\n[2] I want a refund"
+        )
+        triage = await Agent(models["triage"], output_type=TriageOutput).run("Message: crash")
+
+        assert text.output == "ERROR"
+        assert batch.output.categories == ["CASUAL", "COMPLAINT"]
+        assert triage.output.category == "ERROR"
+        assert triage.output.reply
+
+    def test_synthetic_payloads_are_valid_webhooks(self):
+        payloads = synthetic_payloads(5, seed=1)
+
+        assert payloads == synthetic_payloads(5, seed=1)
+        for payload in payloads:
+            WhatsAppWebhookPayload.model_validate(payload)
+
+    def test_percentile_and_compare(self):
+        assert percentile([5, 1, 3, 2, 4], 50) == 3
+        assert percentile(list(range(1, 101)), 99) == 99
+
+        baseline = {"throughput_per_s": 10.0, "stages": {"classify_message": {"p95_ms": 100}}}
+        slower = {"throughput_per_s": 9.5, "stages": {"classify_message": {"p95_ms": 130}}}
+
+        assert compare(baseline, baseline, tolerance=0.2) == []
+        assert compare(slower, baseline, tolerance=0.2) == [
+            "classify_message p95 130ms > baseline 100ms"
+        ]
+
+
+class TestChunkingBenchmark:
+    def test_synthetic_files_stream_the_same_chunks_as_the_legacy_loaders(self, tmp_path):
+        write_pdf(tmp_path / "big.pdf", pages=3)
+        write_docx(tmp_path / "big.docx", paragraphs=200)
+
+        for path in (tmp_path / "big.pdf", tmp_path / "big.docx"):
+            legacy = _legacy_chunks(path)
+            assert len(legacy) > 1
+            assert list(iter_file_chunks(path)) == legacy
@@ -0,0 +1,55 @@
+from datetime import datetime
+from unittest.mock import patch
+
+from sqlalchemy import inspect, text
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from src.db.database import create_db_tables
+from src.db.models import ActionType, AgentAction, Message
+
+
+class TestMigrations:
+    def test_duplicate_message_ids_are_merged_before_unique_index(self):
+        engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        SQLModel.metadata.create_all(engine)
+        # Recreate the plain index that tables from before the unique constraint have.
+        with engine.begin() as connection:
+            connection.execute(text("DROP INDEX ix_messages_wa_message_id"))
+            connection.execute(
+                text("CREATE INDEX ix_messages_wa_message_id ON messages (wa_message_id)")
+            )
+
+        first = Message(
+            wa_message_id="wamid.dup",
+            group_id="123",
+            sender_phone="15559876543",
+            content="Still broken",
+            created_at=datetime(2025, 1, 1),
+        )
+        second = Message(
+            wa_message_id="wamid.dup",
+            group_id="123",
+            sender_phone="15559876543",
+            content="Still broken",
+            created_at=datetime(2025, 1, 2),
+        )
+        with Session(engine) as session:
+            session.add_all([first, second])
+            session.commit()
+            session.add(AgentAction(message_id=second.id, action_type=ActionType.DRAFT_REPLY))
+            session.commit()
+            first_id = first.id
+
+        with patch("src.db.database.engine", engine):
+            create_db_tables()
+            create_db_tables()
+
+        with Session(engine) as session:
+            assert [row.id for row in session.exec(select(Message))] == [first_id]
+            assert session.exec(select(AgentAction)).one().message_id == first_id
+
+        indexes = {index["name"]: index for index in inspect(engine).get_indexes("messages")}
+        assert indexes["ix_messages_wa_message_id"]["unique"]
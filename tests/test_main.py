@@ -0,0 +1,81 @@
+import subprocess
+import sys
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from benchmarks.startup import LAZY_MODULES
+from src import warmup
+from src.main import app
+
+
+@pytest.fixture
+def restore_ready():
+    ready = warmup.is_ready()
+    yield
+    warmup.set_ready(ready)
+
+
+class TestReadiness:
+    @pytest.mark.asyncio
+    async def test_ready_is_503_until_warm(self, restore_ready):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            warmup.set_ready(False)
+            warming = await client.get("/ready")
+            health = await client.get("/health")
+            warmup.set_ready(True)
+            ready = await client.get("/ready")
+
+        assert warming.status_code == 503
+        assert health.status_code == 200
+        assert ready.status_code == 200
+
+    @pytest.mark.asyncio
+    async def test_warm_up_runs_every_step_and_survives_failures(self, restore_ready):
+        first = AsyncMock()
+        failing = AsyncMock(side_effect=RuntimeError("model download failed"))
+        last = AsyncMock()
+        warmup.set_ready(False)
+
+        with patch.object(
+            warmup, "_STEPS", [("first", first), ("failing", failing), ("last", last)]
+        ):
+            await warmup.warm_up()
+
+        first.assert_awaited_once()
+        last.assert_awaited_once()
+        assert warmup.is_ready()
+
+    def test_build_agents_prebuilds_models(self):
+        with patch("src.warmup.get_model") as get_model:
+            warmup._build_agents()
+
+        built = {call.args[0] for call in get_model.call_args_list}
+        assert warmup.settings.classifier_model in built
+        assert warmup.settings.draft_model in built
+
+    @pytest.mark.asyncio
+    async def test_http_pools_step_connects_each_client(self):
+        with (
+            patch.object(warmup.settings, "draft_model", "anthropic:claude-sonnet-4-20250514"),
+            patch("src.warmup.whatsapp_client.open", AsyncMock()) as whatsapp,
+            patch("src.warmup.open_anthropic_connection", AsyncMock()) as anthropic,
+        ):
+            await warmup._open_http_pools()
+
+        whatsapp.assert_awaited_once()
+        anthropic.assert_awaited_once()
+
+
+class TestColdStart:
+    def test_importing_app_skips_first_use_dependencies(self):
+        probe = (
+            "import sys, src.main; "
+            f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", probe], capture_output=True, text=True, check=True
+        )
+
+        assert result.stdout.strip() == ""
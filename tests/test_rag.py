@@ -1,10 +1,85 @@
+import asyncio
+import tarfile
 import tempfile
+import threading
+from pathlib import Path
+from unittest.mock import patch
 
 import pytest
+from chromadb.api.types import EmbeddingFunction
+from docx import Document as DocxDocument
 
-from src.rag import Document, get_context
-from src.rag.loader import _chunk_text, load_documents
-from src.rag.store import add_documents, clear_store, initialize_store, search
+from src.config import settings
+from src.rag import Document, aget_context, get_context, get_retrieval_batcher, store
+from src.rag.batching import RetrievalBatcher
+from src.rag.ingest import sync_directory
+from src.rag.loader import _chunk_text, iter_chunks, iter_load_files, load_documents
+from src.rag.snapshot import has_index, restore_snapshot, save_snapshot
+from src.rag.store import (
+    add_documents,
+    clear_store,
+    initialize_store,
+    search,
+    search_cache_stats,
+    search_many,
+)
+
+
+@pytest.fixture(autouse=True)
+def in_memory_store(monkeypatch):
+    monkeypatch.setattr(settings, "chroma_path", "")
+
+
+class CountingEmbeddings(EmbeddingFunction):
+    """Offline letter-frequency embeddings that record every text they embed."""
+
+    def __init__(self):
+        self.embedded: list[str] = []
+        self.calls = 0
+
+    def __call__(self, input):
+        self.embedded.extend(input)
+        self.calls += 1
+        return [
+            [text.lower().count(letter) + 0.01 for letter in "abcdefghijklmnopqrstuvwxyz"]
+            for text in input
+        ]
+
+    @staticmethod
+    def name() -> str:
+        return "counting"
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    """An empty collection that embeds with `CountingEmbeddings`, cleared afterwards."""
+    embeddings = CountingEmbeddings()
+    monkeypatch.setattr(store, "get_embedding_function", lambda: embeddings)
+    initialize_store()
+    clear_store()
+    initialize_store()
+    yield embeddings
+    clear_store()
+
+
+@pytest.fixture
+def indexed(embeddings):
+    """Two indexed chunks, with the embedding counters reset."""
+    add_documents(
+        [
+            Document(content="Expense reports are due monthly", metadata={"source": "a"}),
+            Document(content="Vacation requests need approval", metadata={"source": "b"}),
+        ]
+    )
+    embeddings.embedded.clear()
+    embeddings.calls = 0
+
+
+def write_docx(path: Path, paragraphs: list[str]) -> None:
+    doc = DocxDocument()
+    for paragraph in paragraphs:
+        doc.add_paragraph(paragraph)
+    doc.save(str(path))
 
 
 class TestChunking:
@@ -28,6 +103,22 @@ class TestChunking:
         result = _chunk_text(text, chunk_size=500, overlap=100)
         assert len(result) == 2
 
+    @pytest.mark.parametrize("piece_size", [1, 7, 49, 450, 500, 501, 2000])
+    def test_streamed_pieces_chunk_like_the_whole_text(self, piece_size):
+        text = "".join(f"line {i}: {'word ' * (i % 13)}\n" for i in range(300))
+        pieces = [text[i : i + piece_size] for i in range(0, len(text), piece_size)]
+
+        assert list(iter_chunks(pieces)) == _chunk_text(text)
+        assert list(iter_chunks(pieces, chunk_size=64, overlap=16)) == _chunk_text(
+            text, chunk_size=64, overlap=16
+        )
+
+    def test_streamed_windows_at_the_end(self):
+        # A text of exactly one window still yields the overlap tail, as before.
+        text = "x" * 450 + "y" * 50
+
+        assert list(iter_chunks([text[:300], text[300:]])) == ["x" * 450 + "y" * 50, "y" * 50]
+
 
 class TestLoadDocuments:
     def test_load_documents_empty_dir(self):
@@ -39,6 +130,36 @@ class TestLoadDocuments:
         result = load_documents("/nonexistent/path")
         assert result == []
 
+    def test_parallel_load_keeps_order_and_isolates_failures(self, tmp_path):
+        paths = []
+        for name in ["c.docx", "a.docx", "broken.docx", "b.docx"]:
+            path = tmp_path / name
+            if name == "broken.docx":
+                path.write_bytes(b"not a zip file")
+            else:
+                write_docx(path, [f"Contents of {name}"])
+            paths.append(path)
+
+        results = list(iter_load_files(paths, workers=2))
+
+        assert [r.path for r in results] == paths
+        assert results[2].error is not None
+        assert results[2].documents == []
+        assert [r.documents[0].content for r in results if not r.error] == [
+            "Contents of c.docx",
+            "Contents of a.docx",
+            "Contents of b.docx",
+        ]
+        assert all(r.seconds >= 0 for r in results)
+
+    def test_load_documents_skips_unparseable_files(self, tmp_path):
+        write_docx(tmp_path / "good.docx", ["Good"])
+        (tmp_path / "bad.pdf").write_bytes(b"not a pdf")
+
+        result = load_documents(str(tmp_path), workers=2)
+
+        assert [doc.metadata["source"] for doc in result] == ["good.docx"]
+
 
 class TestVectorStore:
     @pytest.fixture(autouse=True)
@@ -106,3 +227,318 @@ class TestGetContext:
         initialize_store()
         context = get_context("any query")
         assert context == ""
+
+    def test_get_context_keeps_relevance_order(self):
+        with patch("src.rag.search", return_value=["most relevant", "also relevant"]):
+            context = get_context("query")
+
+        assert context == "most relevant\n\n---\n\nalso relevant"
+
+
+class TestIncrementalIngest:
+    def _ids(self) -> set[str]:
+        return set(initialize_store().get()["ids"])
+
+    def test_first_sync_indexes_every_file(self, embeddings, tmp_path):
+        write_docx(tmp_path / "a.docx", ["Alpha handbook"])
+        write_docx(tmp_path / "b.docx", ["Beta handbook"])
+        (tmp_path / "notes.txt").write_text("ignored")
+
+        report = sync_directory(str(tmp_path))
+
+        assert report.added == ["a.docx", "b.docx"]
+        assert report.chunks_embedded == 2
+        assert initialize_store().count() == 2
+
+    def test_unchanged_files_are_not_reembedded(self, embeddings, tmp_path):
+        write_docx(tmp_path / "a.docx", ["Alpha handbook"])
+        sync_directory(str(tmp_path))
+        ids = self._ids()
+        embeddings.embedded.clear()
+
+        report = sync_directory(str(tmp_path))
+
+        assert report.unchanged == 1
+        assert report.chunks_embedded == 0
+        assert embeddings.embedded == []
+        assert self._ids() == ids
+
+    def test_changed_file_only_embeds_new_chunks(self, embeddings, tmp_path):
+        # The first 500-char chunk is all "k" in both versions; only the second changes.
+        kept = "k" * 600
+        write_docx(tmp_path / "a.docx", [kept, "old ending"])
+        sync_directory(str(tmp_path))
+        before = self._ids()
+        embeddings.embedded.clear()
+
+        write_docx(tmp_path / "a.docx", [kept, "new ending"])
+        report = sync_directory(str(tmp_path))
+
+        assert report.updated == ["a.docx"]
+        assert report.chunks_deleted == 1
+        assert len(embeddings.embedded) == 1
+        assert "new ending" in embeddings.embedded[0]
+        after = self._ids()
+        assert len(before & after) == 1
+        assert len(after) == 2
+
+    def test_file_with_mixed_hashes_is_resynced(self, embeddings, tmp_path):
+        write_docx(tmp_path / "a.docx", ["k" * 600, "ending"])
+        sync_directory(str(tmp_path))
+        # An interrupted sync leaves some chunks stamped with another version's hash.
+        collection = initialize_store()
+        last_id = collection.get()["ids"][-1]
+        collection.update(ids=[last_id], metadatas=[{"source": "a.docx", "file_hash": "old"}])
+
+        report = sync_directory(str(tmp_path))
+
+        assert report.updated == ["a.docx"]
+        assert len({m["file_hash"] for m in collection.get()["metadatas"]}) == 1
+
+    def test_removed_file_chunks_are_deleted(self, embeddings, tmp_path):
+        write_docx(tmp_path / "a.docx", ["Alpha handbook"])
+        write_docx(tmp_path / "b.docx", ["Beta handbook"])
+        sync_directory(str(tmp_path))
+
+        (tmp_path / "b.docx").unlink()
+        report = sync_directory(str(tmp_path))
+
+        assert report.removed == ["b.docx"]
+        sources = {m["source"] for m in initialize_store().get()["metadatas"]}
+        assert sources == {"a.docx"}
+
+    def test_adding_the_same_documents_twice_does_not_duplicate(self, embeddings):
+        docs = [Document(content="Expense policy", metadata={"source": "policy.pdf"})]
+
+        add_documents(docs)
+        add_documents(docs)
+
+        assert initialize_store().count() == 1
+
+    def test_failed_file_keeps_its_indexed_chunks(self, embeddings, tmp_path):
+        write_docx(tmp_path / "a.docx", ["Alpha handbook"])
+        write_docx(tmp_path / "b.docx", ["Beta handbook"])
+        sync_directory(str(tmp_path))
+        ids = self._ids()
+
+        (tmp_path / "b.docx").write_bytes(b"corrupted")
+        report = sync_directory(str(tmp_path), workers=2)
+
+        assert list(report.failed) == ["b.docx"]
+        assert "b.docx" in report.timings
+        assert report.removed == []
+        assert self._ids() == ids
+
+    def test_missing_directory_raises(self, embeddings):
+        with pytest.raises(FileNotFoundError):
+            sync_directory("/nonexistent/path")
+
+
+class TestPersistentStore:
+    @pytest.fixture
+    def open_store(self, embeddings, monkeypatch):
+        def open_store(path, read_only=False):
+            # A fresh process: nothing cached, the index is opened from `path`.
+            monkeypatch.setattr(settings, "chroma_path", str(path))
+            monkeypatch.setattr(settings, "chroma_read_only", read_only)
+            monkeypatch.setattr(store, "_client", None)
+            monkeypatch.setattr(store, "_collection", None)
+            return initialize_store()
+
+        yield open_store
+        monkeypatch.setattr(settings, "chroma_read_only", False)
+
+    def _index(self):
+        add_documents(
+            [
+                Document(content="Expense policy", metadata={"source": "policy.pdf"}),
+                Document(content="Travel policy", metadata={"source": "policy.pdf"}),
+            ]
+        )
+
+    def test_index_survives_reopening(self, open_store, tmp_path):
+        open_store(tmp_path / "index")
+        self._index()
+
+        collection = open_store(tmp_path / "index")
+
+        assert collection.count() == 2
+        assert has_index(str(tmp_path / "index"))
+
+    def test_read_only_store_refuses_writes(self, open_store, tmp_path):
+        open_store(tmp_path / "index")
+        self._index()
+
+        collection = open_store(tmp_path / "index", read_only=True)
+
+        assert collection.count() == 2
+        with pytest.raises(RuntimeError, match="read-only"):
+            add_documents([Document(content="New", metadata={"source": "new.pdf"})])
+        with pytest.raises(RuntimeError, match="read-only"):
+            clear_store()
+
+    def test_read_only_store_never_creates_an_index(self, open_store, tmp_path):
+        with pytest.raises(RuntimeError, match="No vector index"):
+            open_store(tmp_path / "missing", read_only=True)
+
+        assert not (tmp_path / "missing").exists()
+
+    def test_snapshot_restores_into_a_new_location(self, open_store, tmp_path):
+        open_store(tmp_path / "index")
+        self._index()
+        snapshot = str(tmp_path / "index.tar.gz")
+
+        save_snapshot(snapshot, str(tmp_path / "index"))
+        assert restore_snapshot(snapshot, str(tmp_path / "restored"))
+        assert not restore_snapshot(snapshot, str(tmp_path / "restored"), if_missing=True)
+
+        collection = open_store(tmp_path / "restored")
+        assert sorted(collection.get()["documents"]) == ["Expense policy", "Travel policy"]
+
+    def test_restore_rejects_other_archives(self, tmp_path):
+        (tmp_path / "notes.txt").write_text("hello")
+        snapshot = str(tmp_path / "other.tar.gz")
+        with tarfile.open(snapshot, "w:gz") as tar:
+            tar.add(tmp_path / "notes.txt", arcname="notes.txt")
+
+        with pytest.raises(ValueError):
+            restore_snapshot(snapshot, str(tmp_path / "index"))
+        assert not (tmp_path / "index").exists()
+
+
+@pytest.mark.usefixtures("indexed")
+class TestSearchCache:
+    def test_repeated_query_is_served_from_cache(self, embeddings):
+        first = search("Expense reports", k=1)
+        hits = search_cache_stats()["hits"]
+
+        second = search("  expense   REPORTS ", k=1)
+
+        assert second == first
+        assert embeddings.embedded == ["Expense reports"]
+        assert search_cache_stats()["hits"] == hits + 1
+
+    def test_writes_invalidate_cached_results(self, embeddings):
+        assert len(search("holiday schedule", k=5)) == 2
+
+        add_documents([Document(content="Holiday schedule for 2026", metadata={"source": "c"})])
+        results = search("holiday schedule", k=5)
+
+        assert len(results) == 3
+        assert "Holiday schedule for 2026" in results
+
+        clear_store()
+        assert search("holiday schedule", k=5) == []
+
+    def test_count_is_checked_once_per_generation(self, embeddings):
+        collection = initialize_store()
+        with patch.object(collection, "count", wraps=collection.count) as count:
+            search("expense")
+            search("vacation")
+            search("approval")
+
+        assert count.call_count == 1
+
+    def test_search_that_opens_the_store_is_cached(self, embeddings):
+        clear_store()  # The next search reopens the collection.
+        search("holiday schedule")
+        hits = search_cache_stats()["hits"]
+
+        search("holiday schedule")
+
+        assert search_cache_stats()["hits"] == hits + 1
+
+
+class TestBatchedRetrieval:
+    @pytest.mark.usefixtures("indexed")
+    def test_search_many_embeds_all_misses_at_once(self, embeddings):
+        results = search_many(["expense reports", "vacation", "EXPENSE  reports"], k=1)
+
+        assert embeddings.calls == 1
+        assert embeddings.embedded[-2:] == ["expense reports", "vacation"]
+        assert results[0] == results[2] == search("expense reports", k=1)
+
+    async def test_concurrent_callers_share_one_batch_off_the_loop(self):
+        calls = []
+
+        def fake_search_many(queries, k):
+            calls.append((list(queries), k, threading.current_thread()))
+            return [[f"chunk for {query}"] for query in queries]
+
+        batcher = RetrievalBatcher(fake_search_many, window_ms=5, max_size=10)
+        results = await asyncio.gather(*(batcher.search(q) for q in ["a", "b", "c"]))
+
+        assert results == [["chunk for a"], ["chunk for b"], ["chunk for c"]]
+        assert len(calls) == 1
+        assert calls[0][:2] == (["a", "b", "c"], 3)
+        assert calls[0][2] is not threading.main_thread()
+
+    async def test_batch_groups_by_k_and_flushes_at_max_size(self):
+        calls = []
+
+        def fake_search_many(queries, k):
+            calls.append((list(queries), k))
+            return [[query] * k for query in queries]
+
+        batcher = RetrievalBatcher(fake_search_many, window_ms=10_000, max_size=3)
+        results = await asyncio.gather(
+            batcher.search("a", k=1), batcher.search("b", k=2), batcher.search("c", k=1)
+        )
+
+        assert results == [["a"], ["b", "b"], ["c"]]
+        assert sorted(calls) == [(["a", "c"], 1), (["b"], 2)]
+
+    async def test_failures_reach_every_caller(self):
+        def failing_search_many(queries, k):
+            raise RuntimeError("index unavailable")
+
+        batcher = RetrievalBatcher(failing_search_many, window_ms=1, max_size=10)
+        results = await asyncio.gather(
+            batcher.search("a"), batcher.search("b"), return_exceptions=True
+        )
+
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def test_stop_flushes_and_drains_pending_queries(self):
+        batcher = RetrievalBatcher(lambda queries, k: [[q] for q in queries], 10_000, 10)
+        pending = asyncio.create_task(batcher.search("a"))
+        await asyncio.sleep(0)
+
+        await batcher.stop(timeout=1)
+
+        assert pending.done()
+        assert await pending == ["a"]
+
+    async def test_stop_cancels_batches_past_the_timeout(self):
+        release = threading.Event()
+
+        def slow_search_many(queries, k):
+            release.wait(timeout=5)
+            return [[q] for q in queries]
+
+        batcher = RetrievalBatcher(slow_search_many, window_ms=1, max_size=1)
+        pending = asyncio.create_task(batcher.search("a"))
+        await asyncio.sleep(0.01)
+
+        await batcher.stop(timeout=0.01)
+        release.set()
+
+        with pytest.raises(asyncio.CancelledError):
+            await pending
+
+    @pytest.mark.usefixtures("indexed")
+    async def test_zero_window_disables_batching(self, embeddings, monkeypatch):
+        monkeypatch.setattr(settings, "rag_batch_window_ms", 0)
+        monkeypatch.setattr("src.rag._batcher", None)
+
+        context = await aget_context("expense")
+
+        assert get_retrieval_batcher() is None
+        assert context == get_context("expense")
+
+    @pytest.mark.usefixtures("indexed")
+    async def test_aget_context_matches_get_context(self, embeddings):
+        contexts = await asyncio.gather(aget_context("expense"), aget_context("vacation"))
+
+        assert embeddings.calls == 1
+        assert contexts == [get_context("expense"), get_context("vacation")]
@@ -0,0 +1,738 @@
+import asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from src.agent import AgentResponse, Priority
+from src.agent.prompts import HOLDING_REPLY
+from src.cache import TTLCache
+from src.config import settings
+from src.db.models import (
+    ActionStatus,
+    ActionType,
+    AgentAction,
+    ApprovalQueue,
+    LabelSource,
+    Message,
+    MessageType,
+)
+from src.services import summaries
+from src.services.approval import approve_action
+from src.services.handler import handle_incoming_message
+from src.services.history import (
+    ConversationHistory,
+    HistoryEntry,
+    conversation_history,
+    format_history,
+    get_history_prompt,
+)
+from src.services.queue import IngestQueue
+from src.services.reply_cache import ReplyCache
+from src.services.tracking import get_message_history, log_message
+from src.whatsapp.models import ParsedMessage, coalesce_messages
+
+
+@pytest.fixture(autouse=True)
+def clear_conversation_history():
+    conversation_history.clear()
+    yield
+    conversation_history.clear()
+
+
+@pytest.fixture
+def sqlite_engine():
+    # One shared connection, since some services read the database from worker threads.
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with (
+        patch("src.services.tracking.engine", engine),
+        patch("src.services.approval.engine", engine),
+        patch("src.services.reply_cache.engine", engine),
+        patch("src.services.summaries.engine", engine),
+    ):
+        yield engine
+
+
+def make_message(message_id: str = "wamid.abc123", from_phone: str = "15559876543"):
+    return ParsedMessage(
+        message_id=message_id,
+        from_phone=from_phone,
+        sender_name="John Doe",
+        text="Hello, world!",
+        timestamp="1699999999",
+    )
+
+
+class TestIngestQueue:
+    def test_submit_sheds_when_full(self):
+        queue = IngestQueue(workers=1, max_size=2)
+
+        assert queue.submit(make_message("wamid.1"), group_id="123")
+        assert queue.submit(make_message("wamid.2"), group_id="123")
+        assert not queue.submit(make_message("wamid.3"), group_id="123")
+        assert queue.depth == 2
+
+    def test_submit_all_sheds_the_whole_batch(self):
+        queue = IngestQueue(workers=1, max_size=3)
+        assert queue.submit(make_message("wamid.1"), group_id="123")
+
+        batch = [(make_message(f"wamid.{i}"), "123") for i in range(2, 5)]
+        assert not queue.submit_all(batch)
+        assert queue.depth == 1
+
+        assert queue.submit_all(batch[:2])
+        assert queue.depth == 3
+
+    @pytest.mark.asyncio
+    async def test_workers_drain_queue_on_stop(self):
+        queue = IngestQueue(workers=2, max_size=10)
+        handler = AsyncMock()
+
+        with patch("src.services.queue.handle_incoming_message", handler):
+            queue.start()
+            for i in range(5):
+                queue.submit(make_message(f"wamid.{i}"), group_id="123")
+            await queue.stop(timeout=5)
+
+        assert handler.await_count == 5
+        assert queue.depth == 0
+        assert not queue.running
+
+    @pytest.mark.asyncio
+    async def test_worker_survives_handler_failure(self):
+        queue = IngestQueue(workers=1, max_size=10)
+        handler = AsyncMock(side_effect=[RuntimeError("boom"), None])
+
+        with patch("src.services.queue.handle_incoming_message", handler):
+            queue.start()
+            queue.submit(make_message("wamid.1"), group_id="123")
+            queue.submit(make_message("wamid.2"), group_id="123")
+            await asyncio.wait_for(queue.join(), timeout=5)
+            await queue.stop()
+
+        assert handler.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_same_sender_handled_in_order(self):
+        queue = IngestQueue(workers=4, max_size=50)
+        handled: list[str] = []
+
+        async def handler(parsed, group_id, group_name):
+            # Earlier messages take longer, so only sharding keeps them ordered.
+            await asyncio.sleep(0.01 * (5 - int(parsed.message_id.split(".")[1])))
+            handled.append(parsed.message_id)
+
+        with patch("src.services.queue.handle_incoming_message", handler):
+            queue.start()
+            for i in range(5):
+                queue.submit(make_message(f"wamid.{i}", from_phone="1555"), group_id="123")
+            await queue.stop(timeout=5)
+
+        assert handled == [f"wamid.{i}" for i in range(5)]
+
+    @pytest.mark.asyncio
+    async def test_different_senders_run_in_parallel(self):
+        queue = IngestQueue(workers=4, max_size=50)
+        # Two senders that land on different shards.
+        senders = list({queue.shard_for(p): p for p in "12345678"}.values())[:2]
+        assert len(senders) == 2
+        both_started = asyncio.Event()
+        in_flight = 0
+
+        async def handler(parsed, group_id, group_name):
+            nonlocal in_flight
+            in_flight += 1
+            if in_flight == 2:
+                both_started.set()
+            await asyncio.wait_for(both_started.wait(), timeout=1)
+
+        with patch("src.services.queue.handle_incoming_message", handler):
+            queue.start()
+            for i, phone in enumerate(senders):
+                queue.submit(make_message(f"wamid.{i}", from_phone=phone), group_id="123")
+            await queue.stop(timeout=5)
+
+        assert both_started.is_set()
+
+    @pytest.mark.asyncio
+    async def test_coalesces_burst_from_one_sender(self):
+        queue = IngestQueue(workers=2, max_size=50, coalesce_window=0.05)
+        handler = AsyncMock()
+
+        with patch("src.services.queue.handle_incoming_message", handler):
+            queue.start()
+            for i, text in enumerate(["hi", "the app is down", "since this morning"]):
+                message = make_message(f"wamid.{i}", from_phone="1555")
+                queue.submit(message.model_copy(update={"text": text}), group_id="123")
+            queue.submit(make_message("wamid.other", from_phone="1666"), group_id="123")
+            await asyncio.sleep(0.1)
+            await queue.stop(timeout=5)
+
+        assert handler.await_count == 2
+        burst = next(
+            c.kwargs["parsed"] for c in handler.await_args_list if c.kwargs["parsed"].parts
+        )
+        assert burst.text == "hi\nthe app is down\nsince this morning"
+        assert burst.message_ids == ["wamid.0", "wamid.1", "wamid.2"]
+
+    @pytest.mark.asyncio
+    async def test_stop_flushes_pending_bursts(self):
+        queue = IngestQueue(workers=1, max_size=50, coalesce_window=60)
+        handler = AsyncMock()
+
+        with patch("src.services.queue.handle_incoming_message", handler):
+            queue.start()
+            queue.submit(make_message("wamid.1"), group_id="123")
+            queue.submit(make_message("wamid.2"), group_id="123")
+            assert queue.depth == 2
+            await queue.stop(timeout=5)
+
+        assert handler.await_count == 1
+
+
+class TestTTLCache:
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert "a" in cache
+        assert "b" not in cache
+        assert cache.stats.evictions == 1
+
+    def test_entries_expire(self):
+        now = [1000.0]
+        cache = TTLCache(maxsize=10, ttl=5, clock=lambda: now[0])
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+
+        now[0] += 6
+        assert cache.get("a") is None
+        assert cache.stats.hits == 1
+        assert cache.stats.misses == 1
+
+    def test_add_reports_membership(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        assert cache.add("wamid.1")
+        assert not cache.add("wamid.1")
+
+
+class TestDedupe:
+    @pytest.mark.asyncio
+    async def test_log_message_rejects_duplicate_wa_message_id(self, sqlite_engine):
+        first = await log_message(
+            wa_message_id="wamid.dup", group_id="123", sender_phone="1", content="hi"
+        )
+        second = await log_message(
+            wa_message_id="wamid.dup", group_id="123", sender_phone="1", content="hi"
+        )
+
+        assert first is not None
+        assert second is None
+
+    @pytest.mark.asyncio
+    async def test_redelivery_skips_llm_work(self, sqlite_engine):
+        classify = AsyncMock(return_value=(MessageType.CASUAL, LabelSource.LLM))
+        parsed = make_message("wamid.redelivered")
+
+        with (
+            patch("src.services.handler.classify_with_source", classify),
+            patch("src.services.handler._forward_to_personal", AsyncMock()),
+        ):
+            await handle_incoming_message(parsed, group_id="123")
+            await handle_incoming_message(parsed, group_id="123")
+
+        assert classify.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_coalesced_burst_links_all_message_ids(self, sqlite_engine):
+        burst = coalesce_messages(
+            [make_message("wamid.a"), make_message("wamid.b"), make_message("wamid.c")]
+        )
+        approval = AsyncMock()
+        agent_response = AgentResponse(message="Sorry about that", actions=[])
+
+        with (
+            patch(
+                "src.services.handler.classify_with_source",
+                AsyncMock(return_value=(MessageType.COMPLAINT, LabelSource.LLM)),
+            ),
+            patch("src.services.handler.aget_context", AsyncMock(return_value="")),
+            patch("src.services.handler.process_message", AsyncMock(return_value=agent_response)),
+            patch("src.services.handler.create_approval_request", approval),
+        ):
+            await handle_incoming_message(burst, group_id="123")
+
+        assert approval.await_args.kwargs["wa_message_ids"] == ["wamid.a", "wamid.b", "wamid.c"]
+        with Session(sqlite_engine) as session:
+            rows = session.exec(select(Message)).all()
+        assert {row.wa_message_id for row in rows} == {"wamid.a", "wamid.b", "wamid.c"}
+        assert all(row.message_type == MessageType.COMPLAINT for row in rows)
+        assert all(row.label_source == LabelSource.LLM.value for row in rows)
+
+
+class TestAgentModes:
+    @pytest.mark.asyncio
+    async def test_combined_mode_makes_one_llm_call(self, sqlite_engine):
+        triaged = AgentResponse(message="We're on it.", actions=[], message_type=MessageType.ERROR)
+        classify = AsyncMock()
+        process = AsyncMock()
+        approval = AsyncMock()
+
+        with (
+            patch.object(settings, "agent_mode", "combined"),
+            patch("src.services.handler.triage_message", AsyncMock(return_value=triaged)),
+            patch("src.services.handler.classify_with_source", classify),
+            patch("src.services.handler.process_message", process),
+            patch("src.services.handler.aget_context", AsyncMock(return_value="")),
+            patch("src.services.handler.create_approval_request", approval),
+        ):
+            await handle_incoming_message(make_message("wamid.combined"), group_id="123")
+
+        classify.assert_not_called()
+        process.assert_not_called()
+        assert approval.await_args.kwargs["draft_reply"] == "We're on it."
+
+    @pytest.mark.asyncio
+    async def test_combined_mode_casual_skips_llm(self, sqlite_engine):
+        triage = AsyncMock()
+        forward = AsyncMock()
+
+        with (
+            patch.object(settings, "agent_mode", "combined"),
+            patch("src.services.handler.triage_message", triage),
+            patch("src.services.handler._forward_to_personal", forward),
+        ):
+            message = make_message("wamid.thanks").model_copy(update={"text": "thanks!"})
+            await handle_incoming_message(message, group_id="123")
+
+        triage.assert_not_called()
+        forward.assert_awaited_once()
+        with Session(sqlite_engine) as session:
+            row = session.exec(select(Message)).one()
+        assert row.label_source == LabelSource.RULE.value
+
+    @pytest.mark.asyncio
+    async def test_speculative_draft_overlaps_classification(self, sqlite_engine):
+        classified = asyncio.Event()
+        drafting = asyncio.Event()
+
+        async def classify(text):
+            # The draft must already be running before classification returns.
+            await asyncio.wait_for(drafting.wait(), timeout=1)
+            classified.set()
+            return MessageType.COMPLAINT, LabelSource.LLM
+
+        async def process(text, context=None, **kwargs):
+            drafting.set()
+            return AgentResponse(message="Looking into it.", actions=[])
+
+        approval = AsyncMock()
+        with (
+            patch.object(settings, "speculative_execution", "draft"),
+            patch("src.services.handler.classify_with_source", classify),
+            patch("src.services.handler.process_message", process),
+            patch("src.services.handler.aget_context", AsyncMock(return_value="ctx")),
+            patch("src.services.handler.create_approval_request", approval),
+        ):
+            await handle_incoming_message(make_message("wamid.spec"), group_id="123")
+
+        assert classified.is_set()
+        assert approval.await_args.kwargs["draft_reply"] == "Looking into it."
+
+    @pytest.mark.asyncio
+    async def test_speculation_cancelled_for_casual(self, sqlite_engine):
+        cancelled = asyncio.Event()
+
+        async def process(text, context=None, **kwargs):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def classify(text):
+            await asyncio.sleep(0.01)
+            return MessageType.CASUAL, LabelSource.LLM
+
+        with (
+            patch.object(settings, "speculative_execution", "draft"),
+            patch("src.services.handler.classify_with_source", classify),
+            patch("src.services.handler.process_message", process),
+            patch("src.services.handler.aget_context", AsyncMock(return_value="ctx")),
+            patch("src.services.handler._forward_to_personal", AsyncMock()),
+        ):
+            await handle_incoming_message(make_message("wamid.casual"), group_id="123")
+
+        assert cancelled.is_set()
+
+    @pytest.mark.asyncio
+    async def test_speculative_draft_redrafted_for_unknown(self, sqlite_engine):
+        calls = []
+
+        async def process(text, context=None, **kwargs):
+            calls.append(kwargs)
+            return AgentResponse(message="Drafted.", actions=[])
+
+        with (
+            patch.object(settings, "speculative_execution", "draft"),
+            patch(
+                "src.services.handler.classify_with_source",
+                AsyncMock(return_value=(MessageType.UNKNOWN, None)),
+            ),
+            patch("src.services.handler.process_message", process),
+            patch("src.services.handler.aget_context", AsyncMock(return_value="ctx")),
+        ):
+            await handle_incoming_message(make_message("wamid.unsure"), group_id="123")
+
+        assert calls[-1]["low_confidence"] is True
+        assert calls[-1]["priority"] == Priority.LOW
+
+    @pytest.mark.asyncio
+    async def test_classify_timeout_falls_back_to_unknown(self, sqlite_engine):
+        process = AsyncMock(return_value=AgentResponse(message="Checking.", actions=[]))
+        with (
+            patch("src.agent.classifier.classify_locally", return_value=None),
+            patch("src.agent.classifier.guess_locally", return_value=None),
+            patch("src.agent.classifier.get_batcher", return_value=None),
+            patch("src.agent.classifier._classify_with_llm", AsyncMock(side_effect=TimeoutError)),
+            patch("src.services.handler.process_message", process),
+            patch("src.services.handler.aget_context", AsyncMock(return_value="")),
+        ):
+            await handle_incoming_message(make_message("wamid.slowclass"), group_id="123")
+
+        with Session(sqlite_engine) as session:
+            row = session.exec(select(Message)).one()
+        assert row.message_type == MessageType.UNKNOWN
+        assert row.label_source is None
+        assert process.await_args.kwargs["low_confidence"] is True
+
+    @pytest.mark.asyncio
+    async def test_draft_timeout_sends_holding_reply(self, sqlite_engine):
+        approval = AsyncMock()
+        with (
+            patch(
+                "src.services.handler.classify_with_source",
+                AsyncMock(return_value=(MessageType.COMPLAINT, LabelSource.LLM)),
+            ),
+            patch("src.services.handler.process_message", AsyncMock(side_effect=TimeoutError)),
+            patch("src.services.handler.aget_context", AsyncMock(return_value="")),
+            patch("src.services.handler.create_approval_request", approval),
+        ):
+            await handle_incoming_message(make_message("wamid.slowdraft"), group_id="123")
+
+        assert approval.await_args.kwargs["draft_reply"] == HOLDING_REPLY
+
+
+def bag_of_words(texts: list[str]) -> list[list[float]]:
+    vectors = []
+    for text in texts:
+        vector = [0.0] * 64
+        for word in text.lower().split():
+            vector[sum(map(ord, word.strip(".,!?"))) % 64] += 1
+        vectors.append(vector)
+    return vectors
+
+
+class TestReplyCache:
+    @pytest.fixture
+    def reply_cache(self):
+        cache = ReplyCache(threshold=0.8, maxsize=10, ttl=3600, embed=bag_of_words)
+        with patch("src.services.reply_cache.get_reply_cache", return_value=cache):
+            yield cache
+
+    def store_approved_draft(self, engine, content: str, draft: str) -> AgentAction:
+        with Session(engine) as session:
+            message = Message(
+                wa_message_id=f"wamid.{content}", group_id="123", sender_phone="1", content=content
+            )
+            action = AgentAction(
+                message_id=message.id,
+                action_type=ActionType.DRAFT_REPLY,
+                action_data={"draft": draft},
+                status=ActionStatus.APPROVED,
+            )
+            session.add(message)
+            session.add(action)
+            session.commit()
+            session.refresh(action)
+            return action
+
+    @pytest.mark.asyncio
+    async def test_lookup_matches_near_duplicates_only(self, reply_cache):
+        await reply_cache.add("a1", "the app is down again", "We're fixing the outage.")
+
+        hit = await reply_cache.lookup("The app is down again!")
+        miss = await reply_cache.lookup("my invoice total looks wrong")
+
+        assert hit.draft == "We're fixing the outage."
+        assert hit.action_id == "a1"
+        assert miss is None
+        assert reply_cache.stats.hit_rate == 0.5
+
+    @pytest.mark.asyncio
+    async def test_warms_from_approved_actions(self, sqlite_engine, reply_cache):
+        action = self.store_approved_draft(sqlite_engine, "login page is broken", "Fix is live.")
+
+        cached = await reply_cache.lookup("login page is broken")
+
+        assert cached.action_id == str(action.id)
+        assert len(reply_cache) == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_warm_is_retried(self, reply_cache):
+        load = Mock(side_effect=[RuntimeError("database unavailable"), []])
+
+        with patch("src.services.reply_cache._load_approved_drafts", load):
+            with pytest.raises(RuntimeError):
+                await reply_cache.lookup("the app is down")
+            assert await reply_cache.lookup("the app is down") is None
+            await reply_cache.lookup("the app is down")
+
+        assert load.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_approving_a_draft_adds_it(self, sqlite_engine, reply_cache):
+        action = self.store_approved_draft(sqlite_engine, "checkout keeps failing", "On it.")
+        with Session(sqlite_engine) as session:
+            pending = session.get(AgentAction, action.id)
+            pending.status = ActionStatus.PENDING_APPROVAL
+            approval = ApprovalQueue(action_id=action.id, draft_message="On it.", target_group="1")
+            session.add(pending)
+            session.add(approval)
+            session.commit()
+            session.refresh(approval)
+        await reply_cache.warm()
+        assert len(reply_cache) == 0
+
+        await approve_action(approval.id)
+
+        assert (await reply_cache.lookup("checkout keeps failing")).draft == "On it."
+
+    @pytest.mark.asyncio
+    async def test_handler_reuses_cached_draft(self, sqlite_engine, reply_cache):
+        await reply_cache.add("a1", "hello, world!", "Thanks, we're on it.")
+        process = AsyncMock()
+        approval = AsyncMock()
+
+        with (
+            patch(
+                "src.services.handler.classify_with_source",
+                AsyncMock(return_value=(MessageType.COMPLAINT, LabelSource.LLM)),
+            ),
+            patch("src.services.handler.aget_context", AsyncMock(return_value="")),
+            patch("src.services.handler.process_message", process),
+            patch("src.services.handler.create_approval_request", approval),
+        ):
+            await handle_incoming_message(make_message("wamid.reuse"), group_id="123")
+
+        process.assert_not_called()
+        assert approval.await_args.kwargs["draft_reply"] == "Thanks, we're on it."
+        assert approval.await_args.kwargs["reused_from"] == "a1"
+
+
+def make_entry(wa_message_id: str, content: str) -> HistoryEntry:
+    return HistoryEntry(
+        wa_message_id=wa_message_id,
+        sender_name="John Doe",
+        content=content,
+        created_at=datetime(2024, 1, 1, 9, 30),
+    )
+
+
+class TestConversationHistory:
+    def test_ring_buffer_keeps_last_n_and_tracks_size(self):
+        history = ConversationHistory(per_conversation=2, max_chars=1000)
+        history._store(("g", "1"), [])
+
+        for i in range(4):
+            history.record("g", "1", make_entry(f"m{i}", "x" * (i + 1)))
+
+        assert [e.wa_message_id for e in history._buffers[("g", "1")]] == ["m2", "m3"]
+        assert history.chars == 3 + 4
+
+    def test_record_ignores_unbuffered_conversations(self):
+        history = ConversationHistory(per_conversation=5, max_chars=1000)
+
+        history.record("g", "1", make_entry("m1", "hello"))
+
+        assert ("g", "1") not in history
+        assert history.chars == 0
+
+    def test_evicts_least_recent_conversation_over_budget(self):
+        history = ConversationHistory(per_conversation=5, max_chars=10)
+        history._store(("g", "1"), [make_entry("a", "x" * 6)])
+        history._store(("g", "2"), [make_entry("b", "x" * 3)])
+
+        history.record("g", "2", make_entry("c", "x" * 3))
+
+        assert ("g", "1") not in history
+        assert ("g", "2") in history
+        assert history.chars == 6
+
+    @pytest.mark.asyncio
+    async def test_warms_from_db_then_stays_current(self, sqlite_engine):
+        await log_message(wa_message_id="m1", group_id="g", sender_phone="1", content="first")
+        await log_message(wa_message_id="x1", group_id="g", sender_phone="2", content="other")
+
+        with patch("src.services.tracking.get_message_history", wraps=get_message_history) as db:
+            assert [e.content for e in await conversation_history.get("g", "1")] == ["first"]
+            await log_message(wa_message_id="m2", group_id="g", sender_phone="1", content="second")
+            entries = await conversation_history.get("g", "1")
+
+        assert [e.content for e in entries] == ["first", "second"]
+        assert db.await_count == 1
+
+    def test_format_history_excludes_current_message_and_respects_budget(self):
+        entries = [make_entry("m1", "a" * 200), make_entry("m2", "recent"), make_entry("m3", "now")]
+
+        rendered = format_history(entries, token_budget=10, exclude={"m3"})
+
+        assert rendered == "[2024-01-01 09:30] John Doe: recent"
+
+
+class TestConversationSummaries:
+    @pytest.fixture(autouse=True)
+    def summary_settings(self):
+        summaries._summaries.clear()
+        summaries._cooldown.clear()
+        with (
+            patch.object(settings, "summary_threshold", 4),
+            patch.object(settings, "summary_keep_recent", 2),
+        ):
+            yield
+        summaries._summaries.clear()
+        summaries._cooldown.clear()
+
+    async def log_thread(self, count: int, start: int = 0):
+        for i in range(start, start + count):
+            await log_message(
+                wa_message_id=f"m{i}", group_id="g", sender_phone="1", content=f"message {i}"
+            )
+
+    @pytest.mark.asyncio
+    async def test_folds_all_but_recent_messages(self, sqlite_engine):
+        await self.log_thread(5)
+        summarize = AsyncMock(return_value="Customer reported messages 0-2.")
+
+        with patch("src.services.summaries.summarize_conversation", summarize):
+            row = await summaries.update_summary("g", "1")
+
+        assert row.summary == "Customer reported messages 0-2."
+        assert row.message_count == 3
+        previous, transcript = summarize.await_args.args
+        assert previous is None
+        assert transcript.splitlines()[-1].endswith("message 2")
+
+    @pytest.mark.asyncio
+    async def test_updates_incrementally(self, sqlite_engine):
+        await self.log_thread(5)
+        summarize = AsyncMock(side_effect=["first summary", "second summary"])
+
+        with patch("src.services.summaries.summarize_conversation", summarize):
+            await summaries.update_summary("g", "1")
+            skipped = await summaries.update_summary("g", "1")
+            await self.log_thread(3, start=5)
+            row = await summaries.update_summary("g", "1")
+
+        assert skipped.summary == "first summary"
+        assert summarize.await_count == 2
+        previous, transcript = summarize.await_args.args
+        assert previous == "first summary"
+        assert "message 2" not in transcript
+        assert transcript.splitlines()[-1].endswith("message 5")
+        assert row.message_count == 6
+
+    @pytest.mark.asyncio
+    async def test_long_backlog_is_folded_in_bounded_batches(self, sqlite_engine):
+        await self.log_thread(12)
+        summarize = AsyncMock(side_effect=["first", "second", "third"])
+
+        with (
+            patch.object(settings, "summary_batch_size", 4),
+            patch("src.services.summaries.summarize_conversation", summarize),
+        ):
+            row = await summaries.update_summary("g", "1")
+
+        transcripts = [call.args[1].splitlines() for call in summarize.await_args_list]
+        assert [len(lines) for lines in transcripts] == [4, 4, 2]
+        assert transcripts[0][0].endswith("message 0")
+        assert [call.args[0] for call in summarize.await_args_list] == [None, "first", "second"]
+        assert row.summary == "third"
+        assert row.message_count == 10
+
+    @pytest.mark.asyncio
+    async def test_failed_update_cools_down(self, sqlite_engine):
+        await self.log_thread(5)
+        summarize = AsyncMock(side_effect=RuntimeError("overloaded"))
+
+        with patch("src.services.summaries.summarize_conversation", summarize):
+            assert await summaries.schedule_summary("g", "1") is None
+            retry = summaries.schedule_summary("g", "1")
+
+        assert summarize.await_count == 1
+        assert retry is None
+
+    @pytest.mark.asyncio
+    async def test_stop_summaries_cancels_slow_updates(self, sqlite_engine):
+        await self.log_thread(5)
+        started = asyncio.Event()
+
+        async def summarize(previous, transcript):
+            started.set()
+            await asyncio.sleep(10)
+
+        with patch("src.services.summaries.summarize_conversation", summarize):
+            task = summaries.schedule_summary("g", "1")
+            await started.wait()
+            await summaries.stop_summaries(timeout=0.01)
+
+        assert task.cancelled()
+        assert summaries._inflight == {}
+
+    @pytest.mark.asyncio
+    async def test_history_prompt_uses_summary_and_recent_messages(self, sqlite_engine):
+        await self.log_thread(5)
+        with patch(
+            "src.services.summaries.summarize_conversation", AsyncMock(return_value="Earlier.")
+        ):
+            await summaries.update_summary("g", "1")
+
+        prompt = await get_history_prompt("g", "1", exclude=["m4"])
+
+        assert prompt.startswith("Summary of earlier messages: Earlier.")
+        assert "message 3" in prompt
+        assert "message 2" not in prompt
+        assert "message 4" not in prompt
+
+    @pytest.mark.asyncio
+    async def test_history_prompt_schedules_summary_past_threshold(self, sqlite_engine):
+        await self.log_thread(4)
+
+        with patch("src.services.history.schedule_summary") as schedule:
+            await get_history_prompt("g", "1", exclude=[])
+
+        schedule.assert_called_once_with("g", "1")
+
+    @pytest.mark.asyncio
+    async def test_casual_message_never_schedules_summary(self, sqlite_engine):
+        await self.log_thread(4)
+
+        with (
+            patch("src.services.history.schedule_summary") as schedule,
+            patch(
+                "src.services.handler.classify_with_source",
+                AsyncMock(return_value=(MessageType.CASUAL, LabelSource.LLM)),
+            ),
+            patch("src.services.handler._forward_to_personal", AsyncMock()),
+        ):
+            await handle_incoming_message(make_message("wamid.casual", from_phone="1"), "g")
+
+        schedule.assert_not_called()
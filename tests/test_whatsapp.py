@@ -1,3 +1,9 @@
+import hashlib
+import hmac
+import json
+from unittest.mock import patch
+
+import httpx
 import pytest
 from httpx import ASGITransport, AsyncClient
 
@@ -5,6 +11,7 @@ from src.config import settings
 from src.main import app
 from src.whatsapp.client import WhatsAppClient
 from src.whatsapp.models import ParsedMessage, WhatsAppWebhookPayload
+from src.whatsapp.signature import verify_signature
 
 
 class TestWhatsAppModels:
@@ -87,6 +94,71 @@ class TestWhatsAppClient:
         assert headers["Authorization"] == "Bearer test_token"
         assert headers["Content-Type"] == "application/json"
 
+    @pytest.mark.asyncio
+    async def test_send_message_uses_custom_transport(self):
+        requests = []
+
+        def graph_api(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return httpx.Response(200, json={"messages": [{"id": "wamid.sent"}]})
+
+        client = WhatsAppClient(
+            phone_number_id="test_phone_id",
+            access_token="test_token",
+            transport=httpx.MockTransport(graph_api),
+        )
+        result = await client.send_message("15551234567", "Hi")
+
+        assert result["messages"][0]["id"] == "wamid.sent"
+        assert requests[0].url.path.endswith("/test_phone_id/messages")
+
+    @pytest.mark.asyncio
+    async def test_open_makes_a_request(self):
+        requests = []
+
+        def graph_api(request):
+            requests.append(request)
+            return httpx.Response(400)
+
+        client = WhatsAppClient(
+            phone_number_id="test_phone_id",
+            access_token="test_token",
+            transport=httpx.MockTransport(graph_api),
+        )
+        await client.open()
+
+        assert [request.method for request in requests] == ["HEAD"]
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_sends_share_one_pooled_client(self):
+        client = WhatsAppClient(
+            phone_number_id="test_phone_id",
+            access_token="test_token",
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, json={})),
+        )
+        await client.open()
+        pooled = client._client
+
+        await client.send_message("15551234567", "Hi")
+        await client.mark_as_read("wamid.abc")
+
+        assert client._client is pooled
+        await client.aclose()
+        assert pooled.is_closed
+
+
+class TestSignature:
+    def test_verify_signature_valid(self):
+        body = b'{"object": "whatsapp_business_account"}'
+        digest = hmac.new(b"secret", body, hashlib.sha256).hexdigest()
+        assert verify_signature(body, f"sha256={digest}", "secret")
+
+    def test_verify_signature_invalid(self):
+        body = b'{"object": "whatsapp_business_account"}'
+        assert not verify_signature(body, "sha256=deadbeef", "secret")
+        assert not verify_signature(body, None, "secret")
+
 
 class TestWebhookEndpoints:
     @pytest.fixture
@@ -194,3 +266,110 @@ class TestWebhookEndpoints:
         assert response.status_code == 200
         assert response.json()["status"] == "ok"
         assert response.json()["messages_received"] == 0
+
+    async def test_receive_webhook_sheds_when_queue_full(self, async_client):
+        payload = {
+            "object": "whatsapp_business_account",
+            "entry": [
+                {
+                    "id": "123456789",
+                    "changes": [
+                        {
+                            "field": "messages",
+                            "value": {
+                                "messaging_product": "whatsapp",
+                                "metadata": {
+                                    "display_phone_number": "15551234567",
+                                    "phone_number_id": "123456789",
+                                },
+                                "contacts": [
+                                    {"profile": {"name": "John Doe"}, "wa_id": "15559876543"}
+                                ],
+                                "messages": [
+                                    {
+                                        "from": "15559876543",
+                                        "id": "wamid.abc123",
+                                        "timestamp": "1699999999",
+                                        "type": "text",
+                                        "text": {"body": "Hello, world!"},
+                                    }
+                                ],
+                            },
+                        }
+                    ],
+                }
+            ],
+        }
+
+        with patch("src.api.webhooks.ingest_queue.submit_all", return_value=False):
+            async with async_client as client:
+                response = await client.post("/webhook", json=payload)
+        assert response.status_code == 503
+
+    async def test_receive_webhook_status_update_skips_model_validation(self, async_client):
+        payload = {
+            "object": "whatsapp_business_account",
+            "entry": [
+                {
+                    "id": "123456789",
+                    "changes": [
+                        {
+                            "field": "messages",
+                            "value": {
+                                "messaging_product": "whatsapp",
+                                "metadata": {
+                                    "display_phone_number": "15551234567",
+                                    "phone_number_id": "123456789",
+                                },
+                                "statuses": [
+                                    {
+                                        "id": "wamid.abc123",
+                                        "status": "read",
+                                        "timestamp": "1699999999",
+                                        "recipient_id": "15559876543",
+                                    }
+                                ],
+                            },
+                        }
+                    ],
+                }
+            ],
+        }
+
+        with patch("src.api.webhooks.WhatsAppValue.model_validate") as validate:
+            async with async_client as client:
+                response = await client.post("/webhook", json=payload)
+        assert response.json()["messages_received"] == 0
+        validate.assert_not_called()
+
+    async def test_receive_webhook_invalid_json(self, async_client):
+        async with async_client as client:
+            response = await client.post("/webhook", content=b"not json")
+        assert response.status_code == 200
+        assert response.json()["status"] == "error"
+
+    async def test_receive_webhook_rejects_bad_signature(self, async_client):
+        body = json.dumps({"object": "whatsapp_business_account", "entry": []}).encode()
+
+        with patch.object(settings, "wa_app_secret", "secret"):
+            async with async_client as client:
+                response = await client.post(
+                    "/webhook",
+                    content=body,
+                    headers={"X-Hub-Signature-256": "sha256=deadbeef"},
+                )
+        assert response.status_code == 403
+
+    async def test_receive_webhook_accepts_valid_signature(self, async_client):
+        body = json.dumps({"object": "whatsapp_business_account", "entry": []}).encode()
+        digest = hmac.new(b"secret", body, hashlib.sha256).hexdigest()
+
+        with patch.object(settings, "wa_app_secret", "secret"):
+            async with async_client as client:
+                response = await client.post(
+                    "/webhook",
+                    content=body,
+                    headers={"X-Hub-Signature-256": f"sha256={digest}"},
+                )
+        assert response.status_code == 200
+        assert response.json()["status"] == "ok"